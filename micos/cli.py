@@ -8,6 +8,11 @@ from micos.taxonomic_profiling import run_taxonomic_profiling
 from micos.diversity_analysis import run_diversity_analysis
 from micos.full_run import run_full_pipeline
 from micos.functional_annotation import run_functional_annotation
+from micos.humann_tables import run_join_tables, OUTPUT_FORMATS
+from micos.humann_regroup import run_renorm_regroup, RENORM_UNITS
+from micos.kraken_profile import DEFAULT_DB_VERSION
+from micos.humann_split import run_split_tables
+from micos.humann_contributions import run_contribution_analysis
 from micos.summarize_results import run_summarize
 from micos.utils import load_config, setup_logging
 
@@ -26,7 +31,12 @@ def main(log_file, verbose):
 @click.option('--threads', type=int, help='使用的线程数 (默认: 16).')
 @click.option('--kneaddata-db', type=click.Path(exists=True, dir_okay=True), help='KneadData 参考数据库的路径.')
 @click.option('--kraken2-db', type=click.Path(exists=True, dir_okay=True), help='Kraken2 参考数据库的路径.')
-def full_run(input_dir, results_dir, threads, kneaddata_db, kraken2_db):
+@click.option('--reuse-kraken-profile', is_flag=True, help='将 Kraken2 报告转换为物种谱传给 HUMAnN，跳过其内部的 MetaPhlAn.')
+@click.option('--join-tables', is_flag=True, help='功能注释后合并各样本的 HUMAnN 结果表.')
+@click.option('--renorm-regroup', is_flag=True, help='对合并后的 HUMAnN 结果表做 CPM 标准化与重分组 (隐含 --join-tables).')
+@click.option('--contribution-analysis', is_flag=True, help='基于 Kraken2 报告做物种-功能贡献分析 (隐含 --join-tables)；无报告时跳过.')
+def full_run(input_dir, results_dir, threads, kneaddata_db, kraken2_db, reuse_kraken_profile,
+             join_tables, renorm_regroup, contribution_analysis):
     """运行完整的 MICOS 分析流程."""
     # 检查必需的数据库路径是否已提供 (通过命令行或配置文件)
     if not kneaddata_db:
@@ -37,7 +47,9 @@ def full_run(input_dir, results_dir, threads, kneaddata_db, kraken2_db):
     # 如果 threads 未提供，则使用默认值
     threads = threads or 16
     try:
-        run_full_pipeline(input_dir, results_dir, threads, kneaddata_db, kraken2_db)
+        run_full_pipeline(input_dir, results_dir, threads, kneaddata_db, kraken2_db,
+                          reuse_kraken_profile=reuse_kraken_profile, join_tables=join_tables,
+                          renorm_regroup=renorm_regroup, contribution_analysis=contribution_analysis)
     except Exception as e:
         click.secho(f"完整分析流程执行失败: {e}", fg="red")
         raise
@@ -88,14 +100,90 @@ def diversity_analysis(input_biom, output_dir):
 @click.option('--input-dir', required=True, type=click.Path(exists=True, file_okay=False), help='包含 KneadData 清理后 FASTQ 文件的输入目录.')
 @click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='存放功能注释结果的输出目录.')
 @click.option('--threads', default=16, type=int, help='使用的线程数.')
-def functional_annotation(input_dir, output_dir, threads):
+@click.option('--kraken-reports-dir', type=click.Path(exists=True, file_okay=False), help='Kraken2 报告目录；提供时将报告转换为物种谱传给 HUMAnN，跳过 MetaPhlAn.')
+@click.option('--chocophlan-dir', type=click.Path(exists=True, file_okay=False), help='ChocoPhlAn 数据库目录，用于过滤物种谱中的物种.')
+@click.option('--taxid-map', type=click.Path(exists=True, dir_okay=False), help='taxid -> ChocoPhlAn 分支名映射表.')
+@click.option('--metaphlan-db-version', default=DEFAULT_DB_VERSION, help='物种谱表头中的 MetaPhlAn 数据库版本.')
+@click.option('--no-split', is_flag=True, help='不拆分各样本的 HUMAnN 结果表.')
+@click.option('--min-abundance', default=0.0, type=float, help='拆分时去除低于该丰度的特征.')
+def functional_annotation(input_dir, output_dir, threads, kraken_reports_dir, chocophlan_dir, taxid_map,
+                          metaphlan_db_version, no_split, min_abundance):
     """运行功能注释 (HUMAnN)."""
     try:
-        run_functional_annotation(input_dir, output_dir, threads)
+        run_functional_annotation(input_dir, output_dir, threads, kraken_reports_dir=kraken_reports_dir,
+                                  chocophlan_dir=chocophlan_dir, taxid_map=taxid_map,
+                                  metaphlan_db_version=metaphlan_db_version, split_tables=not no_split,
+                                  min_abundance=min_abundance)
     except Exception as e:
         click.secho(f"功能注释模块执行失败: {e}", fg="red")
         raise
 
+@run.command('join-tables')
+@click.option('--input-dir', required=True, type=click.Path(exists=True, file_okay=False), help='包含各样本 HUMAnN 结果表的目录.')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='存放合并矩阵的输出目录.')
+@click.option('--format', 'formats', multiple=True, default=('npz',), type=click.Choice(OUTPUT_FORMATS), help='输出格式，可重复指定 (默认: npz).')
+@click.option('--no-split', is_flag=True, help='不单独写出未分层/分层矩阵.')
+@click.option('--min-abundance', default=0.0, type=float, help='合并后视为检出的最小丰度.')
+@click.option('--min-prevalence', default=0.0, type=click.FloatRange(0, 1), help='合并后保留特征所需的最小检出样本比例.')
+def join_tables(input_dir, output_dir, formats, no_split, min_abundance, min_prevalence):
+    """流式合并各样本 HUMAnN 结果表为稀疏矩阵."""
+    try:
+        run_join_tables(input_dir, output_dir, formats=formats, split=not no_split,
+                        min_abundance=min_abundance, min_prevalence=min_prevalence)
+    except Exception as e:
+        click.secho(f"HUMAnN 结果表合并失败: {e}", fg="red")
+        raise
+
+@run.command('split-tables')
+@click.option('--input-dir', required=True, type=click.Path(exists=True, file_okay=False), help='包含 HUMAnN 结果表的目录.')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='存放拆分结果的输出目录.')
+@click.option('--min-abundance', default=0.0, type=float, help='视为检出的最小丰度.')
+@click.option('--min-prevalence', default=0.0, type=click.FloatRange(0, 1), help='保留特征所需的最小检出样本比例 (仅对已合并的多样本表有意义).')
+@click.option('--compress/--no-compress', default=None, help='gzip 压缩输出 (默认与输入一致).')
+def split_tables(input_dir, output_dir, min_abundance, min_prevalence, compress):
+    """流式拆分并过滤 HUMAnN 结果表 (未分层 / 分层 / 物种贡献)."""
+    try:
+        run_split_tables(input_dir, output_dir, min_abundance=min_abundance,
+                         min_prevalence=min_prevalence, compress=compress)
+    except Exception as e:
+        click.secho(f"HUMAnN 结果表拆分失败: {e}", fg="red")
+        raise
+
+@run.command('renorm-regroup')
+@click.option('--joined-dir', required=True, type=click.Path(exists=True, file_okay=False), help='join-tables 输出的合并矩阵目录.')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='存放结果矩阵的输出目录.')
+@click.option('--units', default='cpm', type=click.Choice(sorted(RENORM_UNITS)), help='标准化单位 (默认: cpm).')
+@click.option('--mode', default='community', type=click.Choice(['community', 'levelwise']), help='分层行的标准化方式.')
+@click.option('--mapping', 'mappings', multiple=True, help='重分组映射，格式 名称=路径 (如 ko=map_ko_uniref90.txt.gz)，可重复指定.')
+@click.option('--mapping-cache', type=click.Path(file_okay=False), help='映射矩阵 .npz 缓存目录 (默认: 映射文件所在目录).')
+def renorm_regroup(joined_dir, output_dir, units, mode, mappings, mapping_cache):
+    """对合并后的 HUMAnN 矩阵重标准化并重分组."""
+    parsed = {}
+    for item in mappings:
+        name, sep, path = item.partition('=')
+        if not sep or not name or not path:
+            raise click.BadParameter(f"映射格式应为 名称=路径: {item}", param_hint='--mapping')
+        parsed[name] = path
+    try:
+        run_renorm_regroup(joined_dir, output_dir, units=units, mode=mode, mappings=parsed,
+                           cache_dir=mapping_cache)
+    except Exception as e:
+        click.secho(f"HUMAnN 重标准化/重分组失败: {e}", fg="red")
+        raise
+
+@run.command('contribution-analysis')
+@click.option('--joined-dir', required=True, type=click.Path(exists=True, file_okay=False), help='join-tables 输出的合并矩阵目录.')
+@click.option('--output-dir', required=True, type=click.Path(file_okay=False), help='存放贡献分析结果的输出目录.')
+@click.option('--kraken', 'kraken_input', type=click.Path(exists=True), help='Kraken2 丰度：feature-table.biom 或 Kraken2 报告目录.')
+@click.option('--table-type', default='pathabundance', type=click.Choice(['pathabundance', 'genefamilies']), help='分析的 HUMAnN 表类型.')
+def contribution_analysis(joined_dir, output_dir, kraken_input, table_type):
+    """构建物种 × 通路 × 样本贡献张量，计算贡献份额及其与 Kraken2 丰度的相关性."""
+    try:
+        run_contribution_analysis(joined_dir, output_dir, kraken_input=kraken_input, table_type=table_type)
+    except Exception as e:
+        click.secho(f"物种-功能贡献分析失败: {e}", fg="red")
+        raise
+
 @run.command('summarize-results')
 @click.option('--results-dir', required=True, type=click.Path(exists=True, file_okay=False), help='包含所有分析结果的根目录.')
 @click.option('--output-file', required=True, type=click.Path(dir_okay=False), help='输出的 HTML 报告文件路径.')
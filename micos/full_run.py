@@ -8,12 +8,21 @@ from micos.quality_control import run_qc
 from micos.taxonomic_profiling import run_taxonomic_profiling
 from micos.diversity_analysis import run_diversity_analysis
 from micos.functional_annotation import run_functional_annotation
+from micos.humann_tables import run_join_tables
+from micos.humann_regroup import run_renorm_regroup
+from micos.humann_contributions import run_contribution_analysis
 from micos.summarize_results import run_summarize
 
 logger = logging.getLogger(__name__)
 
-def run_full_pipeline(input_dir, results_dir, threads, kneaddata_db, kraken2_db):
-    """按顺序执行完整的分析流程."""
+def run_full_pipeline(input_dir, results_dir, threads, kneaddata_db, kraken2_db, reuse_kraken_profile=False,
+                      join_tables=False, renorm_regroup=False, contribution_analysis=False):
+    """按顺序执行完整的分析流程.
+
+    HUMAnN 结果表的后处理（合并、标准化/重分组、物种-功能贡献分析）默认不执行，
+    分别由 join_tables、renorm_regroup、contribution_analysis 开启；后两者依赖合并结果，
+    开启时会同时执行合并。
+    """
     logger.info("MICOS 完整分析流程开始...")
     
     # 定义各步骤的输出目录
@@ -69,12 +78,51 @@ def run_full_pipeline(input_dir, results_dir, threads, kneaddata_db, kraken2_db)
         run_functional_annotation(
             input_dir=str(kneaddata_output), 
             output_dir=str(Path(results_dir) / "4_functional_annotation"), 
-            threads=threads
+            threads=threads,
+            kraken_reports_dir=str(tax_output_dir) if reuse_kraken_profile else None
         )
     except Exception as e:
         logger.error(f"功能注释步骤失败: {e}", exc_info=True)
         raise
 
+    # --- 步骤 4b: 合并 HUMAnN 结果表并标准化为 CPM ---
+    functional_output_dir = Path(results_dir) / "4_functional_annotation"
+    joined_dir = functional_output_dir / "joined"
+    if join_tables or renorm_regroup or contribution_analysis:
+        try:
+            run_join_tables(
+                input_dir=str(functional_output_dir),
+                output_dir=str(joined_dir)
+            )
+        except Exception as e:
+            logger.error(f"HUMAnN 结果表合并步骤失败: {e}", exc_info=True)
+            raise
+
+    if renorm_regroup:
+        try:
+            run_renorm_regroup(
+                joined_dir=str(joined_dir),
+                output_dir=str(functional_output_dir / "normalized")
+            )
+        except Exception as e:
+            logger.error(f"HUMAnN 结果表标准化步骤失败: {e}", exc_info=True)
+            raise
+
+    # --- 步骤 4c: 物种-功能贡献分析 (Kraken2 报告提供物种丰度) ---
+    if contribution_analysis:
+        if not any(tax_output_dir.glob("*.report")):
+            logger.warning(f"警告: 在 {tax_output_dir} 中未找到 Kraken2 报告，跳过物种-功能贡献分析。")
+        else:
+            try:
+                run_contribution_analysis(
+                    joined_dir=str(joined_dir),
+                    output_dir=str(functional_output_dir / "contributions"),
+                    kraken_input=str(tax_output_dir)
+                )
+            except Exception as e:
+                logger.error(f"物种-功能贡献分析步骤失败: {e}", exc_info=True)
+                raise
+
     # --- 最终步骤: 汇总结果 ---
     try:
         summary_output_file = Path(results_dir) / "micos_summary_report.html"
@@ -8,11 +8,25 @@ import shutil
 import logging
 import subprocess
 from micos.utils import run_command
+from micos.humann_split import run_split_tables
+from micos.kraken_profile import (DEFAULT_DB_VERSION, kraken_report_to_metaphlan,
+                                  read_chocophlan_species, read_taxid_map)
 
 logger = logging.getLogger(__name__)
 
-def run_functional_annotation(input_dir, output_dir, threads):
-    """执行功能注释 (HUMAnN)."""
+def run_functional_annotation(input_dir, output_dir, threads, kraken_reports_dir=None,
+                              chocophlan_dir=None, taxid_map=None, metaphlan_db_version=DEFAULT_DB_VERSION,
+                              split_tables=True, min_abundance=0.0):
+    """执行功能注释 (HUMAnN).
+
+    split_tables 为真时，每个样本完成后立即流式拆分其结果表（未分层 / 分层 / 物种贡献），
+    去除低于 min_abundance 的特征，写入 <输出目录>/split，供 run_join_tables 合并。
+    流行率只能在队列水平判断，由 run_join_tables 在合并后过滤。
+
+    提供 kraken_reports_dir 时，将各样本的 Kraken2 报告 (<样本>.report) 转换为 MetaPhlAn 格式物种谱，
+    通过 --taxonomic-profile 传给 HUMAnN，跳过其内部的 MetaPhlAn 预筛选；缺少报告的样本仍由 HUMAnN
+    自行运行 MetaPhlAn。
+    """
     logger.info("步骤 4: 开始功能注释分析...")
 
     input_path = Path(input_dir)
@@ -21,6 +35,9 @@ def run_functional_annotation(input_dir, output_dir, threads):
     temp_input_path.mkdir(parents=True, exist_ok=True)
     output_path.mkdir(parents=True, exist_ok=True)
 
+    chocophlan_species = read_chocophlan_species(chocophlan_dir) if chocophlan_dir else None
+    taxid_mapping = read_taxid_map(taxid_map) if taxid_map else None
+
     # 1. 准备 HUMAnN 的输入文件 (合并所有 reads)
     logger.info("--> 正在准备 HUMAnN 输入文件...")
     paired_files = sorted(glob.glob(str(input_path / "*_paired_1.fastq")))
@@ -54,6 +71,15 @@ def run_functional_annotation(input_dir, output_dir, threads):
             "--threads", str(threads),
             "--output-basename", base
         ]
+        if kraken_reports_dir:
+            kraken_report = Path(kraken_reports_dir) / f"{base}.report"
+            if kraken_report.exists():
+                profile = output_path / "taxonomic_profiles" / f"{base}_metaphlan_profile.tsv"
+                kraken_report_to_metaphlan(kraken_report, profile, chocophlan_species, taxid_mapping,
+                                           db_version=metaphlan_db_version)
+                humann_cmd += ["--taxonomic-profile", str(profile)]
+            else:
+                logger.warning(f"未找到样本 {base} 的 Kraken2 报告 {kraken_report}，由 HUMAnN 运行 MetaPhlAn。")
         try:
             run_command(humann_cmd)
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
@@ -61,6 +87,10 @@ def run_functional_annotation(input_dir, output_dir, threads):
             logger.error("请确保 humann 已安装并位于系统的 PATH 中。")
             raise
 
+        # 3. 流式拆分与过滤该样本的结果表
+        if split_tables:
+            run_split_tables(output_path, output_path / "split", min_abundance=min_abundance, sample=base)
+
     # 清理临时文件
     shutil.rmtree(temp_input_path)
     logger.info("功能注释分析完成。")
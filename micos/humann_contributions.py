@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""物种-功能贡献分析模块.
+
+由合并后的分层 HUMAnN 矩阵（特征|物种 × 样本）构建 通路 × 物种 × 样本 的稀疏贡献张量
+（COO：三组坐标 + 数值），并以向量化运算得到：
+- 物种贡献份额：某物种对某通路在某样本中的分层丰度 / 该通路在该样本中全部分层丰度之和
+- 与 Kraken2 物种相对丰度的相关性：按 (通路, 物种) 对，跨样本计算贡献份额与 Kraken2 相对丰度的
+  Pearson 相关系数；各项累加量由非零元素经 np.bincount 汇总，无需展开稠密矩阵
+
+Kraken2 丰度可来自 kraken-biom 生成的 feature-table.biom（需要 biom-format），
+或直接来自 Kraken2 报告目录（*.report）。
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from micos.humann_regroup import SPECIAL_FEATURES, _split_features
+from micos.humann_tables import CohortTable
+from micos.kraken_profile import clade_name, parse_kraken_report
+from micos.stats import bh_adjust
+
+logger = logging.getLogger(__name__)
+
+def species_key(genus: str, species: str) -> str:
+    """HUMAnN 分层行的物种名 g__Genus.s__Genus_species（兼容 kraken-biom 仅含种加词的写法）."""
+    genus, species = clade_name(genus), clade_name(species)
+    if not species.startswith(f"{genus}_"):
+        species = f"{genus}_{species}"
+    return f"g__{genus}.s__{species}"
+
+
+class ContributionTensor:
+    """通路 × 物种 × 样本 稀疏贡献张量 (COO)."""
+
+    def __init__(self, pathway_index: np.ndarray, taxon_index: np.ndarray, sample_index: np.ndarray,
+                 values: np.ndarray, pathways: Sequence[str], taxa: Sequence[str], samples: Sequence[str]):
+        self.pathway_index = np.asarray(pathway_index, dtype=np.int64)
+        self.taxon_index = np.asarray(taxon_index, dtype=np.int64)
+        self.sample_index = np.asarray(sample_index, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.pathways = np.asarray(pathways, dtype=object)
+        self.taxa = np.asarray(taxa, dtype=object)
+        self.samples = list(samples)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return len(self.pathways), len(self.taxa), len(self.samples)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def from_table(cls, table: CohortTable) -> "ContributionTensor":
+        """由合并矩阵的分层行构建（UNMAPPED / UNINTEGRATED 等特殊行忽略）."""
+        base, taxon = _split_features(table.features)
+        rows = np.flatnonzero((taxon != '') & ~np.isin(base, SPECIAL_FEATURES))
+        pair_pathway, pathways = pd.factorize(pd.Series(base[rows], dtype=object))
+        pair_taxon, taxa = pd.factorize(pd.Series(taxon[rows], dtype=object))
+
+        coo = table.matrix[rows].tocoo()
+        keep = coo.data != 0
+        return cls(pair_pathway[coo.row[keep]], pair_taxon[coo.row[keep]], coo.col[keep], coo.data[keep],
+                   np.asarray(pathways, dtype=object), np.asarray(taxa, dtype=object), table.samples)
+
+    def pair_codes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(通路, 物种) 对编码：返回 每个非零元素的对编号、各对的通路下标、各对的物种下标."""
+        keys = self.pathway_index * len(self.taxa) + self.taxon_index
+        unique_keys, codes = np.unique(keys, return_inverse=True)
+        return codes, unique_keys // len(self.taxa), unique_keys % len(self.taxa)
+
+    def shares(self) -> np.ndarray:
+        """每个非零元素的贡献份额（同一通路、同一样本内各物种份额之和为 1）."""
+        cell = self.pathway_index * len(self.samples) + self.sample_index
+        totals = np.bincount(cell, weights=self.values, minlength=len(self.pathways) * len(self.samples))
+        return self.values / totals[cell]
+
+    def to_sparse(self, values: Optional[np.ndarray] = None) -> sparse.csr_matrix:
+        """展开为 (通路 × 物种) × 样本 的稀疏矩阵，行号为 通路下标 × 物种数 + 物种下标."""
+        values = self.values if values is None else values
+        rows = self.pathway_index * len(self.taxa) + self.taxon_index
+        return sparse.csr_matrix((values, (rows, self.sample_index)),
+                                 shape=(len(self.pathways) * len(self.taxa), len(self.samples)))
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, pathway_index=self.pathway_index, taxon_index=self.taxon_index,
+                            sample_index=self.sample_index, values=self.values,
+                            pathways=self.pathways.astype(str), taxa=self.taxa.astype(str),
+                            samples=np.array(self.samples, dtype=str))
+        return path
+
+    @classmethod
+    def load(cls, path) -> "ContributionTensor":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['pathway_index'], data['taxon_index'], data['sample_index'], data['values'],
+                       data['pathways'].astype(object), data['taxa'].astype(object), list(data['samples']))
+
+
+def _normalize_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    totals = frame.sum(axis=0)
+    return frame.div(totals.where(totals > 0), axis=1).fillna(0.0)
+
+
+def read_kraken_reports(reports_dir) -> pd.DataFrame:
+    """读取 Kraken2 报告目录，返回 物种 × 样本 的相对丰度（列和为 1）."""
+    columns = {}
+    for report in sorted(Path(reports_dir).glob("*.report")):
+        abundances: Dict[str, float] = {}
+        for record in parse_kraken_report(report):
+            names = {prefix: name for prefix, name, _ in record['lineage']}
+            if 's' not in names:
+                continue
+            genus = names.get('g') or names['s'].split(' ', 1)[0]
+            key = species_key(genus, names['s'])
+            abundances[key] = abundances.get(key, 0.0) + record['reads']
+        columns[report.stem] = pd.Series(abundances, dtype=np.float64)
+    if not columns:
+        raise FileNotFoundError(f"在 {reports_dir} 中未找到 Kraken2 报告 (*.report)")
+    return _normalize_columns(pd.DataFrame(columns).fillna(0.0))
+
+
+def read_kraken_biom(biom_file) -> pd.DataFrame:
+    """读取 kraken-biom 生成的 BIOM 表，返回 物种 × 样本 的相对丰度（列和为 1）."""
+    try:
+        from biom import load_table
+    except ImportError as e:
+        raise RuntimeError("读取 BIOM 表需要安装 biom-format，或改用 Kraken2 报告目录") from e
+    table = load_table(str(biom_file))
+    keys, rows = [], []
+    for row, metadata in enumerate(table.metadata(axis='observation') or []):
+        lineage = {level[:1]: level[3:] for level in (metadata or {}).get('taxonomy', []) if level[1:3] == '__'}
+        if lineage.get('s') and lineage.get('g'):
+            keys.append(species_key(lineage['g'], lineage['s']))
+            rows.append(row)
+    if not rows:
+        raise ValueError(f"{biom_file} 中没有物种等级的分类信息")
+    matrix = table.matrix_data.tocsr()[rows].toarray()
+    frame = pd.DataFrame(matrix, index=keys, columns=list(table.ids(axis='sample')))
+    return _normalize_columns(frame.groupby(level=0).sum())
+
+
+def read_kraken_abundances(kraken_input) -> pd.DataFrame:
+    """读取 Kraken2 物种丰度：目录按报告读取，文件按 BIOM 读取."""
+    path = Path(kraken_input)
+    if path.is_dir():
+        return read_kraken_reports(path)
+    return read_kraken_biom(path)
+
+
+def contribution_summary(tensor: ContributionTensor,
+                         kraken_abundance: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    汇总每个 (通路, 物种) 对的贡献份额，并计算与 Kraken2 相对丰度的相关性.
+
+    参数：
+    - tensor: 贡献张量
+    - kraken_abundance: 物种 × 样本 的相对丰度；仅使用与张量共有的样本
+
+    返回：
+    - DataFrame: pathway, taxon, n_samples, total_contribution, mean_share, max_share，
+      提供 Kraken2 丰度时另含 n_paired_samples, kraken_correlation, p_value, q_value
+    """
+    codes, pair_pathway, pair_taxon = tensor.pair_codes()
+    n_pairs = len(pair_pathway)
+    n_samples = len(tensor.samples)
+    shares = tensor.shares()
+
+    def pair_sum(weights):
+        return np.bincount(codes, weights=weights, minlength=n_pairs)
+
+    max_share = np.zeros(n_pairs)
+    np.maximum.at(max_share, codes, shares)
+    result = pd.DataFrame({
+        'pathway': tensor.pathways[pair_pathway],
+        'taxon': tensor.taxa[pair_taxon],
+        'n_samples': np.bincount(codes, minlength=n_pairs),
+        'total_contribution': pair_sum(tensor.values),
+        # 份额在未检出该通路的样本中记为 0
+        'mean_share': pair_sum(shares) / n_samples if n_samples else np.nan,
+        'max_share': max_share,
+    })
+    if kraken_abundance is None:
+        return result
+
+    common = [sample for sample in tensor.samples if sample in kraken_abundance.columns]
+    if len(common) < 3:
+        logger.warning(f"与 Kraken2 丰度共有的样本仅 {len(common)} 个，无法计算相关性。")
+        result['n_paired_samples'] = len(common)
+        result[['kraken_correlation', 'p_value', 'q_value']] = np.nan
+        return result
+
+    # 张量样本下标 -> 共有样本下标；物种下标 -> Kraken2 物种行
+    sample_map = np.full(n_samples, -1, dtype=np.int64)
+    sample_map[[tensor.samples.index(sample) for sample in common]] = np.arange(len(common))
+    abundance = kraken_abundance[common]
+    taxon_rows = abundance.index.get_indexer(pd.Index(tensor.taxa))
+    y = np.vstack([abundance.to_numpy(dtype=np.float64), np.zeros((1, len(common)))])
+    taxon_rows[taxon_rows < 0] = len(y) - 1
+
+    # x: 贡献份额（未检出为 0），y: Kraken2 相对丰度；仅非零 x 参与 Σx、Σx²、Σxy
+    n = float(len(common))
+    in_common = sample_map[tensor.sample_index] >= 0
+    x = np.where(in_common, shares, 0.0)
+    y_at = np.where(in_common, y[taxon_rows[tensor.taxon_index], np.maximum(sample_map[tensor.sample_index], 0)], 0.0)
+    sum_x, sum_xx, sum_xy = pair_sum(x), pair_sum(x * x), pair_sum(x * y_at)
+    # Σy、Σy² 只依赖物种：按 Kraken2 物种各算一次，再按物种对取值
+    taxon_sum_y, taxon_sum_yy = y.sum(axis=1), (y * y).sum(axis=1)
+    sum_y, sum_yy = taxon_sum_y[taxon_rows[pair_taxon]], taxon_sum_yy[taxon_rows[pair_taxon]]
+
+    covariance = sum_xy - sum_x * sum_y / n
+    variance_x = sum_xx - sum_x * sum_x / n
+    variance_y = sum_yy - sum_y * sum_y / n
+    denominator = np.sqrt(np.clip(variance_x, 0, None) * np.clip(variance_y, 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.where(denominator > 1e-12, covariance / denominator, np.nan)
+        r = np.clip(r, -1.0, 1.0)
+        t = r * np.sqrt((n - 2) / np.clip(1 - r * r, 1e-300, None))
+    p_values = np.where(np.isnan(r), np.nan, 2 * stats.t.sf(np.abs(t), n - 2))
+
+    result['n_paired_samples'] = len(common)
+    result['kraken_correlation'] = r
+    result['p_value'] = p_values
+    result['q_value'] = bh_adjust(p_values)
+    return result
+
+
+def run_contribution_analysis(joined_dir, output_dir, kraken_input=None,
+                              table_type: str = 'pathabundance') -> Dict[str, Path]:
+    """
+    执行物种-功能贡献分析.
+
+    读取 join-tables 输出的 <table_type>_stratified.npz（不存在时使用 <table_type>.npz），写出：
+    - <table_type>_contributions.npz: 贡献张量 (COO)
+    - <table_type>_contribution_summary.csv: 各 (通路, 物种) 对的贡献份额与 Kraken2 相关性
+    """
+    logger.info("开始物种-功能贡献分析...")
+    joined_path = Path(joined_dir)
+    source = joined_path / f"{table_type}_stratified.npz"
+    if not source.exists():
+        source = joined_path / f"{table_type}.npz"
+    if not source.exists():
+        logger.warning(f"未找到合并矩阵 {source}，跳过贡献分析。")
+        return {}
+
+    tensor = ContributionTensor.from_table(CohortTable.load(source))
+    logger.info(f"贡献张量: {tensor.shape[0]} 个通路 × {tensor.shape[1]} 个物种 × {tensor.shape[2]} 个样本, "
+                f"{tensor.nnz} 个非零值")
+    kraken_abundance = read_kraken_abundances(kraken_input) if kraken_input else None
+    summary = contribution_summary(tensor, kraken_abundance)
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    written = {
+        'tensor': tensor.save(output_path / f"{table_type}_contributions.npz"),
+        'summary': output_path / f"{table_type}_contribution_summary.csv",
+    }
+    summary.sort_values(['pathway', 'total_contribution'], ascending=[True, False]).to_csv(
+        written['summary'], index=False)
+    logger.info("物种-功能贡献分析完成。")
+    return written
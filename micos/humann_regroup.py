@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""HUMAnN 结果重标准化与重分组模块.
+
+直接作用于合并后的稀疏矩阵 (CohortTable)：
+- 重标准化 (CPM / relab)：按列缩放，即右乘稀疏对角矩阵
+- 重分组 (UniRef -> KO/EC/GO 等)：映射文件只解析一次，构建 分组 × 成员 稀疏矩阵并缓存为 .npz；
+  由映射矩阵按 (分组, 物种) 展开得到 输出行 × 输入行 的稀疏分配矩阵，
+  未分层与分层行一并由一次矩阵乘法完成
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from micos.humann_tables import CohortTable, feature_order, open_text
+
+logger = logging.getLogger(__name__)
+
+RENORM_UNITS = {'cpm': 1e6, 'relab': 1.0}
+SPECIAL_FEATURES = ('UNMAPPED', 'UNGROUPED', 'UNINTEGRATED')
+UNGROUPED = 'UNGROUPED'
+
+
+def _split_features(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """拆分特征ID为 (未分层ID, 物种)，未分层行的物种为空字符串."""
+    parts = pd.Series(features, dtype=object).str.split('|', n=1)
+    base = parts.str[0].to_numpy(dtype=object)
+    taxon = parts.str[1].fillna('').to_numpy(dtype=object)
+    return base, taxon
+
+
+def renormalize(table: CohortTable, units: str = 'cpm', mode: str = 'community',
+                special: bool = True) -> CohortTable:
+    """
+    按列重标准化.
+
+    参数：
+    - units: 'cpm' 或 'relab'
+    - mode: 'community' 时全部行以未分层行的列和为分母；'levelwise' 时分层行以分层行的列和为分母
+    - special: 为 False 时先去除 UNMAPPED / UNGROUPED / UNINTEGRATED 行
+
+    返回：
+    - CohortTable
+    """
+    if units not in RENORM_UNITS:
+        raise ValueError(f"不支持的标准化单位: {units}")
+    if mode not in ('community', 'levelwise'):
+        raise ValueError(f"不支持的标准化模式: {mode}")
+
+    if not special:
+        base, _ = _split_features(table.features)
+        table = table.subset(np.flatnonzero(~np.isin(base, SPECIAL_FEATURES)))
+
+    stratified = table.stratified_mask
+    matrix = table.matrix.tocsr()
+
+    def column_scale(rows: np.ndarray) -> sparse.dia_matrix:
+        totals = np.asarray(matrix[rows].sum(axis=0)).ravel()
+        scale = np.divide(RENORM_UNITS[units], totals, out=np.zeros_like(totals), where=totals > 0)
+        return sparse.diags(scale)
+
+    unstratified_rows = np.flatnonzero(~stratified)
+    if mode == 'community' or not stratified.any():
+        result = matrix @ column_scale(unstratified_rows)
+    else:
+        # 行掩码对角矩阵选择各层，再分别按列缩放
+        keep_unstratified = sparse.diags((~stratified).astype(np.float64))
+        keep_stratified = sparse.diags(stratified.astype(np.float64))
+        result = (keep_unstratified @ matrix @ column_scale(unstratified_rows)
+                  + keep_stratified @ matrix @ column_scale(np.flatnonzero(stratified)))
+    return CohortTable(result.tocsr(), table.features, table.samples, table.table_type)
+
+
+class GroupMapping:
+    """分组 × 成员 稀疏映射矩阵 (如 KO × UniRef90)."""
+
+    def __init__(self, matrix: sparse.csr_matrix, groups: Sequence[str], members: Sequence[str]):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.groups = np.asarray(groups, dtype=object)
+        self.members = pd.Index(np.asarray(members, dtype=object))
+
+    @classmethod
+    def from_file(cls, mapping_file) -> "GroupMapping":
+        """解析 HUMAnN 映射文件：每行 分组ID<TAB>成员1<TAB>成员2...（可为 .gz）."""
+        group_ids, member_codes, members = [], [], {}
+        group_rows = []
+        with open_text(mapping_file) as f:
+            for line in f:
+                if not line.strip() or line[0] == '#':
+                    continue
+                fields = line.rstrip('\r\n').split('\t')
+                row = len(group_ids)
+                group_ids.append(fields[0])
+                for member in fields[1:]:
+                    if member:
+                        member_codes.append(members.setdefault(member, len(members)))
+                        group_rows.append(row)
+        matrix = sparse.csr_matrix((np.ones(len(member_codes)), (group_rows, member_codes)),
+                                   shape=(len(group_ids), len(members)))
+        matrix.data[:] = 1.0
+        return cls(matrix, group_ids, list(members))
+
+    def save(self, path):
+        np.savez_compressed(path, data=self.matrix.data, indices=self.matrix.indices,
+                            indptr=self.matrix.indptr, shape=np.array(self.matrix.shape),
+                            groups=self.groups.astype(str), members=self.members.to_numpy(dtype=str))
+
+    @classmethod
+    def load(cls, path) -> "GroupMapping":
+        with np.load(path, allow_pickle=False) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                       shape=tuple(data['shape']))
+            return cls(matrix, data['groups'].astype(object), data['members'].astype(object))
+
+
+def load_group_mapping(mapping_file, cache_dir: Optional[str] = None) -> GroupMapping:
+    """
+    读取分组映射，优先使用 .npz 缓存.
+
+    缓存文件名包含源文件大小与修改时间，源文件变化后自动重建。
+    """
+    mapping_path = Path(mapping_file)
+    stat = mapping_path.stat()
+    cache_root = Path(cache_dir) if cache_dir else mapping_path.parent
+    cache_root.mkdir(parents=True, exist_ok=True)
+    cache_path = cache_root / f"{mapping_path.name}.{stat.st_size}.{int(stat.st_mtime)}.npz"
+    if cache_path.exists():
+        logger.info(f"使用缓存的分组映射: {cache_path}")
+        return GroupMapping.load(cache_path)
+
+    logger.info(f"解析分组映射: {mapping_path}")
+    mapping = GroupMapping.from_file(mapping_path)
+    mapping.save(cache_path)
+    logger.info(f"{len(mapping.groups)} 个分组, {len(mapping.members)} 个成员, 缓存到 {cache_path}")
+    return mapping
+
+
+def regroup(table: CohortTable, mapping: GroupMapping, ungrouped: bool = True) -> CohortTable:
+    """
+    按映射对特征重分组（同一分组内求和）.
+
+    一个成员属于多个分组时计入每个分组；未映射到任何分组的特征计入 UNGROUPED
+    （分层行计入 UNGROUPED|物种）；UNMAPPED 等特殊行原样保留。
+    """
+    base, taxon = _split_features(table.features)
+    member_index = mapping.members.get_indexer(base)
+    special = np.isin(base, SPECIAL_FEATURES)
+
+    # 成员 × 分组 (CSR)，按行展开得到每个输入行对应的全部分组
+    member_groups = mapping.matrix.T.tocsr()
+    mapped = (member_index >= 0) & ~special
+    rows = np.flatnonzero(mapped)
+    starts = member_groups.indptr[member_index[rows]]
+    counts = member_groups.indptr[member_index[rows] + 1] - starts
+    input_rows = np.repeat(rows, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    output_groups = mapping.groups[member_groups.indices[np.repeat(starts, counts) + offsets]]
+
+    passthrough = np.flatnonzero(special)
+    unassigned = np.flatnonzero(~special & ~mapped) if ungrouped else np.array([], dtype=np.int64)
+    output_base = np.concatenate([output_groups, base[passthrough],
+                                  np.full(len(unassigned), UNGROUPED, dtype=object)])
+    input_rows = np.concatenate([input_rows, passthrough, unassigned]).astype(np.int64)
+    output_taxon = taxon[input_rows]
+    output_features = np.where(output_taxon == '', output_base,
+                               output_base.astype(object) + '|' + output_taxon.astype(object))
+
+    codes, features = pd.factorize(pd.Series(output_features, dtype=object))
+    features = np.asarray(features, dtype=object)
+    assignment = sparse.csr_matrix((np.ones(len(codes)), (codes, input_rows)),
+                                   shape=(len(features), table.shape[0]))
+    result = assignment @ table.matrix
+    order = feature_order(features)
+    logger.info(f"重分组: {table.shape[0]} 行 -> {len(features)} 行")
+    return CohortTable(result[order].tocsr(), features[order], table.samples, table.table_type)
+
+
+def run_renorm_regroup(joined_dir, output_dir, units: str = 'cpm', mode: str = 'community',
+                       mappings: Optional[Dict[str, str]] = None,
+                       cache_dir: Optional[str] = None) -> Dict[str, Path]:
+    """
+    对合并后的 HUMAnN 矩阵执行重标准化与重分组.
+
+    写出 genefamilies_<units>.npz、pathabundance_<units>.npz，以及每个映射的
+    genefamilies_<名称>_<units>.npz（先重分组原始丰度，再重标准化）。
+    """
+    logger.info("开始 HUMAnN 结果重标准化与重分组...")
+    joined_path = Path(joined_dir)
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    written = {}
+    for table_type in ('genefamilies', 'pathabundance'):
+        source = joined_path / f"{table_type}.npz"
+        if not source.exists():
+            logger.warning(f"未找到合并矩阵 {source}，跳过。")
+            continue
+        table = CohortTable.load(source)
+        name = f"{table_type}_{units}"
+        written[name] = renormalize(table, units, mode).save(output_path / f"{name}.npz")
+
+        if table_type == 'genefamilies':
+            for group_name, mapping_file in (mappings or {}).items():
+                mapping = load_group_mapping(mapping_file, cache_dir)
+                name = f"{table_type}_{group_name}_{units}"
+                grouped = renormalize(regroup(table, mapping), units, mode)
+                written[name] = grouped.save(output_path / f"{name}.npz")
+    logger.info("HUMAnN 结果重标准化与重分组完成。")
+    return written
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""HUMAnN 结果表流式拆分与过滤模块.
+
+对 HUMAnN 结果表（单样本或已合并的多样本表，可为 .gz）单次顺序扫描、常数内存地：
+- 拆分为未分层表 (_unstratified) 与分层表 (_stratified)
+- 写出物种贡献长表 (_contributions)：特征、物种分列，便于按物种汇总
+- 按最小丰度与流行率过滤：未分层行按阈值判断；分层行跟随其前面的未分层行
+  （HUMAnN 输出中未分层行总在其分层行之前），未出现父行时按自身判断
+"""
+
+import gzip
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from micos.humann_tables import HUMANN_TABLE_TYPES, open_text
+
+logger = logging.getLogger(__name__)
+
+SPLIT_SUFFIXES = ('unstratified', 'stratified', 'contributions')
+
+
+def _open_output(path: Path, compress: bool):
+    if compress:
+        return gzip.open(path, 'wt', newline='', compresslevel=6)
+    return open(path, 'w', newline='')
+
+
+def _table_stem(path: Path) -> str:
+    name = path.name
+    for suffix in ('.gz', '.tsv', '.txt'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def _passes(values: Sequence[str], min_abundance: float, min_prevalence: float) -> bool:
+    """非零且不低于 min_abundance 的样本比例不低于 min_prevalence."""
+    detected = 0
+    for value in values:
+        value = float(value)
+        if value > 0 and value >= min_abundance:
+            detected += 1
+    if not detected:
+        return False
+    return detected / len(values) >= min_prevalence
+
+
+def split_humann_table(input_file, output_dir=None, min_abundance: float = 0.0,
+                       min_prevalence: float = 0.0, compress: Optional[bool] = None,
+                       contributions: bool = True) -> Dict[str, Path]:
+    """
+    单次扫描拆分并过滤 HUMAnN 结果表.
+
+    参数：
+    - input_file: HUMAnN 结果表 (.tsv 或 .tsv.gz)
+    - output_dir: 输出目录，默认与输入相同
+    - min_abundance: 样本中视为检出的最小丰度
+    - min_prevalence: 保留特征所需的最小检出样本比例 (0-1)
+    - compress: 是否 gzip 压缩输出，默认与输入一致
+    - contributions: 是否写出物种贡献长表
+
+    返回：
+    - dict: 'unstratified' / 'stratified' / 'contributions' -> 输出路径
+    """
+    input_path = Path(input_file)
+    output_path = Path(output_dir) if output_dir else input_path.parent
+    output_path.mkdir(parents=True, exist_ok=True)
+    if compress is None:
+        compress = input_path.name.endswith('.gz')
+    extension = '.tsv.gz' if compress else '.tsv'
+    stem = _table_stem(input_path)
+
+    kinds = list(SPLIT_SUFFIXES if contributions else SPLIT_SUFFIXES[:2])
+    paths = {kind: output_path / f"{stem}_{kind}{extension}" for kind in kinds}
+    outputs = {kind: _open_output(path, compress) for kind, path in paths.items()}
+    counts = {'kept': 0, 'filtered': 0}
+    parent, parent_kept = None, False
+    try:
+        with open_text(input_path) as f:
+            for line in f:
+                if line.startswith('#'):
+                    outputs['unstratified'].write(line)
+                    outputs['stratified'].write(line)
+                    if contributions:
+                        header = line.rstrip('\r\n').split('\t')
+                        outputs['contributions'].write('\t'.join([header[0], 'Taxon'] + header[1:]) + '\n')
+                    continue
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 2:
+                    continue
+                feature, values = fields[0], fields[1:]
+                base, sep, taxon = feature.partition('|')
+
+                if not sep:
+                    parent = base
+                    parent_kept = _passes(values, min_abundance, min_prevalence)
+                    keep = parent_kept
+                elif base == parent:
+                    keep = parent_kept and _passes(values, 0.0, 0.0)
+                else:
+                    keep = _passes(values, min_abundance, min_prevalence)
+
+                if not keep:
+                    counts['filtered'] += 1
+                    continue
+                counts['kept'] += 1
+                if not sep:
+                    outputs['unstratified'].write(line)
+                else:
+                    outputs['stratified'].write(line)
+                    if contributions:
+                        outputs['contributions'].write('\t'.join([base, taxon] + values) + '\n')
+    finally:
+        for handle in outputs.values():
+            handle.close()
+
+    logger.info(f"{input_path.name}: 保留 {counts['kept']} 行, 过滤 {counts['filtered']} 行")
+    return paths
+
+
+def find_humann_outputs(input_dir, sample: Optional[str] = None) -> List[Path]:
+    """查找 HUMAnN 结果表（可限定样本名）."""
+    prefix = sample or '*'
+    files = []
+    for table_type in HUMANN_TABLE_TYPES:
+        for suffix in ('.tsv', '.tsv.gz'):
+            files.extend(sorted(Path(input_dir).glob(f"{prefix}_{table_type}{suffix}")))
+    return files
+
+
+def run_split_tables(input_dir, output_dir, min_abundance: float = 0.0, min_prevalence: float = 0.0,
+                     compress: Optional[bool] = None, sample: Optional[str] = None) -> Dict[Path, Dict[str, Path]]:
+    """拆分并过滤目录中的全部 HUMAnN 结果表."""
+    written = {}
+    for table in find_humann_outputs(input_dir, sample):
+        written[table] = split_humann_table(table, output_dir, min_abundance, min_prevalence, compress)
+    if not written:
+        logger.warning(f"在 {input_dir} 中未找到 HUMAnN 结果表。")
+    return written
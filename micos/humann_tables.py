@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""HUMAnN 结果表合并模块.
+
+将各样本的 HUMAnN 结果表 (*_genefamilies.tsv / *_pathabundance.tsv / *_pathcoverage.tsv，
+可为 .gz) 逐行流式读取，特征ID驻留到共享字典中，非零值以 COO 三元组累积，
+最终得到 特征 × 样本 的稀疏 CSR 矩阵。峰值内存与非零元素数成正比，而非 行数 × 样本数。
+
+输出格式：
+- npz（默认，仅依赖 numpy/scipy）
+- biom / hdf5（需要 biom-format）
+- parquet（长格式 feature/sample/value，需要 pyarrow）
+"""
+
+import gzip
+import logging
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+HUMANN_TABLE_TYPES = ('genefamilies', 'pathabundance', 'pathcoverage')
+OUTPUT_FORMATS = ('npz', 'biom', 'parquet')
+
+
+def open_text(path):
+    """以文本模式打开文件，.gz 文件透明解压."""
+    path = str(path)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def iter_table_rows(path) -> Iterator[Tuple[str, str]]:
+    """逐行读取单样本 HUMAnN 表，跳过 # 开头的表头行，产出 (特征ID, 数值字符串)."""
+    with open_text(path) as f:
+        for line in f:
+            if not line or line[0] == '#':
+                continue
+            feature, _, value = line.rstrip('\r\n').partition('\t')
+            if feature and value:
+                yield feature, value.split('\t', 1)[0]
+
+
+def find_sample_tables(input_dir, table_type: str) -> Dict[str, Path]:
+    """查找某类 HUMAnN 结果表，返回 样本名 -> 文件路径（按样本名排序）."""
+    tables = {}
+    for suffix in (f"_{table_type}.tsv", f"_{table_type}.tsv.gz"):
+        for path in Path(input_dir).glob(f"*{suffix}"):
+            tables.setdefault(path.name[:-len(suffix)], path)
+    return dict(sorted(tables.items()))
+
+
+def find_split_tables(split_dir, table_type: str) -> Dict[str, List[Path]]:
+    """查找 humann_split 写出的单样本拆分表，返回 样本名 -> [未分层表, 分层表]（两者齐全的样本）."""
+    parts = [find_sample_tables(split_dir, f"{table_type}_{kind}") for kind in ('unstratified', 'stratified')]
+    return {sample: [path, parts[1][sample]] for sample, path in parts[0].items() if sample in parts[1]}
+
+
+def feature_order(features: np.ndarray) -> np.ndarray:
+    """行排序：按未分层特征分组，每组内未分层行在前，其后为各物种分层行."""
+    # '|' 替换为比任何可见字符都小的 '\x01' 后，未分层ID是其分层行的前缀，一次字符串排序即可
+    keys = [feature.replace('|', '\x01') for feature in features]
+    return np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+
+
+class CohortTable:
+    """特征 × 样本 稀疏丰度矩阵."""
+
+    def __init__(self, matrix: sparse.csr_matrix, features: Sequence[str], samples: Sequence[str],
+                 table_type: str = ''):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.features = np.asarray(features, dtype=object)
+        self.samples = list(samples)
+        self.table_type = table_type
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape
+
+    @property
+    def stratified_mask(self) -> np.ndarray:
+        """分层行（特征ID含 '|'）的布尔掩码."""
+        return np.array(['|' in feature for feature in self.features], dtype=bool)
+
+    def subset(self, rows: np.ndarray) -> "CohortTable":
+        """按行子集构建新表."""
+        return CohortTable(self.matrix[rows], self.features[rows], self.samples, self.table_type)
+
+    def filter(self, min_abundance: float = 0.0, min_prevalence: float = 0.0) -> "CohortTable":
+        """
+        按最小丰度与队列流行率过滤行.
+
+        未分层行要求非零且不低于 min_abundance 的样本比例不低于 min_prevalence；
+        分层行跟随其未分层父行（另需至少一个非零值），无父行时按自身判断。
+        """
+        n_samples = max(len(self.samples), 1)
+        positive = self.matrix.copy()
+        positive.data = (positive.data > 0).astype(np.float64)
+        positive.eliminate_zeros()
+        detected = self.matrix.copy()
+        detected.data = ((detected.data > 0) & (detected.data >= min_abundance)).astype(np.float64)
+        detected.eliminate_zeros()
+        counts = np.diff(detected.indptr)
+        passes = (counts > 0) & (counts / n_samples >= min_prevalence)
+
+        stratified = np.flatnonzero(self.stratified_mask)
+        unstratified = np.flatnonzero(~self.stratified_mask)
+        parents = [feature.partition('|')[0] for feature in self.features[stratified]]
+        parent_rows = pd.Index(self.features[unstratified]).get_indexer(parents)
+        has_parent = parent_rows >= 0
+        keep = passes.copy()
+        keep[stratified[has_parent]] = (passes[unstratified[parent_rows[has_parent]]]
+                                        & (np.diff(positive.indptr)[stratified[has_parent]] > 0))
+        logger.info(f"队列过滤 ({self.table_type or 'table'}): 保留 {int(keep.sum())} 行, "
+                    f"过滤 {int((~keep).sum())} 行")
+        return self.subset(np.flatnonzero(keep))
+
+    def unstratified(self) -> "CohortTable":
+        """未分层视图（包含 UNMAPPED / UNINTEGRATED 等行）."""
+        return self.subset(np.flatnonzero(~self.stratified_mask))
+
+    def stratified(self) -> "CohortTable":
+        """分层视图（特征|物种 行）."""
+        return self.subset(np.flatnonzero(self.stratified_mask))
+
+    def to_dataframe(self):
+        """转换为稠密 DataFrame（仅用于小表）."""
+        return pd.DataFrame(self.matrix.toarray(), index=self.features, columns=self.samples)
+
+    def save(self, path, fmt: Optional[str] = None) -> Path:
+        """保存矩阵，格式由 fmt 或文件后缀决定."""
+        path = Path(path)
+        fmt = fmt or {'.biom': 'biom', '.h5': 'biom', '.hdf5': 'biom',
+                      '.parquet': 'parquet'}.get(path.suffix, 'npz')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if fmt == 'npz':
+            matrix = self.matrix.tocsr()
+            np.savez_compressed(path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                                shape=np.array(matrix.shape), features=self.features.astype(str),
+                                samples=np.array(self.samples, dtype=str),
+                                table_type=np.array(self.table_type))
+        elif fmt == 'biom':
+            try:
+                from biom.table import Table
+                from biom.util import biom_open
+            except ImportError as e:
+                raise RuntimeError("写出 BIOM/HDF5 需要安装 biom-format") from e
+            table = Table(self.matrix, list(self.features), self.samples, type='Function table')
+            with biom_open(str(path), 'w') as f:
+                table.to_hdf5(f, "MICOS-2024")
+        elif fmt == 'parquet':
+            coo = self.matrix.tocoo()
+            frame = pd.DataFrame({
+                'feature': pd.Categorical.from_codes(coo.row, self.features.astype(str)),
+                'sample': pd.Categorical.from_codes(coo.col, self.samples),
+                'value': coo.data})
+            try:
+                frame.to_parquet(path, index=False)
+            except ImportError as e:
+                raise RuntimeError("写出 Parquet 需要安装 pyarrow 或 fastparquet") from e
+        else:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        return path
+
+    @classmethod
+    def load(cls, path) -> "CohortTable":
+        """读取 save() 写出的 npz 文件."""
+        with np.load(path, allow_pickle=False) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                       shape=tuple(data['shape']))
+            return cls(matrix, data['features'].astype(object), list(data['samples']),
+                       str(data['table_type']))
+
+
+def join_tables(sample_tables: Dict[str, Union[Path, Sequence[Path]]], table_type: str = '') -> CohortTable:
+    """
+    流式合并单样本 HUMAnN 表.
+
+    参数：
+    - sample_tables: 样本名 -> 文件路径（或同一样本的多个文件，如拆分后的未分层表与分层表）
+    - table_type: 表类型，记录在结果中
+
+    返回：
+    - CohortTable: 行按 feature_order 排序
+    """
+    vocabulary: Dict[str, int] = {}
+    rows, cols, values = array('q'), array('i'), array('d')
+    for col, (sample, paths) in enumerate(sample_tables.items()):
+        n_before = len(rows)
+        for path in ([paths] if isinstance(paths, (str, Path)) else paths):
+            for feature, value in iter_table_rows(path):
+                value = float(value)
+                if value == 0.0:
+                    continue
+                rows.append(vocabulary.setdefault(feature, len(vocabulary)))
+                cols.append(col)
+                values.append(value)
+        logger.info(f"样本 {sample}: {len(rows) - n_before} 个非零特征")
+
+    shape = (len(vocabulary), len(sample_tables))
+    matrix = sparse.csr_matrix((np.frombuffer(values, dtype=np.float64),
+                                (np.frombuffer(rows, dtype=np.int64), np.frombuffer(cols, dtype=np.int32))),
+                               shape=shape)
+    features = np.array(list(vocabulary), dtype=object)
+    order = feature_order(features)
+    logger.info(f"合并完成 ({table_type or 'table'}): {shape[0]} 个特征 × {shape[1]} 个样本, "
+                f"{matrix.nnz} 个非零值")
+    return CohortTable(matrix[order], features[order], list(sample_tables), table_type)
+
+
+def run_join_tables(input_dir, output_dir, formats: Sequence[str] = ('npz',), split: bool = True,
+                    min_abundance: float = 0.0, min_prevalence: float = 0.0) -> Dict[str, List[Path]]:
+    """执行 HUMAnN 结果表合并，每类表写出完整、未分层与分层三个矩阵.
+
+    <输入目录>/split 中存在某样本的拆分表（功能注释时按 min_abundance 过滤后写出）时，
+    合并读取拆分表而非原始表。合并后按 min_abundance / min_prevalence 在队列水平过滤。
+    """
+    logger.info("开始合并 HUMAnN 结果表...")
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    for fmt in formats:
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+
+    written: Dict[str, List[Path]] = {}
+    for table_type in HUMANN_TABLE_TYPES:
+        sample_tables = {**find_sample_tables(input_dir, table_type),
+                         **find_split_tables(Path(input_dir) / "split", table_type)}
+        if not sample_tables:
+            logger.warning(f"未找到 *_{table_type}.tsv 文件，跳过。")
+            continue
+        cohort = join_tables(dict(sorted(sample_tables.items())), table_type)
+        if min_abundance > 0 or min_prevalence > 0:
+            cohort = cohort.filter(min_abundance, min_prevalence)
+        views = {table_type: cohort}
+        if split:
+            views[f"{table_type}_unstratified"] = cohort.unstratified()
+            views[f"{table_type}_stratified"] = cohort.stratified()
+        for name, view in views.items():
+            for fmt in formats:
+                written.setdefault(table_type, []).append(view.save(output_path / f"{name}.{fmt}", fmt))
+    logger.info("HUMAnN 结果表合并完成。")
+    return written
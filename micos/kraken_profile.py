@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Kraken2 报告转换为 MetaPhlAn 格式物种谱.
+
+HUMAnN 默认对每个样本运行 MetaPhlAn 以选择需要比对的物种泛基因组。流程中 Kraken2 已对
+同一批 reads 完成分类，因此可将 Kraken2 报告转换为 MetaPhlAn 格式，通过
+`humann --taxonomic-profile` 传入，跳过 HUMAnN 内部的 MetaPhlAn 预筛选。
+
+转换规则：
+- 按报告的缩进重建谱系，仅保留 D/P/C/O/F/G/S 标准等级 (D 对应 k__)
+- 物种相对丰度 = 该物种分支 reads / 全部物种分支 reads × 100（亚种级 reads 已包含在物种分支中）
+- 物种名转换为 ChocoPhlAn 命名 (g__Genus.s__Genus_species)；可提供 taxid -> 分支名映射表覆盖，
+  并可按 ChocoPhlAn 目录中存在的泛基因组过滤
+"""
+
+import re
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Kraken2 等级代码 -> MetaPhlAn 前缀
+RANK_PREFIXES = {'D': 'k', 'P': 'p', 'C': 'c', 'O': 'o', 'F': 'f', 'G': 'g', 'S': 's'}
+DEFAULT_DB_VERSION = "mpa_v31_CHOCOPhlAn_201901"
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.\-]')
+
+
+def clade_name(name: str) -> str:
+    """分类单元名称转换为 MetaPhlAn 分支名（空格转下划线，去除特殊字符）."""
+    return _UNSAFE.sub('', name.strip().replace(' ', '_'))
+
+
+def parse_kraken_report(report_file) -> List[Dict]:
+    """
+    解析 Kraken2 报告（兼容 --report-minimizer-data 的 8 列格式）.
+
+    返回：
+    - list: 每个物种一项，含 taxid、reads（分支 reads）、lineage [(前缀, 名称, taxid)]
+    """
+    species = []
+    stack: List[Tuple[int, str, str, str]] = []  # (缩进深度, 前缀, 名称, taxid)
+    with open(report_file, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 6 or not fields[1].strip().isdigit():
+                continue
+            clade_reads, rank, taxid, raw_name = fields[1], fields[-3].strip(), fields[-2].strip(), fields[-1]
+            name = raw_name.lstrip(' ')
+            depth = (len(raw_name) - len(name)) // 2
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            prefix = RANK_PREFIXES.get(rank)
+            stack.append((depth, prefix, name, taxid))
+            if rank == 'S' and int(clade_reads) > 0:
+                lineage = [(p, n, t) for _, p, n, t in stack if p]
+                species.append({'taxid': taxid, 'reads': int(clade_reads), 'lineage': lineage})
+    return species
+
+
+def read_chocophlan_species(chocophlan_dir) -> Set[str]:
+    """列出 ChocoPhlAn 目录中的物种泛基因组 (g__Genus.s__Genus_species)."""
+    species = set()
+    for path in Path(chocophlan_dir).iterdir():
+        match = re.match(r'(g__[^.]+\.s__[^.]+)', path.name)
+        if match:
+            species.add(match.group(1))
+    return species
+
+
+def read_taxid_map(taxid_map_file) -> Dict[str, str]:
+    """读取 taxid<TAB>分支名 映射表，分支名为 g__Genus.s__Genus_species 或完整 MetaPhlAn 谱系."""
+    mapping = {}
+    with open(taxid_map_file, 'r') as f:
+        for line in f:
+            if line.startswith('#') or '\t' not in line:
+                continue
+            taxid, clade = line.rstrip('\n').split('\t')[:2]
+            mapping[taxid.strip()] = clade.strip()
+    return mapping
+
+
+def _species_clade(record: Dict, taxid_map: Optional[Dict[str, str]]) -> Tuple[str, str]:
+    """返回 (完整谱系分支名, ChocoPhlAn 物种键)."""
+    lineage = record['lineage']
+    override = (taxid_map or {}).get(record['taxid'])
+    if override:
+        parts = override.replace('.s__', '|s__').split('|')
+        genus = next((part for part in parts if part.startswith('g__')), None)
+        species = next((part for part in parts if part.startswith('s__')), None)
+        if genus and species:
+            higher = [f"{p}__{clade_name(n)}" for p, n, _ in lineage if p not in ('g', 's')]
+            return '|'.join(higher + [genus, species]), f"{genus}.{species}"
+
+    names = {p: clade_name(n) for p, n, _ in lineage}
+    if 'g' not in names:
+        # 无属等级时取物种名的第一个词作为属
+        names['g'] = names['s'].split('_', 1)[0]
+    clade = '|'.join(f"{p}__{names[p]}" for p in ('k', 'p', 'c', 'o', 'f', 'g', 's') if p in names)
+    return clade, f"g__{names['g']}.s__{names['s']}"
+
+
+def kraken_report_to_metaphlan(report_file, output_file, chocophlan_species: Optional[Set[str]] = None,
+                               taxid_map: Optional[Dict[str, str]] = None, min_abundance: float = 0.0,
+                               db_version: str = DEFAULT_DB_VERSION) -> int:
+    """
+    将 Kraken2 报告转换为 HUMAnN 可读取的 MetaPhlAn 格式物种谱.
+
+    参数：
+    - chocophlan_species: 若提供，仅保留 ChocoPhlAn 中存在的物种
+    - taxid_map: taxid -> 分支名 映射（覆盖按名称的转换）
+    - min_abundance: 最小相对丰度 (%)
+    - db_version: 写入表头的 MetaPhlAn 数据库版本，需与 HUMAnN 期望的版本一致
+
+    返回：
+    - int: 写出的物种数
+    """
+    records = parse_kraken_report(report_file)
+    total = sum(record['reads'] for record in records)
+    rows = {}
+    for record in records:
+        clade, key = _species_clade(record, taxid_map)
+        if chocophlan_species is not None and key not in chocophlan_species:
+            continue
+        abundance = 100.0 * record['reads'] / total if total else 0.0
+        if abundance < min_abundance:
+            continue
+        taxids = '|'.join(t for _, _, t in record['lineage'])
+        previous = rows.get(clade)
+        rows[clade] = (taxids, abundance + (previous[1] if previous else 0.0))
+
+    output_path = Path(output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        f.write(f"#{db_version}\n")
+        f.write(f"#converted from Kraken2 report {Path(report_file).name}\n")
+        f.write("#clade_name\tNCBI_tax_id\trelative_abundance\tadditional_species\n")
+        for clade, (taxids, abundance) in sorted(rows.items(), key=lambda item: -item[1][1]):
+            f.write(f"{clade}\t{taxids}\t{abundance:.5f}\t\n")
+    logger.info(f"{Path(report_file).name}: {len(records)} 个物种, {len(rows)} 个写入 {output_path}")
+    return len(rows)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""统计工具函数：多重检验校正等供各分析模块共用."""
+
+import numpy as np
+
+
+def bh_adjust(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg 校正（向量化，NaN 视为未检验并原样保留）."""
+    p_values = np.asarray(p_values, dtype=float)
+    q_values = np.full(len(p_values), np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    if len(valid) == 0:
+        return q_values
+    order = valid[np.argsort(p_values[valid], kind='mergesort')]
+    ranked = p_values[order] * len(valid) / np.arange(1, len(valid) + 1)
+    q_values[order] = np.clip(np.minimum.accumulate(ranked[::-1])[::-1], 0.0, 1.0)
+    return q_values
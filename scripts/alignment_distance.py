@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 比对序列距离计算
+Vectorized Alignment Distance Kernel
+
+将多序列比对一次性编码为 uint8 矩阵，按行块计算全部序列对的距离：
+1. 每个碱基类别（A/C/G/T/gap、嘌呤/嘧啶）展开为指示矩阵
+2. 行块与全部序列的匹配数、转换数、颠换数、有效位点数均由矩阵乘法得到
+3. 行块分发到进程池中并行计算，只计算上三角部分
+
+支持的距离模型：
+- identity: 1 - 相同字符位点比例（与 Biopython DistanceCalculator('identity') 一致，gap 视为字符）
+- p: 两条序列均为 A/C/G/T 的位点中不同碱基的比例（成对删除 gap 与模糊碱基）
+- jc69: Jukes-Cantor 校正距离
+- k2p: Kimura 双参数校正距离（区分转换与颠换）
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from Bio import SeqIO
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_MODELS = ('identity', 'p', 'jc69', 'k2p')
+
+# 饱和（校正公式无定义）或无可比较位点时使用的最大距离
+MAX_DISTANCE = 3.0
+
+# 编码: A=0, C=1, G=2, T/U=3, gap=4, 其余字母(N等模糊碱基)各自编码为 5 及以上，
+# 其他字符统一编码为 OTHER_CODE
+GAP_CODE = 4
+OTHER_CODE = 255
+_ENCODING = np.full(256, OTHER_CODE, dtype=np.uint8)
+for _index, _char in enumerate('BDEFHIJKLMNOPQRSVWXYZ*'):
+    _ENCODING[ord(_char)] = _ENCODING[ord(_char.lower())] = 5 + _index
+for _codes, _value in (('Aa', 0), ('Cc', 1), ('Gg', 2), ('TtUu', 3), ('-.', GAP_CODE)):
+    for _char in _codes:
+        _ENCODING[ord(_char)] = _value
+
+# 工作进程状态，由进程池 initializer 设置
+_WORKER_STATE: Dict = {}
+
+
+def encode_sequences(sequences: List[str]) -> np.ndarray:
+    """将等长比对序列编码为 n × L 的 uint8 矩阵"""
+    lengths = {len(seq) for seq in sequences}
+    if len(lengths) > 1:
+        raise ValueError(f"比对序列长度不一致: {sorted(lengths)}")
+    buffer = np.frombuffer(''.join(sequences).encode('ascii', 'replace'), dtype=np.uint8)
+    return _ENCODING[buffer].reshape(len(sequences), -1)
+
+
+def read_alignment(alignment_file: str) -> Tuple[List[str], np.ndarray]:
+    """读取FASTA格式比对文件，返回序列ID与编码矩阵"""
+    names, sequences = [], []
+    for record in SeqIO.parse(alignment_file, "fasta"):
+        names.append(record.id)
+        sequences.append(str(record.seq))
+    if not names:
+        raise ValueError(f"比对文件中没有序列: {alignment_file}")
+    return names, encode_sequences(sequences)
+
+
+def _indicators(encoded: np.ndarray, model: str) -> Dict[str, np.ndarray]:
+    """构建计算所需的 float32 指示矩阵"""
+    if model == 'identity':
+        return {f"c{code}": (encoded == code).astype(np.float32) for code in np.unique(encoded)}
+    indicators = {f"c{code}": (encoded == code).astype(np.float32) for code in range(4)}
+    indicators['valid'] = (encoded < GAP_CODE).astype(np.float32)
+    if model == 'k2p':
+        indicators['purine'] = indicators['c0'] + indicators['c2']
+        indicators['pyrimidine'] = indicators['c1'] + indicators['c3']
+    return indicators
+
+
+def _init_worker(encoded: np.ndarray, model: str):
+    """进程池初始化: 每个进程只构建一次指示矩阵"""
+    _WORKER_STATE.update(indicators=_indicators(encoded, model), model=model,
+                         length=encoded.shape[1])
+
+
+def _distance_block(row_start: int, row_end: int) -> Tuple[int, np.ndarray]:
+    """计算行块 [row_start, row_end) 与其后全部序列的距离"""
+    indicators, model = _WORKER_STATE['indicators'], _WORKER_STATE['model']
+
+    def pair_counts(*keys):
+        total = 0.0
+        for key in keys:
+            matrix = indicators[key]
+            total = total + matrix[row_start:row_end] @ matrix[row_start:].T
+        return total.astype(np.float64)
+
+    if model == 'identity':
+        matches = pair_counts(*indicators)
+        return row_start, 1.0 - matches / max(_WORKER_STATE['length'], 1)
+
+    valid = pair_counts('valid')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if model == 'k2p':
+            same_class = pair_counts('purine', 'pyrimidine')
+            transitions = (same_class - pair_counts('c0', 'c1', 'c2', 'c3')) / valid
+            transversions = (valid - same_class) / valid
+            distance = (-0.5 * np.log(1 - 2 * transitions - transversions)
+                        - 0.25 * np.log(1 - 2 * transversions))
+        else:
+            distance = 1.0 - pair_counts('c0', 'c1', 'c2', 'c3') / valid
+            if model == 'jc69':
+                distance = -0.75 * np.log(1 - 4.0 / 3.0 * distance)
+    distance[~np.isfinite(distance) | (valid == 0)] = MAX_DISTANCE
+    return row_start, np.clip(distance, 0.0, MAX_DISTANCE)
+
+
+def pairwise_distances(encoded: np.ndarray, model: str = 'identity', n_jobs: int = 1,
+                       block_size: int = 256) -> np.ndarray:
+    """
+    计算全部序列对的距离矩阵
+
+    Args:
+        encoded: encode_sequences 得到的 n × L 编码矩阵
+        model: 'identity'、'p'、'jc69' 或 'k2p'
+        n_jobs: 并行进程数
+        block_size: 每个任务处理的行数
+
+    Returns:
+        n × n 对称 float32 距离矩阵
+    """
+    if model not in DISTANCE_MODELS:
+        raise ValueError(f"不支持的距离模型: {model}")
+
+    n = encoded.shape[0]
+    block_size = max(1, min(block_size, -(-n // max(1, n_jobs * 4))))
+    starts = list(range(0, n, block_size))
+    ends = [min(start + block_size, n) for start in starts]
+    logger.info(f"计算 {n} 条序列 ({encoded.shape[1]} 位点) 的 {model} 距离")
+
+    result = np.zeros((n, n), dtype=np.float32)
+    if n_jobs > 1 and len(starts) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(encoded, model)) as executor:
+            blocks = list(executor.map(_distance_block, starts, ends))
+    else:
+        _init_worker(encoded, model)
+        blocks = list(map(_distance_block, starts, ends))
+        _WORKER_STATE.clear()
+
+    for row_start, block in blocks:
+        row_end = row_start + block.shape[0]
+        result[row_start:row_end, row_start:] = block
+        result[row_start:, row_start:row_end] = block.T
+    np.fill_diagonal(result, 0.0)
+    return result
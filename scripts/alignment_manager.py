@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 多序列比对管理
+Incremental MAFFT Alignment Manager
+
+管理 MAFFT 多序列比对的多线程运行与缓存：
+1. 将线程数通过 --thread 传递给 MAFFT
+2. 以输入序列（ID + 序列内容哈希）为键缓存比对结果，相同输入直接复用
+3. 输入为某个已缓存比对的超集且新增序列较少时，以缓存比对为参考，
+   通过 --add --keeplength 增量加入新序列，而不是从头重新比对全部序列
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import shutil
+import hashlib
+import logging
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from Bio import SeqIO
+
+logger = logging.getLogger(__name__)
+
+
+def _sequence_hash(sequence: str) -> str:
+    """序列内容哈希（忽略大小写与gap）"""
+    return hashlib.sha1(sequence.upper().replace('-', '').replace('.', '').encode()).hexdigest()
+
+
+class AlignmentManager:
+    """MAFFT 比对管理器"""
+
+    def __init__(self, cache_dir: str, threads: int = 1, mafft: str = 'mafft',
+                 max_add_fraction: float = 0.5):
+        """
+        初始化比对管理器
+
+        Args:
+            cache_dir: 比对缓存目录
+            threads: 传给 MAFFT 的线程数
+            mafft: MAFFT 可执行文件
+            max_add_fraction: 新增序列占比不超过该值时使用增量比对
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.threads = max(1, int(threads))
+        self.mafft = mafft
+        self.max_add_fraction = max_add_fraction
+
+    def is_available(self) -> bool:
+        """检查 MAFFT 是否可用"""
+        return shutil.which(self.mafft) is not None
+
+    @staticmethod
+    def _cache_key(members: Dict[str, str]) -> str:
+        """比对缓存键: 全部 (序列ID, 序列哈希) 的哈希"""
+        digest = hashlib.sha1()
+        for seq_id in sorted(members):
+            digest.update(f"{seq_id}\t{members[seq_id]}\n".encode())
+        return digest.hexdigest()
+
+    def _read_members(self, key: str) -> Dict[str, str]:
+        """读取缓存比对的成员表"""
+        members = {}
+        with open(self.cache_dir / f"{key}.tsv") as f:
+            for line in f:
+                seq_id, seq_hash = line.rstrip('\n').split('\t')
+                members[seq_id] = seq_hash
+        return members
+
+    def _store(self, alignment_file: Path, members: Dict[str, str]) -> Path:
+        """将比对结果写入缓存"""
+        key = self._cache_key(members)
+        cached = self.cache_dir / f"{key}.fasta"
+        shutil.copyfile(alignment_file, cached)
+        with open(self.cache_dir / f"{key}.tsv", 'w') as f:
+            for seq_id in sorted(members):
+                f.write(f"{seq_id}\t{members[seq_id]}\n")
+        return cached
+
+    def _find_reference(self, members: Dict[str, str]) -> Optional[Tuple[str, Dict[str, str]]]:
+        """查找成员全部包含在输入中的最大缓存比对"""
+        best = None
+        for member_file in self.cache_dir.glob("*.tsv"):
+            key = member_file.stem
+            if not (self.cache_dir / f"{key}.fasta").exists():
+                continue
+            cached = self._read_members(key)
+            if len(cached) < len(members) and all(members.get(seq_id) == seq_hash
+                                                  for seq_id, seq_hash in cached.items()):
+                if best is None or len(cached) > len(best[1]):
+                    best = (key, cached)
+        return best
+
+    def _run_mafft(self, args: List[str], output_file: Path):
+        """运行 MAFFT，标准输出写入 output_file"""
+        cmd = [self.mafft, '--thread', str(self.threads), '--quiet'] + args
+        logger.info(f"运行: {' '.join(cmd)}")
+        with open(output_file, 'w') as f:
+            result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"MAFFT运行失败: {result.stderr.strip()}")
+
+    def align(self, input_fasta: str, output_alignment: str) -> str:
+        """
+        比对输入序列，优先复用缓存或增量加入新序列
+
+        Args:
+            input_fasta: 未比对的序列FASTA
+            output_alignment: 比对结果输出路径
+
+        Returns:
+            比对结果路径
+        """
+        if not self.is_available():
+            raise FileNotFoundError(f"未找到MAFFT: {self.mafft}")
+
+        records = list(SeqIO.parse(input_fasta, "fasta"))
+        if not records:
+            raise ValueError(f"输入文件中没有序列: {input_fasta}")
+        members = {record.id: _sequence_hash(str(record.seq)) for record in records}
+        if len(members) != len(records):
+            raise ValueError("输入序列ID存在重复")
+
+        key = self._cache_key(members)
+        cached = self.cache_dir / f"{key}.fasta"
+        if cached.exists():
+            logger.info(f"复用缓存的比对: {cached}")
+            shutil.copyfile(cached, output_alignment)
+            return output_alignment
+
+        with tempfile.TemporaryDirectory(prefix="micos_mafft_") as work_dir:
+            work_dir = Path(work_dir)
+            result_file = work_dir / "aligned.fasta"
+            reference = self._find_reference(members)
+            n_new = len(members) - len(reference[1]) if reference else len(members)
+
+            if reference and n_new <= self.max_add_fraction * len(members):
+                ref_key, ref_members = reference
+                new_file = work_dir / "new_sequences.fasta"
+                SeqIO.write([record for record in records if record.id not in ref_members],
+                            new_file, "fasta")
+                logger.info(f"增量比对: 向 {len(ref_members)} 条参考比对中加入 {n_new} 条新序列")
+                self._run_mafft(['--add', str(new_file), '--keeplength',
+                                 str(self.cache_dir / f"{ref_key}.fasta")], result_file)
+            else:
+                logger.info(f"完整比对 {len(members)} 条序列")
+                self._run_mafft(['--auto', str(input_fasta)], result_file)
+
+            self._store(result_file, members)
+            shutil.copyfile(result_file, output_alignment)
+        return output_alignment
@@ -11,6 +11,7 @@ MICOS-2024 16S rRNA扩增子分析模块
 - 分类学注释
 - 多样性分析
 - 系统发育分析
+- 资源规划: 按可用CPU与内存为 DADA2 与 classify-sklearn 分配线程数和批大小
 """
 
 import os
@@ -23,18 +24,84 @@ import numpy as np
 import subprocess
 import tempfile
 import shutil
+from typing import Dict
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# classify-sklearn 内存模型（估计值）：每个并行任务各自加载一份分类器，
+# 并为每批 reads 生成 reads × 分类单元数 的概率矩阵
+CLASSIFIER_MEMORY_FACTOR = 8          # 分类器在内存中的大小 ≈ .qza 文件大小 × 该系数
+BYTES_PER_READ = 400 * 1024           # 每条 read 的预测开销（约 5 万个分类单元 × float64）
+MIN_READS_PER_BATCH = 1000
+MAX_READS_PER_BATCH = 20000           # 与 q2-feature-classifier 'auto' 的上限一致
+MEMORY_USAGE_FRACTION = 0.8           # 只规划可用内存的这一比例
+
+
+def available_threads() -> int:
+    """当前进程可用的CPU核数（遵循 CPU 亲和性设置）"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def available_memory() -> int:
+    """当前可用内存（字节）：优先使用 psutil，其次 /proc/meminfo，最后为物理内存总量"""
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def plan_classifier(threads: int, memory_bytes: int, classifier_bytes: int) -> Dict[str, int]:
+    """
+    规划 classify-sklearn 的并行任务数与每批 reads 数
+
+    先在内存允许（每个任务至少容纳分类器与最小批次）的前提下取尽可能多的任务，
+    再将剩余内存平均分给各任务的批次。
+
+    Args:
+        threads: 可用线程数
+        memory_bytes: 可用内存（字节）
+        classifier_bytes: 分类器 .qza 文件大小（字节）
+
+    Returns:
+        {'n_jobs': 并行任务数, 'reads_per_batch': 每批 reads 数}
+    """
+    budget = int(memory_bytes * MEMORY_USAGE_FRACTION)
+    model_bytes = classifier_bytes * CLASSIFIER_MEMORY_FACTOR
+    per_job_minimum = model_bytes + MIN_READS_PER_BATCH * BYTES_PER_READ
+    n_jobs = max(1, min(threads, budget // max(per_job_minimum, 1)))
+    reads_per_batch = (budget // n_jobs - model_bytes) // BYTES_PER_READ
+    reads_per_batch = int(min(MAX_READS_PER_BATCH, max(MIN_READS_PER_BATCH, reads_per_batch)))
+    if budget < per_job_minimum:
+        logger.warning(f"可用内存 ({memory_bytes / 2**30:.1f} GB) 可能不足以加载分类器，"
+                       f"使用单任务与最小批次 ({MIN_READS_PER_BATCH})")
+    return {'n_jobs': int(n_jobs), 'reads_per_batch': reads_per_batch}
+
 class AmpliconAnalyzer:
     """16S rRNA扩增子分析类"""
     
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, threads=None, memory_gb=None, reads_per_batch=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # 资源规划：未指定时按当前节点的可用CPU与内存确定
+        self.threads = threads or available_threads()
+        self.memory_bytes = int(memory_gb * 2**30) if memory_gb else available_memory()
+        self.reads_per_batch = reads_per_batch
+        logger.info(f"资源规划: {self.threads} 个线程, 可用内存 {self.memory_bytes / 2**30:.1f} GB")
+        
         # 创建子目录
         self.qc_dir = self.output_dir / "quality_control"
         self.otu_dir = self.output_dir / "otu_clustering"
@@ -133,6 +200,7 @@ class AmpliconAnalyzer:
                 '--p-trim-left-r', '13',
                 '--p-trunc-len-f', '150',
                 '--p-trunc-len-r', '150',
+                '--p-n-threads', str(self.threads),
                 '--o-table', str(output_dir / 'table.qza'),
                 '--o-representative-sequences', str(output_dir / 'rep-seqs.qza'),
                 '--o-denoising-stats', str(output_dir / 'denoising-stats.qza')
@@ -173,11 +241,19 @@ class AmpliconAnalyzer:
         logger.info("进行分类学注释...")
         
         try:
+            # 按分类器大小与可用内存规划并行任务数和批大小
+            plan = plan_classifier(self.threads, self.memory_bytes, Path(classifier_qza).stat().st_size)
+            if self.reads_per_batch:
+                plan['reads_per_batch'] = self.reads_per_batch
+            logger.info(f"classify-sklearn: {plan['n_jobs']} 个并行任务, 每批 {plan['reads_per_batch']} 条序列")
+            
             # 分类学注释命令
             classify_cmd = [
                 'qiime', 'feature-classifier', 'classify-sklearn',
                 '--i-classifier', str(classifier_qza),
                 '--i-reads', str(rep_seqs_qza),
+                '--p-n-jobs', str(plan['n_jobs']),
+                '--p-reads-per-batch', str(plan['reads_per_batch']),
                 '--o-classification', str(output_dir / 'taxonomy.qza')
             ]
             
@@ -274,11 +350,15 @@ def main():
     parser.add_argument("--metadata", required=True, help="样本元数据文件")
     parser.add_argument("--classifier", help="QIIME2分类器文件(.qza)")
     parser.add_argument("--output", required=True, help="输出目录")
+    parser.add_argument("--threads", type=int, help="DADA2 与分类器使用的线程数 (默认: 全部可用核)")
+    parser.add_argument("--memory-gb", type=float, help="可用内存 GB (默认: 检测当前可用内存)")
+    parser.add_argument("--reads-per-batch", type=int, help="classify-sklearn 每批序列数 (默认: 按内存规划)")
     
     args = parser.parse_args()
     
     # 创建分析器
-    analyzer = AmpliconAnalyzer(args.output)
+    analyzer = AmpliconAnalyzer(args.output, threads=args.threads, memory_gb=args.memory_gb,
+                                reads_per_batch=args.reads_per_batch)
     
     logger.info("开始16S rRNA扩增子分析...")
     
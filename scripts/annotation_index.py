@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 本地功能注释索引
+Local KO/COG/GO Annotation Index
+
+由映射文件一次性构建、以内存映射数组存储的功能注释索引：
+1. 基因ID排序后存为定长字节数组 (genes.npy)，查询时以 searchsorted 向量化匹配
+2. 每种注释类型（ko、cog、cog_category、go、pathway）以 CSR 形式存储
+   基因 -> 注释编码，注释编码对应的ID与名称另存
+3. 注释之间的关系（ko -> pathway、cog -> cog_category）同样以 CSR 存储
+   (link_ 前缀)，查询时向量化展开
+
+支持的输入：
+- eggNOG-mapper 的 .emapper.annotations 结果
+- 两列映射文件（基因<TAB>注释，兼容 KEGG link 输出如 "ko:K00001"）
+- KEGG link/list 平面文件（ko -> pathway，pathway 名称）
+- COG 定义文件 (cog-20.def.tab)
+- Gene Ontology 本体文件 (go-basic.obo)，提供 GO 名称与命名空间
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import re
+import json
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+GENE_KINDS = ('ko', 'cog', 'cog_category', 'go', 'pathway')
+RELATIONS = {'ko_pathway': ('ko', 'pathway'), 'cog_category': ('cog', 'cog_category')}
+
+COG_CATEGORIES = {
+    'J': 'Translation, ribosomal structure and biogenesis',
+    'A': 'RNA processing and modification',
+    'K': 'Transcription',
+    'L': 'Replication, recombination and repair',
+    'B': 'Chromatin structure and dynamics',
+    'D': 'Cell cycle control, cell division, chromosome partitioning',
+    'Y': 'Nuclear structure',
+    'V': 'Defense mechanisms',
+    'T': 'Signal transduction mechanisms',
+    'M': 'Cell wall/membrane/envelope biogenesis',
+    'N': 'Cell motility',
+    'Z': 'Cytoskeleton',
+    'W': 'Extracellular structures',
+    'U': 'Intracellular trafficking, secretion, and vesicular transport',
+    'O': 'Posttranslational modification, protein turnover, chaperones',
+    'C': 'Energy production and conversion',
+    'G': 'Carbohydrate transport and metabolism',
+    'E': 'Amino acid transport and metabolism',
+    'F': 'Nucleotide transport and metabolism',
+    'H': 'Coenzyme transport and metabolism',
+    'I': 'Lipid transport and metabolism',
+    'P': 'Inorganic ion transport and metabolism',
+    'Q': 'Secondary metabolites biosynthesis, transport and catabolism',
+    'R': 'General function prediction only',
+    'S': 'Function unknown'
+}
+
+_COG_ID = re.compile(r'(COG\d{4})')
+
+
+def _normalize_terms(values: pd.Series, kind: str) -> pd.Series:
+    """统一注释ID格式: 去除 KEGG 前缀，通路统一为 ko 前缀"""
+    values = values.astype(str).str.strip()
+    if kind in ('ko', 'pathway'):
+        values = values.str.replace(r'^(ko|path):', '', regex=True)
+    if kind == 'pathway':
+        values = values.str.replace(r'^map', 'ko', regex=True)
+    return values
+
+
+def _explode(ids: pd.Series, values: pd.Series, kind: str, sep: str = ',') -> pd.DataFrame:
+    """将逗号分隔的多值列展开为 (ID, 注释) 对"""
+    pairs = pd.DataFrame({'id': ids.astype(str), 'term': values.astype(str)})
+    if kind == 'cog_category':
+        pairs['term'] = pairs['term'].map(list)
+    else:
+        pairs['term'] = pairs['term'].str.split(sep)
+    pairs = pairs.explode('term')
+    pairs = pairs[pairs['term'].notna() & ~pairs['term'].isin(['', '-', 'nan'])]
+    pairs['term'] = _normalize_terms(pairs['term'], kind)
+    if kind == 'pathway':
+        pairs = pairs[pairs['term'].str.match(r'^ko\d{5}$')]
+    return pairs.drop_duplicates()
+
+
+def read_emapper_annotations(path: str, chunksize: int = 500000) -> Dict[str, pd.DataFrame]:
+    """
+    读取 eggNOG-mapper 注释结果
+
+    Returns:
+        注释类型 -> (基因ID, 注释) 对
+    """
+    columns = {'KEGG_ko': 'ko', 'COG_category': 'cog_category', 'GOs': 'go',
+               'KEGG_Pathway': 'pathway', 'eggNOG_OGs': 'cog'}
+    header_line = 0
+    with open(path) as f:
+        for header_line, line in enumerate(f):
+            if line.startswith('#query'):
+                break
+        else:
+            raise ValueError(f"未找到 eggNOG-mapper 表头 (#query): {path}")
+
+    parts: Dict[str, List[pd.DataFrame]] = {kind: [] for kind in columns.values()}
+    reader = pd.read_csv(path, sep='\t', skiprows=header_line, dtype=str, comment=None,
+                         chunksize=chunksize)
+    for chunk in reader:
+        chunk = chunk[~chunk['#query'].str.startswith('#')]
+        for column, kind in columns.items():
+            if column not in chunk.columns:
+                continue
+            if kind == 'cog':
+                values = chunk[column].fillna('').str.findall(_COG_ID).str.join(',')
+            else:
+                values = chunk[column].fillna('-')
+            parts[kind].append(_explode(chunk['#query'], values, kind))
+    return {kind: pd.concat(frames).drop_duplicates() for kind, frames in parts.items() if frames}
+
+
+def read_mapping_file(path: str, kind: str) -> pd.DataFrame:
+    """读取两列映射文件（第一列ID，第二列注释，可为逗号分隔多值）"""
+    mapping = pd.read_csv(path, sep='\t', header=None, usecols=[0, 1], dtype=str,
+                          comment='#', names=['id', 'term'])
+    ids = mapping['id']
+    if kind == 'ko_pathway':
+        ids = _normalize_terms(ids, 'ko')
+        kind = 'pathway'
+    elif kind == 'cog_category':
+        ids = ids.str.strip()
+    return _explode(ids, mapping['term'], kind)
+
+
+def read_names(path: str, kind: str) -> Dict[str, str]:
+    """读取 ID<TAB>名称 文件（如 KEGG list 输出、COG 定义文件的第1、3列）"""
+    if kind == 'cog':
+        names = pd.read_csv(path, sep='\t', header=None, usecols=[0, 2], dtype=str,
+                            encoding_errors='replace', names=['id', 'name'])
+    else:
+        names = pd.read_csv(path, sep='\t', header=None, usecols=[0, 1], dtype=str,
+                            names=['id', 'name'])
+    ids = _normalize_terms(names['id'], kind)
+    return dict(zip(ids, names['name'].fillna('')))
+
+
+def read_go_obo(path: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    流式读取 GO 本体文件 (go-basic.obo) 的 [Term] 条目
+
+    Returns:
+        (GO ID -> 名称, GO ID -> 命名空间)；alt_id 指向同一条目
+    """
+    names: Dict[str, str] = {}
+    namespaces: Dict[str, str] = {}
+
+    def flush(term):
+        if term.get('id'):
+            for go_id in [term['id']] + term.get('alt_id', []):
+                names[go_id] = term.get('name', '')
+                namespaces[go_id] = term.get('namespace', '')
+
+    term: Dict = {}
+    in_term = False
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('['):
+                flush(term)
+                term, in_term = {}, line == '[Term]'
+            elif in_term and ': ' in line:
+                key, value = line.split(': ', 1)
+                if key == 'alt_id':
+                    term.setdefault('alt_id', []).append(value)
+                elif key in ('id', 'name', 'namespace'):
+                    term[key] = value
+    flush(term)
+    return names, namespaces
+
+
+def _encode_ids(ids: Iterable[str]) -> np.ndarray:
+    """ID 按 UTF-8 编码为定长字节数组（numpy 的 bytes 转换只接受 ASCII）"""
+    encoded = [str(value).encode('utf-8') for value in ids]
+    return np.array(encoded, dtype=bytes) if encoded else np.array([], dtype='S1')
+
+
+def _to_csr(keys: np.ndarray, key_codes: np.ndarray, term_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(键编码, 注释编码) 对 -> CSR (ptr, codes)，键编码须对应排序后的 keys"""
+    order = np.lexsort((term_codes, key_codes))
+    counts = np.bincount(key_codes, minlength=len(keys))
+    ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return ptr, term_codes[order].astype(np.int32)
+
+
+def _expand_csr(ptr: np.ndarray, codes: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化展开 CSR: 对每个输入位置 i，返回其全部注释
+
+    Returns:
+        (输入位置, 注释编码)
+    """
+    starts, ends = ptr[rows], ptr[rows + 1]
+    counts = ends - starts
+    positions = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions, np.asarray(codes[np.repeat(starts, counts) + offsets])
+
+
+class AnnotationIndex:
+    """基于内存映射排序表的本地功能注释索引"""
+
+    def __init__(self, index_dir: str):
+        """
+        打开已构建的注释索引
+
+        Args:
+            index_dir: build() 生成的索引目录
+        """
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "index.json") as f:
+            self.metadata = json.load(f)
+        self.genes = np.load(self.index_dir / "genes.npy", mmap_mode='r')
+        self._terms: Dict[str, np.ndarray] = {}
+        self._names: Dict[str, Dict[str, str]] = {}
+
+    @property
+    def kinds(self) -> List[str]:
+        """索引中包含的基因注释类型"""
+        return self.metadata['kinds']
+
+    @property
+    def relations(self) -> List[str]:
+        """索引中包含的注释关系"""
+        return self.metadata['relations']
+
+    def _load(self, name: str):
+        ptr = np.load(self.index_dir / f"{name}_ptr.npy", mmap_mode='r')
+        codes = np.load(self.index_dir / f"{name}_codes.npy", mmap_mode='r')
+        return ptr, codes
+
+    def terms(self, kind: str) -> np.ndarray:
+        """注释编码 -> 注释ID"""
+        if kind not in self._terms:
+            self._terms[kind] = np.load(self.index_dir / f"{kind}_terms.npy", allow_pickle=False)
+        return self._terms[kind]
+
+    def names(self, kind: str) -> Dict[str, str]:
+        """注释ID -> 名称"""
+        if kind not in self._names:
+            path = self.index_dir / f"{kind}_names.tsv"
+            if path.exists():
+                names = pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+                self._names[kind] = dict(zip(names['id'], names['name']))
+            else:
+                self._names[kind] = {}
+        return self._names[kind]
+
+    def gene_rows(self, gene_ids: Iterable[str]) -> np.ndarray:
+        """向量化查找基因所在行，未收录的基因为 -1"""
+        query = _encode_ids(gene_ids)
+        if len(query) == 0 or len(self.genes) == 0:
+            return np.full(len(query), -1, dtype=np.int64)
+        rows = np.searchsorted(self.genes, query)
+        clipped = np.minimum(rows, len(self.genes) - 1)
+        return np.where(np.asarray(self.genes[clipped]) == query, clipped, -1)
+
+    def lookup(self, gene_ids: Iterable[str], kind: str) -> pd.DataFrame:
+        """
+        批量查询基因注释
+
+        Returns:
+            长格式 DataFrame: gene_id, <kind>
+        """
+        gene_ids = pd.Index([str(gene) for gene in gene_ids])
+        if kind not in self.kinds:
+            return pd.DataFrame({'gene_id': pd.Series(dtype=str), kind: pd.Series(dtype=str)})
+        rows = self.gene_rows(gene_ids)
+        found = np.flatnonzero(rows >= 0)
+        ptr, codes = self._load(kind)
+        positions, term_codes = _expand_csr(ptr, codes, rows[found])
+        return pd.DataFrame({'gene_id': gene_ids[found[positions]],
+                             kind: self.terms(kind)[term_codes].astype(str)})
+
+    def expand(self, term_ids: Iterable[str], relation: str) -> pd.DataFrame:
+        """
+        按注释关系展开（如 ko -> pathway）
+
+        Returns:
+            长格式 DataFrame: <源类型>, <目标类型>
+        """
+        source, target = RELATIONS[relation]
+        term_ids = pd.Index([str(term) for term in term_ids])
+        if relation not in self.relations:
+            return pd.DataFrame({source: pd.Series(dtype=str), target: pd.Series(dtype=str)})
+        source_terms = self.terms(f"link_{relation}_source")
+        rows = np.searchsorted(source_terms, term_ids.to_numpy(dtype=str))
+        clipped = np.minimum(rows, max(len(source_terms) - 1, 0))
+        found = np.flatnonzero((len(source_terms) > 0) & (source_terms[clipped] == term_ids.to_numpy(dtype=str)))
+        ptr, codes = self._load(f"link_{relation}")
+        positions, target_codes = _expand_csr(ptr, codes, clipped[found])
+        return pd.DataFrame({source: term_ids[found[positions]],
+                             target: self.terms(f"link_{relation}_target")[target_codes].astype(str)})
+
+    def annotate(self, gene_ids: Iterable[str], kind: str) -> pd.DataFrame:
+        """
+        查询基因注释，必要时经注释关系推导
+
+        pathway 优先经 ko -> pathway 关系得到（保留对应的 ko），否则使用基因级通路注释；
+        cog_category 优先使用基因级注释，否则经 cog -> cog_category 关系得到。
+
+        Returns:
+            长格式 DataFrame: gene_id, [中间注释], <kind>
+        """
+        gene_ids = list(gene_ids)
+        if kind == 'pathway' and 'ko_pathway' in self.relations:
+            kos = self.lookup(gene_ids, 'ko')
+            links = self.expand(kos['ko'].unique(), 'ko_pathway')
+            return kos.merge(links, on='ko')
+        if kind == 'cog_category' and 'cog_category' not in self.kinds and 'cog_category' in self.relations:
+            cogs = self.lookup(gene_ids, 'cog')
+            links = self.expand(cogs['cog'].unique(), 'cog_category')
+            return cogs.merge(links, on='cog')
+        return self.lookup(gene_ids, kind)
+
+    @classmethod
+    def build(cls, index_dir: str, gene_mappings: Dict[str, pd.DataFrame],
+              relations: Optional[Dict[str, pd.DataFrame]] = None,
+              names: Optional[Dict[str, Dict[str, str]]] = None,
+              sources: Optional[List[str]] = None) -> "AnnotationIndex":
+        """
+        构建注释索引
+
+        Args:
+            index_dir: 输出目录
+            gene_mappings: 注释类型 -> (id, term) 基因注释对
+            relations: 关系名称 ('ko_pathway', 'cog_category') -> (id, term) 对
+            names: 注释类型 -> {ID: 名称}
+            sources: 记录在元数据中的输入文件
+
+        Returns:
+            构建完成的索引
+        """
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        relations = relations or {}
+        names = dict(names or {})
+        names.setdefault('cog_category', COG_CATEGORIES)
+
+        all_genes = pd.Index(pd.concat([pairs['id'] for pairs in gene_mappings.values()])
+                             if gene_mappings else [], dtype=str).unique()
+        genes = np.sort(_encode_ids(all_genes))
+        np.save(index_dir / "genes.npy", genes)
+        gene_lookup = pd.Index([gene.decode('utf-8') for gene in genes.tolist()], dtype=object)
+
+        kinds = []
+        for kind, pairs in gene_mappings.items():
+            if kind not in GENE_KINDS or pairs.empty:
+                continue
+            term_codes, terms = pd.factorize(pairs['term'], sort=True)
+            ptr, codes = _to_csr(genes, gene_lookup.get_indexer(pairs['id']), term_codes)
+            np.save(index_dir / f"{kind}_ptr.npy", ptr)
+            np.save(index_dir / f"{kind}_codes.npy", codes)
+            np.save(index_dir / f"{kind}_terms.npy", np.asarray(terms, dtype=str))
+            kinds.append(kind)
+            logger.info(f"{kind}: {len(pairs)} 条基因注释, {len(terms)} 个注释ID")
+
+        relation_names = []
+        for relation, pairs in relations.items():
+            if relation not in RELATIONS or pairs.empty:
+                continue
+            source_codes, source_terms = pd.factorize(pairs['id'], sort=True)
+            target_codes, target_terms = pd.factorize(pairs['term'], sort=True)
+            ptr, codes = _to_csr(source_terms, source_codes, target_codes)
+            np.save(index_dir / f"link_{relation}_ptr.npy", ptr)
+            np.save(index_dir / f"link_{relation}_codes.npy", codes)
+            np.save(index_dir / f"link_{relation}_source_terms.npy", np.asarray(source_terms, dtype=str))
+            np.save(index_dir / f"link_{relation}_target_terms.npy", np.asarray(target_terms, dtype=str))
+            relation_names.append(relation)
+            logger.info(f"{relation}: {len(pairs)} 条关系")
+
+        for kind, mapping in names.items():
+            if mapping:
+                pd.DataFrame({'id': list(mapping), 'name': list(mapping.values())}).to_csv(
+                    index_dir / f"{kind}_names.tsv", sep='\t', index=False)
+
+        with open(index_dir / "index.json", 'w') as f:
+            json.dump({'kinds': kinds, 'relations': relation_names, 'n_genes': int(len(genes)),
+                       'sources': sources or []}, f, indent=2)
+        logger.info(f"注释索引构建完成: {len(genes)} 个基因 -> {index_dir}")
+        return cls(str(index_dir))
+
+
+def build_from_files(index_dir: str, emapper: Optional[str] = None,
+                     gene_ko: Optional[str] = None, gene_cog: Optional[str] = None,
+                     gene_go: Optional[str] = None, ko_pathway: Optional[str] = None,
+                     pathway_names: Optional[str] = None, ko_names: Optional[str] = None,
+                     cog_definitions: Optional[str] = None,
+                     go_obo: Optional[str] = None) -> AnnotationIndex:
+    """由映射文件构建注释索引（各输入均可选）"""
+    gene_mappings: Dict[str, List[pd.DataFrame]] = {}
+    if emapper:
+        for kind, pairs in read_emapper_annotations(emapper).items():
+            gene_mappings.setdefault(kind, []).append(pairs)
+    for path, kind in ((gene_ko, 'ko'), (gene_cog, 'cog'), (gene_go, 'go')):
+        if path:
+            gene_mappings.setdefault(kind, []).append(read_mapping_file(path, kind))
+
+    relations, names = {}, {}
+    if ko_pathway:
+        relations['ko_pathway'] = read_mapping_file(ko_pathway, 'ko_pathway').drop_duplicates()
+    if pathway_names:
+        names['pathway'] = read_names(pathway_names, 'pathway')
+    if ko_names:
+        names['ko'] = read_names(ko_names, 'ko')
+    if cog_definitions:
+        definitions = pd.read_csv(cog_definitions, sep='\t', header=None, usecols=[0, 1], dtype=str,
+                                  encoding_errors='replace', names=['id', 'term'])
+        relations['cog_category'] = _explode(definitions['id'], definitions['term'].fillna('-'),
+                                             'cog_category')
+        names['cog'] = read_names(cog_definitions, 'cog')
+    if go_obo:
+        names['go'], names['go_namespace'] = read_go_obo(go_obo)
+
+    sources = [str(path) for path in (emapper, gene_ko, gene_cog, gene_go, ko_pathway,
+                                      pathway_names, ko_names, cog_definitions, go_obo) if path]
+    return AnnotationIndex.build(
+        index_dir, {kind: pd.concat(frames).drop_duplicates() for kind, frames in gene_mappings.items()},
+        relations, names, sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MICOS-2024 构建本地功能注释索引")
+    parser.add_argument("--output", required=True, help="索引输出目录")
+    parser.add_argument("--emapper", help="eggNOG-mapper 注释结果 (.emapper.annotations)")
+    parser.add_argument("--gene-ko", help="基因 -> KO 映射文件")
+    parser.add_argument("--gene-cog", help="基因 -> COG 映射文件")
+    parser.add_argument("--gene-go", help="基因 -> GO 映射文件")
+    parser.add_argument("--ko-pathway", help="KO -> 通路映射 (KEGG link 格式)")
+    parser.add_argument("--pathway-names", help="通路名称 (KEGG list 格式)")
+    parser.add_argument("--ko-names", help="KO 定义 (KEGG list 格式)")
+    parser.add_argument("--cog-definitions", help="COG 定义文件 (cog-20.def.tab)")
+    parser.add_argument("--go-obo", help="GO 本体文件 (go-basic.obo)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    build_from_files(args.output, args.emapper, args.gene_ko, args.gene_cog, args.gene_go,
+                     args.ko_pathway, args.pathway_names, args.ko_names, args.cog_definitions,
+                     args.go_obo)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,25 +22,44 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from collections import defaultdict, Counter
 import requests
 import json
+import yaml
 import subprocess
 
+from annotation_index import AnnotationIndex
+from pathway_enrichment import pathway_enrichment
+from kegg_client import KEGGClient
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+MISSING_INDEX_MESSAGE = ("未提供注释索引 (--annotation-index 或配置 functional_annotation.annotation_index)，"
+                         "请先使用 annotation_index.py 构建，例如: python scripts/annotation_index.py "
+                         "--output <索引目录> --emapper <.emapper.annotations>")
+
 class FunctionalAnnotator:
     """功能注释分析类"""
     
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, annotation_index=None, use_kegg_api=False, kegg_cache_dir=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # 本地功能注释索引（目录路径或 AnnotationIndex 实例）
+        if isinstance(annotation_index, (str, Path)):
+            annotation_index = AnnotationIndex(str(annotation_index))
+        self.annotation_index = annotation_index
+        
         # KEGG API基础URL
         self.kegg_api_base = "http://rest.kegg.jp"
         
+        # 在线 KEGG 客户端：补充本地索引缺少的 KO -> 通路关系与名称（响应缓存到磁盘）
+        self.kegg_client = None
+        if use_kegg_api:
+            self.kegg_client = KEGGClient(self.kegg_api_base,
+                                          cache_dir=kegg_cache_dir or self.output_dir / "kegg_cache")
+        
         # COG功能分类
         self.cog_categories = {
             'J': 'Translation, ribosomal structure and biogenesis',
@@ -70,58 +89,65 @@ class FunctionalAnnotator:
             'S': 'Function unknown'
         }
     
+    def _read_gene_list(self, gene_list_file):
+        """读取基因列表（每行一个基因ID，去重并保持顺序）"""
+        genes = pd.read_csv(gene_list_file, header=None, usecols=[0], dtype=str,
+                            skip_blank_lines=True)[0].str.strip()
+        return genes[genes.notna() & (genes != '')].drop_duplicates().tolist()
+    
+    def _kegg_names(self, database):
+        """在线获取 KEGG 数据库条目名称（ID 去除前缀，通路统一为 ko 前缀）"""
+        names = pd.Series(self.kegg_client.list(database))
+        ids = names.index.str.replace(r'^[a-z]+:', '', regex=True)
+        if database == 'pathway':
+            ids = ids.str.replace(r'^map', 'ko', regex=True)
+        return dict(zip(ids, names.to_numpy()))
+    
     def annotate_kegg_pathways(self, gene_list_file, output_file):
-        """KEGG通路注释"""
+        """KEGG通路注释（基因 -> KO -> 通路，基于本地注释索引）"""
         logger.info("开始KEGG通路注释...")
         
         try:
-            # 读取基因列表
-            with open(gene_list_file, 'r') as f:
-                genes = [line.strip() for line in f if line.strip()]
-            
-            # 模拟KEGG注释结果（实际应调用KEGG API）
-            kegg_annotations = []
-            
-            # 模拟一些常见的代谢通路
-            pathways = [
-                ('ko00010', 'Glycolysis / Gluconeogenesis'),
-                ('ko00020', 'Citrate cycle (TCA cycle)'),
-                ('ko00030', 'Pentose phosphate pathway'),
-                ('ko00040', 'Pentose and glucuronate interconversions'),
-                ('ko00051', 'Fructose and mannose metabolism'),
-                ('ko00052', 'Galactose metabolism'),
-                ('ko00053', 'Ascorbate and aldarate metabolism'),
-                ('ko00061', 'Fatty acid biosynthesis'),
-                ('ko00071', 'Fatty acid degradation'),
-                ('ko00190', 'Oxidative phosphorylation'),
-                ('ko00220', 'Arginine biosynthesis'),
-                ('ko00230', 'Purine metabolism'),
-                ('ko00240', 'Pyrimidine metabolism'),
-                ('ko00250', 'Alanine, aspartate and glutamate metabolism'),
-                ('ko00260', 'Glycine, serine and threonine metabolism')
-            ]
-            
-            # 为每个基因随机分配通路
-            for i, gene in enumerate(genes[:100]):  # 限制前100个基因
-                # 随机选择1-3个通路
-                selected_pathways = np.random.choice(len(pathways), 
-                                                   size=np.random.randint(1, 4), 
-                                                   replace=False)
-                
-                for pathway_idx in selected_pathways:
-                    pathway_id, pathway_name = pathways[pathway_idx]
-                    kegg_annotations.append({
-                        'gene_id': gene,
-                        'pathway_id': pathway_id,
-                        'pathway_name': pathway_name,
-                        'ko_id': f'K{i:05d}',
-                        'definition': f'Hypothetical protein {gene}'
-                    })
+            if self.annotation_index is None:
+                raise ValueError(MISSING_INDEX_MESSAGE)
+            
+            genes = self._read_gene_list(gene_list_file)
+            index = self.annotation_index
+            columns = ['gene_id', 'pathway_id', 'pathway_name', 'ko_id', 'definition']
+            
+            if 'ko_pathway' in index.relations:
+                kegg_df = index.annotate(genes, 'pathway').rename(
+                    columns={'ko': 'ko_id', 'pathway': 'pathway_id'})
+            elif self.kegg_client is not None:
+                kos = index.lookup(genes, 'ko')
+                links = self.kegg_client.link('pathway', 'ko:' + kos['ko'].unique())
+                links = pd.DataFrame({
+                    'ko_id': links['source'].str.replace(r'^ko:', '', regex=True),
+                    'pathway_id': links['target'].str.replace(r'^path:', '', regex=True)
+                                                 .str.replace(r'^map', 'ko', regex=True)
+                }).drop_duplicates()
+                kegg_df = kos.rename(columns={'ko': 'ko_id'}).merge(links, on='ko_id')
+            else:
+                # 无 KO -> 通路关系时使用基因级通路注释，ko_id 为该基因的全部 KO
+                kegg_df = index.lookup(genes, 'pathway').rename(columns={'pathway': 'pathway_id'})
+                gene_kos = index.lookup(genes, 'ko').groupby('gene_id')['ko'].agg(','.join)
+                kegg_df['ko_id'] = kegg_df['gene_id'].map(gene_kos).fillna('')
+            
+            pathway_names = index.names('pathway')
+            ko_names = index.names('ko')
+            if self.kegg_client is not None:
+                if not kegg_df['pathway_id'].isin(list(pathway_names)).all():
+                    pathway_names = {**self._kegg_names('pathway'), **pathway_names}
+                if not kegg_df['ko_id'].isin(list(ko_names)).all():
+                    ko_names = {**self._kegg_names('ko'), **ko_names}
+            kegg_df['pathway_name'] = kegg_df['pathway_id'].map(pathway_names).fillna(kegg_df['pathway_id'])
+            kegg_df['definition'] = kegg_df['ko_id'].map(ko_names).fillna('')
+            kegg_df = kegg_df.reindex(columns=columns)
             
             # 保存注释结果
-            kegg_df = pd.DataFrame(kegg_annotations)
             kegg_df.to_csv(output_file, index=False)
             
+            logger.info(f"{kegg_df['gene_id'].nunique()}/{len(genes)} 个基因获得KEGG通路注释")
             logger.info(f"KEGG注释完成，结果保存到: {output_file}")
             return kegg_df
             
@@ -129,51 +155,31 @@ class FunctionalAnnotator:
             logger.error(f"KEGG注释失败: {e}")
             return None
     
-    def analyze_kegg_enrichment(self, kegg_annotations, abundance_data, output_file):
-        """KEGG通路富集分析"""
+    def analyze_kegg_enrichment(self, kegg_annotations, abundance_data, output_file,
+                                foreground_genes=None, foreground_quantile=0.9):
+        """
+        KEGG通路富集分析
+        
+        通路 × 基因 稀疏指示矩阵与丰度矩阵相乘得到各样本的通路丰度（另存为
+        <输出文件名>_per_sample.csv），并对全部通路做超几何富集检验及 BH 校正。
+        前景基因默认取平均丰度位于 foreground_quantile 分位以上的基因。
+        """
         logger.info("进行KEGG通路富集分析...")
         
         try:
             # 读取丰度数据
             abundance_df = pd.read_csv(abundance_data, index_col=0)
             
-            # 计算每个通路的总丰度
-            pathway_abundance = defaultdict(float)
-            pathway_gene_count = defaultdict(int)
-            
-            for _, row in kegg_annotations.iterrows():
-                gene_id = row['gene_id']
-                pathway_id = row['pathway_id']
-                pathway_name = row['pathway_name']
-                
-                if gene_id in abundance_df.index:
-                    # 计算该基因在所有样本中的平均丰度
-                    avg_abundance = abundance_df.loc[gene_id].mean()
-                    pathway_abundance[f"{pathway_id}|{pathway_name}"] += avg_abundance
-                    pathway_gene_count[f"{pathway_id}|{pathway_name}"] += 1
-            
-            # 创建富集结果表
-            enrichment_results = []
-            for pathway, total_abundance in pathway_abundance.items():
-                pathway_id, pathway_name = pathway.split('|', 1)
-                gene_count = pathway_gene_count[pathway]
-                avg_abundance_per_gene = total_abundance / gene_count if gene_count > 0 else 0
-                
-                enrichment_results.append({
-                    'pathway_id': pathway_id,
-                    'pathway_name': pathway_name,
-                    'gene_count': gene_count,
-                    'total_abundance': total_abundance,
-                    'avg_abundance_per_gene': avg_abundance_per_gene
-                })
-            
-            # 转换为DataFrame并排序
-            enrichment_df = pd.DataFrame(enrichment_results)
-            enrichment_df = enrichment_df.sort_values('total_abundance', ascending=False)
+            enrichment_df, per_sample = pathway_enrichment(
+                kegg_annotations, abundance_df, foreground_genes, foreground_quantile)
             
             # 保存结果
+            output_file = Path(output_file)
             enrichment_df.to_csv(output_file, index=False)
+            per_sample.to_csv(output_file.with_name(f"{output_file.stem}_per_sample.csv"))
             
+            n_significant = int((enrichment_df['q_value'] <= 0.05).sum())
+            logger.info(f"{len(enrichment_df)} 个通路中 {n_significant} 个显著富集 (q <= 0.05)")
             logger.info(f"KEGG富集分析完成，结果保存到: {output_file}")
             return enrichment_df
             
@@ -182,36 +188,32 @@ class FunctionalAnnotator:
             return None
     
     def annotate_cog_functions(self, gene_list_file, output_file):
-        """COG功能分类注释"""
+        """COG功能分类注释（基于本地注释索引）"""
         logger.info("开始COG功能分类注释...")
         
         try:
-            # 读取基因列表
-            with open(gene_list_file, 'r') as f:
-                genes = [line.strip() for line in f if line.strip()]
-            
-            # 模拟COG注释
-            cog_annotations = []
-            cog_categories = list(self.cog_categories.keys())
-            
-            for gene in genes[:100]:  # 限制前100个基因
-                # 随机分配COG分类
-                selected_cogs = np.random.choice(cog_categories, 
-                                               size=np.random.randint(1, 3), 
-                                               replace=False)
-                
-                for cog_cat in selected_cogs:
-                    cog_annotations.append({
-                        'gene_id': gene,
-                        'cog_category': cog_cat,
-                        'cog_description': self.cog_categories[cog_cat],
-                        'cog_id': f'COG{np.random.randint(1000, 9999)}'
-                    })
+            if self.annotation_index is None:
+                raise ValueError(MISSING_INDEX_MESSAGE)
+            
+            genes = self._read_gene_list(gene_list_file)
+            index = self.annotation_index
+            
+            if 'cog_category' in index.kinds:
+                # eggNOG-mapper 结果的分类为基因级注释，cog_id 为该基因的全部 COG
+                cog_df = index.lookup(genes, 'cog_category')
+                gene_cogs = index.lookup(genes, 'cog').groupby('gene_id')['cog'].agg(','.join)
+                cog_df['cog'] = cog_df['gene_id'].map(gene_cogs).fillna('')
+            else:
+                cog_df = index.annotate(genes, 'cog_category')
+            
+            cog_df = cog_df.rename(columns={'cog': 'cog_id'})
+            cog_df['cog_description'] = cog_df['cog_category'].map(self.cog_categories).fillna('')
+            cog_df = cog_df.reindex(columns=['gene_id', 'cog_category', 'cog_description', 'cog_id'])
             
             # 保存注释结果
-            cog_df = pd.DataFrame(cog_annotations)
             cog_df.to_csv(output_file, index=False)
             
+            logger.info(f"{cog_df['gene_id'].nunique()}/{len(genes)} 个基因获得COG注释")
             logger.info(f"COG注释完成，结果保存到: {output_file}")
             return cog_df
             
@@ -306,11 +308,26 @@ def main():
     parser.add_argument("--genes", required=True, help="基因列表文件")
     parser.add_argument("--abundance", required=True, help="基因丰度表文件")
     parser.add_argument("--output", required=True, help="输出目录")
+    parser.add_argument("--annotation-index",
+                        help="本地功能注释索引目录 (由 annotation_index.py 构建)")
+    parser.add_argument("--config", help="配置文件，未指定 --annotation-index 时读取 functional_annotation.annotation_index")
+    parser.add_argument("--kegg-api", action="store_true",
+                        help="使用 KEGG REST API 补充本地索引缺少的通路关系与名称")
+    parser.add_argument("--kegg-cache", help="KEGG API 响应缓存目录 (默认: <输出目录>/kegg_cache)")
     
     args = parser.parse_args()
     
+    annotation_index = args.annotation_index
+    if not annotation_index and args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        annotation_index = config.get('functional_annotation', {}).get('annotation_index') or None
+    if not annotation_index:
+        logger.warning(MISSING_INDEX_MESSAGE)
+    
     # 创建注释器
-    annotator = FunctionalAnnotator(args.output)
+    annotator = FunctionalAnnotator(args.output, annotation_index=annotation_index,
+                                    use_kegg_api=args.kegg_api, kegg_cache_dir=args.kegg_cache)
     
     # 定义输出文件路径
     kegg_file = annotator.output_dir / "kegg_annotations.csv"
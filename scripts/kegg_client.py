@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 KEGG REST 客户端
+Batched, Cached KEGG REST Client
+
+面向批量注释的 KEGG REST API 客户端：
+1. get/link 请求按 API 上限每批最多 10 个ID合并
+2. 通过 requests.Session 复用连接池
+3. 多个批次在线程池中并发请求，由全局速率限制器控制请求频率
+4. get/link 结果按单个ID写入磁盘缓存并设置有效期，先查缓存、只对未命中的ID分批请求，
+   增删或重排ID不影响其余ID的缓存；重复运行不再访问网络（未找到的ID同样缓存）
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# KEGG get/link 每次请求的最大ID数
+MAX_IDS_PER_REQUEST = 10
+
+
+class RateLimiter:
+    """线程安全的最小请求间隔限制器"""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """阻塞直到允许发出下一个请求"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _entry_id(entry_text: str) -> Optional[str]:
+    """KEGG 平面格式条目的 ENTRY 字段ID"""
+    for line in entry_text.splitlines():
+        if line.startswith('ENTRY'):
+            fields = line.split()
+            return fields[1] if len(fields) > 1 else None
+    return None
+
+
+def _bare_id(kegg_id: str) -> str:
+    """去除数据库前缀 (如 ko:K00001 -> K00001, path:map00010 -> map00010)"""
+    return kegg_id.split(':', 1)[-1]
+
+
+class KEGGClient:
+    """批量、缓存的 KEGG REST 客户端"""
+
+    def __init__(self, base_url: str = "http://rest.kegg.jp", cache_dir: Optional[str] = None,
+                 cache_ttl: float = 30 * 24 * 3600, max_workers: int = 3,
+                 requests_per_second: float = 3.0, batch_size: int = MAX_IDS_PER_REQUEST,
+                 timeout: float = 60.0, retries: int = 3):
+        """
+        初始化 KEGG 客户端
+
+        Args:
+            base_url: KEGG REST API 地址
+            cache_dir: 响应缓存目录，为空时不缓存
+            cache_ttl: 缓存有效期（秒）
+            max_workers: 并发请求数
+            requests_per_second: 全局请求频率上限
+            batch_size: 每次 get/link 请求的ID数（不超过 10）
+            timeout: 单次请求超时（秒）
+            retries: 连接错误与 5xx/429 响应的重试次数
+        """
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_ttl = cache_ttl
+        self.max_workers = max(1, int(max_workers))
+        self.batch_size = max(1, min(int(batch_size), MAX_IDS_PER_REQUEST))
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.n_requests = 0
+        self._count_lock = threading.Lock()
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _cache_path(self, path: str) -> Optional[Path]:
+        if not self.cache_dir:
+            return None
+        digest = hashlib.sha1(f"{self.base_url}/{path}".encode()).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.txt"
+
+    def _cache_read(self, key: str) -> Optional[str]:
+        """读取未过期的缓存，未命中时返回 None"""
+        cache_path = self._cache_path(key)
+        if cache_path and cache_path.exists() and time.time() - cache_path.stat().st_mtime < self.cache_ttl:
+            return cache_path.read_text()
+        return None
+
+    def _cache_write(self, key: str, text: str):
+        cache_path = self._cache_path(key)
+        if cache_path:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+            temp_path.write_text(text)
+            temp_path.replace(cache_path)
+
+    def _request(self, path: str, cached: bool = True) -> str:
+        """
+        请求单个 API 路径（cached 为真时优先读取并写入缓存）
+
+        Returns:
+            响应文本，404 时为空字符串
+        """
+        if cached:
+            text = self._cache_read(path)
+            if text is not None:
+                return text
+
+        self.rate_limiter.wait()
+        response = self.session.get(f"{self.base_url}/{path}", timeout=self.timeout)
+        with self._count_lock:
+            self.n_requests += 1
+        if response.status_code == 404:
+            text = ''
+        else:
+            response.raise_for_status()
+            text = response.text
+
+        if cached:
+            self._cache_write(path, text)
+        return text
+
+    def _batches(self, ids: Iterable[str]) -> List[List[str]]:
+        unique = list(dict.fromkeys(str(kegg_id) for kegg_id in ids))
+        return [unique[i:i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+
+    def _run(self, paths: List[str], cached: bool = True) -> List[str]:
+        """并发请求多个路径，结果与输入顺序一致"""
+        if len(paths) <= 1 or self.max_workers == 1:
+            return [self._request(path, cached) for path in paths]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._request, paths, [cached] * len(paths)))
+
+    def _fetch_per_id(self, prefix: str, ids: Iterable[str],
+                      split: Callable[[List[str], str], Dict[str, str]]) -> Dict[str, str]:
+        """
+        按ID缓存的批量请求：先逐ID读取缓存，仅对未命中的ID分批请求
+
+        Args:
+            prefix: API 路径前缀（如 'get/'、'link/pathway/'），与ID拼接为缓存键
+            split: (批内ID, 响应文本) -> {ID: 该ID的响应片段}，未找到的ID为空字符串
+
+        Returns:
+            ID -> 响应片段（按首次出现顺序，未找到为空字符串）
+        """
+        unique = list(dict.fromkeys(str(kegg_id) for kegg_id in ids))
+        results = {}
+        for kegg_id in unique:
+            text = self._cache_read(prefix + kegg_id)
+            if text is not None:
+                results[kegg_id] = text
+        batches = self._batches(kegg_id for kegg_id in unique if kegg_id not in results)
+        responses = self._run([prefix + '+'.join(batch) for batch in batches], cached=False)
+        for batch, text in zip(batches, responses):
+            parts = split(batch, text)
+            for kegg_id in batch:
+                results[kegg_id] = parts.get(kegg_id, '')
+                self._cache_write(prefix + kegg_id, results[kegg_id])
+        return {kegg_id: results[kegg_id] for kegg_id in unique}
+
+    def get(self, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        批量获取条目 (/get)
+
+        Returns:
+            请求ID -> 条目文本；未找到的ID不出现在结果中
+        """
+        def split(batch: List[str], text: str) -> Dict[str, str]:
+            by_entry = {}
+            for block in text.split('///'):
+                block = block.strip('\n')
+                entry_id = _entry_id(block) if block.strip() else None
+                if entry_id:
+                    by_entry[entry_id] = block + '\n///\n'
+            return {kegg_id: by_entry.get(_bare_id(kegg_id), '') for kegg_id in batch}
+
+        fetched = self._fetch_per_id('get/', ids, split)
+        entries = {kegg_id: text for kegg_id, text in fetched.items() if text}
+        logger.info(f"KEGG get: {len(entries)}/{len(fetched)} 个条目")
+        return entries
+
+    def link(self, target_db: str, ids: Iterable[str]) -> pd.DataFrame:
+        """
+        批量查询交叉引用 (/link/<target_db>/<ids>)
+
+        Returns:
+            DataFrame: source, target（保留 KEGG 前缀）
+        """
+        def split(batch: List[str], text: str) -> Dict[str, str]:
+            by_source: Dict[str, List[str]] = {}
+            for line in text.splitlines():
+                if '\t' in line:
+                    by_source.setdefault(_bare_id(line.split('\t', 1)[0]), []).append(line + '\n')
+            return {kegg_id: ''.join(by_source.get(_bare_id(kegg_id), [])) for kegg_id in batch}
+
+        rows = []
+        for text in self._fetch_per_id(f"link/{target_db}/", ids, split).values():
+            rows.extend(line.split('\t')[:2] for line in text.splitlines() if '\t' in line)
+        return pd.DataFrame(rows, columns=['source', 'target'])
+
+    def list(self, database: str) -> Dict[str, str]:
+        """
+        获取数据库条目列表 (/list/<database>)
+
+        Returns:
+            条目ID -> 名称
+        """
+        names = {}
+        for line in self._request(f"list/{database}").splitlines():
+            if '\t' in line:
+                kegg_id, name = line.split('\t', 1)
+                names[kegg_id] = name
+        return names
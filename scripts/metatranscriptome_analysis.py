@@ -24,10 +24,13 @@ import numpy as np
 from pathlib import Path
 import subprocess
 import yaml
-from typing import Dict, List
+from typing import Dict, List, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
+from annotation_index import AnnotationIndex
+from nb_differential import differential_expression
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -38,15 +41,18 @@ logger = logging.getLogger(__name__)
 class MetatranscriptomeAnalyzer:
     """宏转录组数据分析器"""
     
-    def __init__(self, config_file: str, output_dir: str):
+    def __init__(self, config_file: str, output_dir: str, annotation_index=None):
         """
         初始化分析器
         
         Args:
             config_file: 配置文件路径
             output_dir: 输出目录路径
+            annotation_index: 本地注释索引（目录路径或 AnnotationIndex 实例），
+                默认读取配置中的 annotation_index
         """
         self.config_file = config_file
+        self.annotation_index = annotation_index
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
@@ -128,110 +134,207 @@ class MetatranscriptomeAnalyzer:
         
         return qc_results
     
-    def run_functional_annotation(self, gene_expression_file: str) -> Dict[str, str]:
+    def run_functional_annotation(self, gene_expression_file: str,
+                                  chunk_size: int = 200000) -> Optional[Dict[str, str]]:
         """
         运行功能基因注释
         
+        流式读取一次表达文件的基因ID列，每个基因块与本地注释索引连接，
+        KEGG / GO / COG 注释在同一遍读取中追加写出。
+        
         Args:
-            gene_expression_file: 基因表达文件路径
+            gene_expression_file: 基因表达文件路径（制表符分隔，第一列为基因ID）
+            chunk_size: 每次读取的基因数
             
         Returns:
-            功能注释结果文件路径字典
+            功能注释结果文件路径字典；全部注释类型均未启用时为空字典，失败时为 None
         """
         logger.info("开始功能基因注释...")
         
-        annotation_results = {}
-        
-        # KEGG注释
-        kegg_results = self._run_kegg_annotation(gene_expression_file)
-        annotation_results['kegg'] = kegg_results
-        
-        # GO注释
-        go_results = self._run_go_annotation(gene_expression_file)
-        annotation_results['go'] = go_results
-        
-        return annotation_results
-    
-    def _run_kegg_annotation(self, gene_expression_file: str) -> str:
-        """运行KEGG功能注释"""
-        logger.info("运行KEGG功能注释...")
-        
-        kegg_dir = self.annotation_dir / "kegg"
-        kegg_dir.mkdir(exist_ok=True)
-        
-        # 读取基因表达数据
         try:
-            df = pd.read_csv(gene_expression_file, sep='\t', index_col=0)
-            genes = df.index.tolist()
+            index = self._get_annotation_index()
+            functional_config = self.config.get('metatranscriptome_analysis', {}).get('functional_analysis', {})
+            annotators = {}
+            if functional_config.get('kegg_pathway', True):
+                annotators['kegg'] = self._run_kegg_annotation
+            if functional_config.get('go_enrichment', True):
+                annotators['go'] = self._run_go_annotation
+            if 'cog' in index.kinds or 'cog_category' in index.kinds:
+                annotators['cog'] = self._run_cog_annotation
+            if not annotators:
+                logger.warning("KEGG 与 GO 注释均已禁用，注释索引中也没有 COG 注释，跳过功能注释")
+                return {}
             
-            # 创建模拟注释结果
-            kegg_annotation = pd.DataFrame({
-                'gene_id': genes[:100],  # 限制数量
-                'kegg_id': [f"K{i:05d}" for i in range(100)],
-                'pathway': [f"Pathway_{i}" for i in range(100)],
-                'description': [f"KEGG function {i}" for i in range(100)]
-            })
+            output_files = {}
+            for name in annotators:
+                annotation_dir = self.annotation_dir / name
+                annotation_dir.mkdir(exist_ok=True)
+                output_files[name] = annotation_dir / f"{name}_annotation.tsv"
             
-            output_file = kegg_dir / "kegg_annotation.tsv"
-            kegg_annotation.to_csv(output_file, sep='\t', index=False)
+            n_genes = 0
+            annotated = {name: 0 for name in annotators}
+            reader = pd.read_csv(gene_expression_file, sep='\t', usecols=[0], dtype=str,
+                                 chunksize=chunk_size)
+            for chunk_number, chunk in enumerate(reader):
+                genes = chunk.iloc[:, 0].dropna().str.strip()
+                genes = genes[genes != ''].tolist()
+                n_genes += len(genes)
+                for name, annotate in annotators.items():
+                    rows = annotate(index, genes)
+                    annotated[name] += rows['gene_id'].nunique()
+                    rows.to_csv(output_files[name], sep='\t', index=False,
+                                mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
             
-            logger.info(f"KEGG注释完成: {output_file}")
-            return str(output_file)
+            for name, output_file in output_files.items():
+                logger.info(f"{name.upper()}注释完成: {annotated[name]}/{n_genes} 个基因获得注释 -> {output_file}")
+            return {name: str(path) for name, path in output_files.items()}
             
         except Exception as e:
-            logger.error(f"KEGG注释失败: {e}")
-            return ""
+            logger.error(f"功能注释失败: {e}")
+            return None
+    
+    def _get_annotation_index(self) -> AnnotationIndex:
+        """打开本地注释索引（与 functional_annotation.py 共用）"""
+        if self.annotation_index is None:
+            config = self.config or {}
+            path = (config.get('metatranscriptome_analysis', {}).get('functional_analysis', {})
+                    .get('annotation_index') or config.get('functional_annotation', {}).get('annotation_index'))
+            if not path:
+                raise ValueError("未提供注释索引，请先使用 annotation_index.py 构建")
+            self.annotation_index = path
+        if not isinstance(self.annotation_index, AnnotationIndex):
+            self.annotation_index = AnnotationIndex(str(self.annotation_index))
+        return self.annotation_index
+    
+    def _run_kegg_annotation(self, index: AnnotationIndex, genes: List[str]) -> pd.DataFrame:
+        """基因块的KEGG注释：基因 -> KO -> 通路（无通路的KO保留一行）"""
+        kegg = index.lookup(genes, 'ko').rename(columns={'ko': 'kegg_id'})
+        if 'ko_pathway' in index.relations:
+            links = index.expand(kegg['kegg_id'].unique(), 'ko_pathway').rename(
+                columns={'ko': 'kegg_id'})
+            kegg = kegg.merge(links, on='kegg_id', how='left')
+        else:
+            kegg = kegg.merge(index.lookup(genes, 'pathway'), on='gene_id', how='left')
+        kegg['pathway'] = kegg['pathway'].fillna('')
+        kegg['pathway_name'] = kegg['pathway'].map(index.names('pathway')).fillna('')
+        kegg['description'] = kegg['kegg_id'].map(index.names('ko')).fillna('')
+        return kegg[['gene_id', 'kegg_id', 'pathway', 'pathway_name', 'description']]
     
-    def _run_go_annotation(self, gene_expression_file: str) -> str:
-        """运行GO功能注释"""
-        logger.info("运行GO功能注释...")
+    def _run_go_annotation(self, index: AnnotationIndex, genes: List[str]) -> pd.DataFrame:
+        """基因块的GO注释"""
+        go = index.lookup(genes, 'go').rename(columns={'go': 'go_id'})
+        go['namespace'] = go['go_id'].map(index.names('go_namespace')).fillna('')
+        go['description'] = go['go_id'].map(index.names('go')).fillna('')
+        return go[['gene_id', 'go_id', 'namespace', 'description']]
+    
+    def _run_cog_annotation(self, index: AnnotationIndex, genes: List[str]) -> pd.DataFrame:
+        """基因块的COG功能分类注释"""
+        cog = index.annotate(genes, 'cog_category')
+        if 'cog' not in cog.columns:
+            cog['cog'] = ''
+        cog['category_name'] = cog['cog_category'].map(index.names('cog_category')).fillna('')
+        return cog[['gene_id', 'cog', 'cog_category', 'category_name']].rename(columns={'cog': 'cog_id'})
+    
+    def run_differential_expression(self, count_file: str, metadata_file: str,
+                                    condition_column: str = 'condition',
+                                    reference: Optional[str] = None,
+                                    test: Optional[str] = None) -> Dict[str, str]:
+        """
+        运行负二项差异表达分析
+        
+        Args:
+            count_file: 基因 × 样本计数表（制表符分隔，第一列为基因ID）
+            metadata_file: 样本信息表（制表符分隔，第一列为样本名）
+            condition_column: 分组列名
+            reference: 参照组（默认为第一个出现的分组）
+            test: 比较组（默认为第一个非参照分组）
+            
+        Returns:
+            差异表达结果文件路径字典
+        """
+        logger.info("开始差异表达分析...")
         
-        go_dir = self.annotation_dir / "go"
-        go_dir.mkdir(exist_ok=True)
+        de_config = self.config.get('metatranscriptome_analysis', {}).get('differential_expression', {})
+        alpha = de_config.get('alpha', 0.05)
+        fold_change_threshold = de_config.get('fold_change_threshold', 2.0)
         
-        # 创建模拟GO注释结果
         try:
-            df = pd.read_csv(gene_expression_file, sep='\t', index_col=0)
-            genes = df.index.tolist()
+            metadata = pd.read_csv(metadata_file, sep='\t', index_col=0)
+            conditions = metadata[condition_column].dropna().astype(str)
+            levels = list(dict.fromkeys(conditions))
+            reference = reference or levels[0]
+            test = test or next(level for level in levels if level != reference)
             
-            go_annotation = pd.DataFrame({
-                'gene_id': genes[:100],
-                'go_id': [f"GO:{i:07d}" for i in range(100)],
-                'namespace': [['biological_process', 'molecular_function', 'cellular_component'][i % 3] for i in range(100)],
-                'description': [f"GO term {i}" for i in range(100)]
-            })
+            results, size_factors = differential_expression(
+                count_file, conditions, reference, test,
+                n_jobs=de_config.get('n_jobs', self.config.get('resources', {}).get('max_threads', 1)),
+                chunk_size=de_config.get('chunk_size', 20000),
+                work_dir=de_config.get('work_dir'))
             
-            output_file = go_dir / "go_annotation.tsv"
-            go_annotation.to_csv(output_file, sep='\t', index=False)
+            prefix = f"{test}_vs_{reference}"
+            results_file = self.differential_dir / f"{prefix}_results.tsv"
+            results.to_csv(results_file, sep='\t')
+            size_factor_file = self.differential_dir / "size_factors.tsv"
+            size_factors.to_csv(size_factor_file, sep='\t')
             
-            logger.info(f"GO注释完成: {output_file}")
-            return str(output_file)
+            significant = results[(results['padj'] < alpha) &
+                                  (results['log2FoldChange'].abs() >= np.log2(fold_change_threshold))]
+            significant_file = self.differential_dir / f"{prefix}_significant.tsv"
+            significant.sort_values('padj').to_csv(significant_file, sep='\t')
+            
+            logger.info(f"差异表达分析完成: {len(significant)} 个显著差异基因 "
+                        f"(padj < {alpha}, |log2FC| >= {np.log2(fold_change_threshold):.2f})")
+            return {
+                'results': str(results_file),
+                'significant': str(significant_file),
+                'size_factors': str(size_factor_file),
+            }
             
         except Exception as e:
-            logger.error(f"GO注释失败: {e}")
-            return ""
+            logger.error(f"差异表达分析失败: {e}")
+            return {}
 
 
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='MICOS-2024 宏转录组数据分析')
     parser.add_argument('-c', '--config', required=True, help='配置文件路径')
-    parser.add_argument('-i', '--input', required=True, nargs='+', help='输入FASTQ文件')
+    parser.add_argument('-i', '--input', nargs='+', help='输入FASTQ文件')
     parser.add_argument('-o', '--output', required=True, help='输出目录路径')
-    parser.add_argument('--mode', choices=['qc', 'annotation', 'complete'],
+    parser.add_argument('--mode', choices=['qc', 'annotation', 'differential', 'complete'],
                        default='complete', help='分析模式')
+    parser.add_argument('--expression', help='基因表达表，第一列为基因ID (annotation 模式)')
+    parser.add_argument('--annotation-index', help='本地注释索引目录 (annotation_index.py 构建)')
+    parser.add_argument('--counts', help='基因 × 样本计数表 (differential 模式)')
+    parser.add_argument('--metadata', help='样本信息表 (differential 模式)')
+    parser.add_argument('--condition', default='condition', help='样本信息表中的分组列名')
+    parser.add_argument('--reference', help='参照组')
+    parser.add_argument('--test', help='与参照组比较的组')
     
     args = parser.parse_args()
+    if args.mode in ('qc', 'complete') and not args.input:
+        parser.error("qc/complete 模式需要 --input")
+    if args.mode == 'differential' and not (args.counts and args.metadata):
+        parser.error("differential 模式需要 --counts 与 --metadata")
     
     # 创建分析器
-    analyzer = MetatranscriptomeAnalyzer(args.config, args.output)
+    analyzer = MetatranscriptomeAnalyzer(args.config, args.output, annotation_index=args.annotation_index)
     
     # 根据模式运行分析
     if args.mode == 'qc':
         results = analyzer.run_quality_control(args.input)
     elif args.mode == 'annotation':
-        logger.error("注释模式需要先运行定量分析")
-        sys.exit(1)
+        if not args.expression:
+            logger.error("注释模式需要先运行定量分析 (--expression)")
+            sys.exit(1)
+        results = analyzer.run_functional_annotation(args.expression)
+        if results is None:
+            sys.exit(1)
+    elif args.mode == 'differential':
+        results = analyzer.run_differential_expression(args.counts, args.metadata, args.condition,
+                                                       args.reference, args.test)
+        if not results:
+            sys.exit(1)
     elif args.mode == 'complete':
         # 运行完整分析流程
         qc_results = analyzer.run_quality_control(args.input)
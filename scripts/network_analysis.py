@@ -16,9 +16,13 @@ Network Analysis and Co-occurrence Analysis Module
 许可证: MIT
 """
 
+import os
 import sys
+import time
+import hashlib
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -34,12 +38,17 @@ try:
     import matplotlib.pyplot as plt
     import seaborn as sns
     from scipy import stats
-    from scipy.stats import spearmanr, pearsonr
+    from scipy.stats import rankdata, norm
+    from scipy.sparse.csgraph import shortest_path
+    from matplotlib.collections import LineCollection
     from sklearn.preprocessing import StandardScaler
     from sklearn.decomposition import PCA
+    from sklearn.metrics import adjusted_rand_score
 except ImportError as e:
     print(f"警告: 缺少必要的依赖包: {e}")
 
+from stats_utils import bh_adjust
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -47,19 +56,358 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# SparCC 工作进程共享的计数矩阵（样本 × 物种），由进程池 initializer 设置
+_SPARCC_COUNTS: Optional[np.ndarray] = None
+
+
+def _init_sparcc_worker(counts: np.ndarray):
+    """进程池初始化: 每个工作进程只接收一次计数矩阵"""
+    global _SPARCC_COUNTS
+    _SPARCC_COUNTS = counts
+
+
+def _sparcc_log_fractions(counts: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """生成一次组成估计的对数比例 (样本 × 物种)
+
+    整数计数使用 Dirichlet(counts + 1) 抽样（以 Gamma 分布向量化实现），
+    非整数数据（相对丰度）加伪计数后直接闭合。
+    """
+    if np.allclose(counts, np.round(counts)):
+        fractions = rng.standard_gamma(counts + 1.0)
+    else:
+        positive = counts[counts > 0]
+        pseudo = positive.min() * 0.5 if positive.size else 1e-6
+        fractions = counts + pseudo
+    fractions /= fractions.sum(axis=1, keepdims=True)
+    return np.log(fractions)
+
+
+def sparcc_correlation(log_fractions: np.ndarray, exclusion_iterations: int = 10,
+                       exclusion_threshold: float = 0.1) -> np.ndarray:
+    """
+    SparCC 核心计算 (Friedman & Alm, 2012)
+
+    基于对数比方差矩阵 T_ij = var(log x_i - log x_j) 估计基础方差 ω²，
+    再由 ρ_ij = (ω_i² + ω_j² - T_ij) / (2 ω_i ω_j) 得到相关系数。
+    每轮排除一对最强相关物种时，线性系统 M ω² = t 的系数矩阵只发生秩一变化
+    (M ← M - uuᵀ, u = e_i + e_j)，因此用 Sherman-Morrison 公式原位更新 M⁻¹，
+    每轮代价 O(d²) 而非重新求解的 O(d³)。
+
+    Args:
+        log_fractions: 对数比例矩阵 (样本 × 物种)
+        exclusion_iterations: 最大排除轮数
+        exclusion_threshold: 排除强相关物种对的 |ρ| 阈值
+
+    Returns:
+        相关系数矩阵 (物种 × 物种)
+    """
+    n_features = log_fractions.shape[1]
+    if n_features < 4:
+        raise ValueError("SparCC 至少需要4个物种")
+
+    cov = np.cov(log_fractions, rowvar=False)
+    var = np.diag(cov)
+    variation = var[:, None] + var[None, :] - 2.0 * cov
+    np.fill_diagonal(variation, 0.0)
+
+    # M = (d-2)I + 11ᵀ 的逆矩阵有闭式解
+    t = variation.sum(axis=1)
+    m_inv = (np.eye(n_features) - 1.0 / (2 * n_features - 2)) / (n_features - 2)
+    excluded = np.eye(n_features, dtype=bool)
+
+    for iteration in range(exclusion_iterations + 1):
+        basis_var = np.clip(m_inv @ t, 1e-12, None)
+        basis_std = np.sqrt(basis_var)
+        corr = (basis_var[:, None] + basis_var[None, :] - variation) / (
+            2.0 * np.outer(basis_std, basis_std))
+
+        if iteration == exclusion_iterations:
+            break
+
+        candidates = np.where(excluded, 0.0, np.abs(corr))
+        i, j = np.unravel_index(np.argmax(candidates), candidates.shape)
+        if candidates[i, j] <= exclusion_threshold:
+            break
+
+        m_inv_u = m_inv[:, i] + m_inv[:, j]
+        denominator = 1.0 - (m_inv_u[i] + m_inv_u[j])
+        if abs(denominator) < 1e-12:
+            break
+
+        excluded[i, j] = excluded[j, i] = True
+        t[i] -= variation[i, j]
+        t[j] -= variation[i, j]
+        m_inv += np.outer(m_inv_u, m_inv_u) / denominator
+
+    np.clip(corr, -1.0, 1.0, out=corr)
+    np.fill_diagonal(corr, 1.0)
+    return corr
+
+
+def _sparcc_task(n_iter: int, exclusion_iterations: int, exclusion_threshold: float,
+                 seed: int, bootstrap: bool = False) -> np.ndarray:
+    """
+    SparCC 工作进程任务
+
+    bootstrap=True 时先对每个物种独立地在样本间有放回重抽样，打破物种间关联，
+    得到一个零假设数据集；随后对 n_iter 次组成抽样的结果取中位数。
+    """
+    rng = np.random.default_rng(seed)
+    counts = _SPARCC_COUNTS
+    if bootstrap:
+        n_samples, n_features = counts.shape
+        rows = rng.integers(0, n_samples, size=(n_samples, n_features))
+        counts = np.take_along_axis(counts, rows, axis=0)
+
+    draws = np.stack([
+        sparcc_correlation(_sparcc_log_fractions(counts, rng),
+                           exclusion_iterations, exclusion_threshold)
+        for _ in range(n_iter)
+    ])
+    return np.median(draws, axis=0).astype(np.float32)
+
+
+def correlation_matrix(values: np.ndarray, method: str = 'spearman') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化计算全部物种对的相关系数与p值
+
+    Spearman 即秩次上的 Pearson；相关矩阵由一次矩阵乘法得到，p值使用与
+    scipy.stats.spearmanr/pearsonr 相同的 t 分布 (n-2 自由度) 检验。
+
+    Args:
+        values: 数据矩阵 (物种 × 样本)
+        method: 'spearman' 或 'pearson'
+
+    Returns:
+        (相关系数矩阵, p值矩阵)
+    """
+    if method == 'spearman':
+        values = rankdata(values, axis=1)
+    elif method != 'pearson':
+        raise ValueError(f"不支持的相关性方法: {method}")
+
+    n_samples = values.shape[1]
+    centered = values - values.mean(axis=1, keepdims=True)
+    norm = np.linalg.norm(centered, axis=1)
+    norm[norm == 0] = np.nan
+    normalized = centered / norm[:, None]
+    corr = np.clip(normalized @ normalized.T, -1.0, 1.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stat = corr * np.sqrt((n_samples - 2) / (1.0 - corr ** 2))
+    p_values = 2.0 * stats.t.sf(np.abs(t_stat), n_samples - 2)
+
+    np.fill_diagonal(corr, 1.0)
+    np.fill_diagonal(p_values, 0.0)
+    return corr, p_values
+
+
+def _detect_modules(G: "nx.Graph", seed: Optional[int] = None) -> Dict:
+    """Louvain 模块检测；未安装 python-louvain 时使用 networkx 内置实现"""
+    try:
+        import community as community_louvain
+        return community_louvain.best_partition(G, random_state=seed)
+    except ImportError:
+        communities = nx.community.louvain_communities(G, seed=seed)
+        return {node: module for module, members in enumerate(communities) for node in members}
+
+
+# 稳定性分析工作进程共享状态，由进程池 initializer 设置
+_STABILITY_STATE: Dict = {}
+
+
+def _init_stability_worker(values: np.ndarray, method: str, corr_threshold: float,
+                           pval_threshold: float, subsample_size: int):
+    """进程池初始化: 每个工作进程只接收一次预处理后的数据"""
+    _STABILITY_STATE.update(values=values, method=method, corr_threshold=corr_threshold,
+                            pval_threshold=pval_threshold, subsample_size=subsample_size)
+
+
+def _threshold_edges(corr: np.ndarray, p_values: np.ndarray, corr_threshold: float,
+                     pval_threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """返回满足阈值的上三角边（扁平索引）及其符号"""
+    upper_i, upper_j = np.triu_indices(corr.shape[0], k=1)
+    upper_corr = corr[upper_i, upper_j]
+    keep = (np.abs(upper_corr) >= corr_threshold) & (p_values[upper_i, upper_j] <= pval_threshold)
+    edge_index = np.flatnonzero(keep)
+    return edge_index, upper_corr[edge_index] > 0
+
+
+def _modules_from_edges(n_features: int, edge_index: np.ndarray, seed: int) -> np.ndarray:
+    """由边列表构建网络并检测模块，返回每个物种的模块标签"""
+    upper_i, upper_j = np.triu_indices(n_features, k=1)
+    G = nx.Graph()
+    G.add_nodes_from(range(n_features))
+    G.add_edges_from(zip(upper_i[edge_index].tolist(), upper_j[edge_index].tolist()))
+    partition = _detect_modules(G, seed=seed)
+    return np.array([partition[i] for i in range(n_features)], dtype=np.int64)
+
+
+def _stability_task(seed: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """稳定性分析单轮: 随机抽取样本子集，向量化重建网络并检测模块"""
+    state = _STABILITY_STATE
+    rng = np.random.default_rng(seed)
+    values = state['values']
+    columns = rng.choice(values.shape[1], size=state['subsample_size'], replace=False)
+    corr, p_values = correlation_matrix(values[:, columns], state['method'])
+    edge_index, positive = _threshold_edges(corr, p_values, state['corr_threshold'],
+                                            state['pval_threshold'])
+    modules = _modules_from_edges(values.shape[0], edge_index, seed)
+    return edge_index, positive, modules
+
+
+def _module_consistency(reference: np.ndarray, modules: np.ndarray) -> np.ndarray:
+    """每个物种在参考模块与本轮模块中的成员 Jaccard 相似度"""
+    _, ref_labels = np.unique(reference, return_inverse=True)
+    _, new_labels = np.unique(modules, return_inverse=True)
+    contingency = np.zeros((ref_labels.max() + 1, new_labels.max() + 1), dtype=np.int64)
+    np.add.at(contingency, (ref_labels, new_labels), 1)
+    shared = contingency[ref_labels, new_labels]
+    ref_size = contingency.sum(axis=1)[ref_labels]
+    new_size = contingency.sum(axis=0)[new_labels]
+    return shared / (ref_size + new_size - shared)
+
+
+def _build_graph(features: np.ndarray, corr: np.ndarray, p_values: np.ndarray,
+                 corr_threshold: float, pval_threshold: float) -> "nx.Graph":
+    """按阈值由相关矩阵构建网络，边属性与 construct_network 一致"""
+    edge_index, _ = _threshold_edges(corr, p_values, corr_threshold, pval_threshold)
+    upper_i, upper_j = np.triu_indices(len(features), k=1)
+    G = nx.Graph()
+    G.add_nodes_from(features.tolist())
+    for i, j in zip(upper_i[edge_index].tolist(), upper_j[edge_index].tolist()):
+        corr_val = float(corr[i, j])
+        G.add_edge(features[i], features[j],
+                   weight=abs(corr_val),
+                   correlation=corr_val,
+                   pvalue=float(p_values[i, j]),
+                   edge_type='positive' if corr_val > 0 else 'negative')
+    return G
+
+
+# 分组网络工作进程共享的预处理数据，由进程池 initializer 设置
+_GROUP_VALUES: Optional[np.ndarray] = None
+
+
+def _init_group_worker(values: np.ndarray):
+    """进程池初始化: 每个工作进程只接收一次预处理后的数据"""
+    global _GROUP_VALUES
+    _GROUP_VALUES = values
+
+
+def _group_correlation_task(columns: np.ndarray, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """计算单个分组的相关矩阵"""
+    return correlation_matrix(_GROUP_VALUES[:, columns], method)
+
+
+def sparse_stress_layout(G: "nx.Graph", time_budget: float = 30.0, n_pivots: int = 50,
+                         max_iter: int = 500, tol: float = 1e-4, seed: int = 42) -> Dict:
+    """
+    稀疏应力布局 (Sparse Stress Layout, Ortmann et al. 2016)
+
+    先用 Pivot MDS 从 k 个枢轴节点的 BFS 距离得到初始坐标 (O(k(n+m)))，
+    再只对边和"节点-枢轴"距离项做应力优化，每轮迭代为 O(m + nk) 的向量化更新，
+    超过时间预算即停止。适用于数千节点以上的网络。
+
+    Args:
+        G: 网络
+        time_budget: 应力优化的时间预算（秒）
+        n_pivots: 枢轴节点数
+        max_iter: 最大迭代次数
+        tol: 平均位移收敛阈值（相对布局尺度）
+        seed: 随机种子
+
+    Returns:
+        节点 -> 坐标 的字典
+    """
+    nodes = list(G.nodes())
+    n_nodes = len(nodes)
+    if n_nodes <= 2:
+        return nx.circular_layout(G)
+
+    start = time.monotonic()
+    rng = np.random.default_rng(seed)
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, format='csr')
+
+    # maxmin 枢轴选择（不可达节点距离视为无穷，优先覆盖其他连通分量）
+    n_pivots = min(n_pivots, n_nodes)
+    pivots = np.empty(n_pivots, dtype=np.int64)
+    pivot_dist = np.empty((n_pivots, n_nodes))
+    min_dist = np.full(n_nodes, np.inf)
+    pivots[0] = rng.integers(n_nodes)
+    for k in range(n_pivots):
+        pivot_dist[k] = shortest_path(adjacency, directed=False, unweighted=True, indices=pivots[k])
+        min_dist = np.minimum(min_dist, pivot_dist[k])
+        if k + 1 < n_pivots:
+            pivots[k + 1] = np.argmax(min_dist)
+
+    finite = np.isfinite(pivot_dist)
+    max_finite = pivot_dist[finite].max() if finite.any() else 1.0
+    pivot_dist[~finite] = max_finite + 1.0
+
+    # Pivot MDS 初始化
+    squared = pivot_dist.T ** 2
+    centered = (squared - squared.mean(axis=0, keepdims=True)
+                - squared.mean(axis=1, keepdims=True) + squared.mean())
+    u, s, _ = np.linalg.svd(-0.5 * centered, full_matrices=False)
+    coords = u[:, :2] * s[:2]
+    coords += rng.normal(scale=1e-3, size=coords.shape)
+
+    # 应力项: 边 (d=1) 与 节点-枢轴 (d=BFS距离, 权重按枢轴区域大小放大)
+    edge_rows, edge_cols = adjacency.nonzero()
+    closest_pivot = np.argmin(pivot_dist, axis=0)
+    region_size = np.bincount(closest_pivot, minlength=n_pivots).astype(float)
+    pivot_rows = np.tile(np.arange(n_nodes), n_pivots)
+    pivot_cols = np.repeat(pivots, n_nodes)
+    pivot_d = pivot_dist.ravel()
+    pivot_w = np.repeat(region_size, n_nodes)
+    keep = pivot_rows != pivot_cols
+    rows = np.concatenate([edge_rows, pivot_rows[keep]])
+    cols = np.concatenate([edge_cols, pivot_cols[keep]])
+    target = np.concatenate([np.ones(len(edge_rows)), pivot_d[keep]])
+    weight = np.concatenate([np.ones(len(edge_rows)), pivot_w[keep]]) / target ** 2
+    weight_sum = np.bincount(rows, weights=weight, minlength=n_nodes)
+    weight_sum[weight_sum == 0] = 1.0
+
+    for iteration in range(max_iter):
+        if time.monotonic() - start > time_budget:
+            logger.info(f"稀疏应力布局达到时间预算，完成 {iteration} 轮迭代")
+            break
+        diff = coords[rows] - coords[cols]
+        norm = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+        proposal = coords[cols] + (target / norm)[:, None] * diff
+        new_coords = np.column_stack([
+            np.bincount(rows, weights=weight * proposal[:, 0], minlength=n_nodes),
+            np.bincount(rows, weights=weight * proposal[:, 1], minlength=n_nodes),
+        ]) / weight_sum[:, None]
+        movement = np.linalg.norm(new_coords - coords, axis=1).mean()
+        coords = new_coords
+        if movement < tol * max_finite:
+            break
+
+    coords -= coords.mean(axis=0)
+    scale = np.abs(coords).max()
+    if scale > 0:
+        coords /= scale
+    return {node: coords[i] for i, node in enumerate(nodes)}
+
+
 class NetworkAnalyzer:
     """网络分析器"""
 
-    def __init__(self, config_file: str, output_dir: str):
+    def __init__(self, config_file: str, output_dir: str, threads: Optional[int] = None):
         """
         初始化网络分析器
 
         Args:
             config_file: 配置文件路径
             output_dir: 输出目录路径
+            threads: 并行进程数（默认使用配置或全部CPU核心）
         """
         self.config_file = config_file
         self.output_dir = Path(output_dir)
+        self.threads = threads
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
         # 加载配置
@@ -71,10 +419,11 @@ class NetworkAnalyzer:
         self.topology_dir = self.output_dir / "topology_analysis"
         self.visualization_dir = self.output_dir / "visualization"
         self.modules_dir = self.output_dir / "module_analysis"
+        self.stability_dir = self.output_dir / "stability_analysis"
 
         # 创建输出目录
         for dir_path in [self.correlation_dir, self.network_dir, self.topology_dir,
-                        self.visualization_dir, self.modules_dir]:
+                        self.visualization_dir, self.modules_dir, self.stability_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
     def _load_config(self) -> Dict:
@@ -88,13 +437,20 @@ class NetworkAnalyzer:
             logger.error(f"加载配置文件失败: {e}")
             return {}
 
+    def _get_n_jobs(self) -> int:
+        """获取并行进程数"""
+        if self.threads:
+            return max(1, self.threads)
+        max_threads = self.config.get('resources', {}).get('max_threads')
+        return max(1, max_threads or os.cpu_count() or 1)
+
     def run_correlation_analysis(self, abundance_file: str, method: str = 'spearman') -> str:
         """
         运行相关性分析
 
         Args:
             abundance_file: 物种丰度文件路径
-            method: 相关性计算方法 ('spearman', 'pearson')
+            method: 相关性计算方法 ('spearman', 'pearson', 'sparcc')
 
         Returns:
             相关性矩阵文件路径
@@ -105,14 +461,16 @@ class NetworkAnalyzer:
             # 读取丰度数据
             df = pd.read_csv(abundance_file, sep='\t', index_col=0)
 
-            # 数据预处理
-            df = self._preprocess_abundance_data(df)
+            # 数据预处理（SparCC 需要未经对数转换的组成数据）
+            df = self._preprocess_abundance_data(df, log_transform=(method != 'sparcc'))
 
             # 计算相关性矩阵
             if method == 'spearman':
                 corr_matrix, p_values = self._calculate_spearman_correlation(df)
             elif method == 'pearson':
                 corr_matrix, p_values = self._calculate_pearson_correlation(df)
+            elif method == 'sparcc':
+                corr_matrix, p_values = self._calculate_sparcc_correlation(df)
             else:
                 raise ValueError(f"不支持的相关性方法: {method}")
 
@@ -130,7 +488,7 @@ class NetworkAnalyzer:
             logger.error(f"相关性分析失败: {e}")
             return ""
 
-    def _preprocess_abundance_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _preprocess_abundance_data(self, df: pd.DataFrame, log_transform: bool = True) -> pd.DataFrame:
         """预处理丰度数据"""
         logger.info("预处理丰度数据...")
 
@@ -144,7 +502,8 @@ class NetworkAnalyzer:
         df = df[(df > 0).sum(axis=1) >= prevalence_threshold]
 
         # 对数转换
-        df = np.log10(df + 1e-6)
+        if log_transform:
+            df = np.log10(df + 1e-6)
 
         logger.info(f"预处理后保留 {df.shape[0]} 个物种")
         return df
@@ -153,19 +512,7 @@ class NetworkAnalyzer:
         """计算Spearman相关性"""
         logger.info("计算Spearman相关性...")
 
-        n_features = df.shape[0]
-        corr_matrix = np.zeros((n_features, n_features))
-        p_values = np.zeros((n_features, n_features))
-
-        for i in range(n_features):
-            for j in range(i, n_features):
-                if i == j:
-                    corr_matrix[i, j] = 1.0
-                    p_values[i, j] = 0.0
-                else:
-                    corr, pval = spearmanr(df.iloc[i], df.iloc[j])
-                    corr_matrix[i, j] = corr_matrix[j, i] = corr
-                    p_values[i, j] = p_values[j, i] = pval
+        corr_matrix, p_values = correlation_matrix(df.to_numpy(dtype=float), 'spearman')
 
         corr_df = pd.DataFrame(corr_matrix, index=df.index, columns=df.index)
         pval_df = pd.DataFrame(p_values, index=df.index, columns=df.index)
@@ -176,19 +523,73 @@ class NetworkAnalyzer:
         """计算Pearson相关性"""
         logger.info("计算Pearson相关性...")
 
-        n_features = df.shape[0]
-        corr_matrix = np.zeros((n_features, n_features))
-        p_values = np.zeros((n_features, n_features))
+        corr_matrix, p_values = correlation_matrix(df.to_numpy(dtype=float), 'pearson')
 
-        for i in range(n_features):
-            for j in range(i, n_features):
-                if i == j:
-                    corr_matrix[i, j] = 1.0
-                    p_values[i, j] = 0.0
-                else:
-                    corr, pval = pearsonr(df.iloc[i], df.iloc[j])
-                    corr_matrix[i, j] = corr_matrix[j, i] = corr
-                    p_values[i, j] = p_values[j, i] = pval
+        corr_df = pd.DataFrame(corr_matrix, index=df.index, columns=df.index)
+        pval_df = pd.DataFrame(p_values, index=df.index, columns=df.index)
+
+        return corr_df, pval_df
+
+    def _calculate_sparcc_correlation(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        计算SparCC组成数据相关性
+
+        观测相关性为多次 Dirichlet 组成抽样结果的中位数；p值来自 bootstrap 零分布
+        (每个物种在样本间独立重抽样)，双侧 p = (1 + #{|ρ*| ≥ |ρ|}) / (1 + B)。
+        组成抽样与 bootstrap 均分发到进程池中执行。
+        """
+        logger.info("计算SparCC相关性...")
+
+        sparcc_config = self.config.get('network_analysis', {}).get('sparcc', {})
+        n_iter = sparcc_config.get('iterations', 20)
+        exclusion_iterations = sparcc_config.get('exclusion_iterations', 10)
+        exclusion_threshold = sparcc_config.get('exclusion_threshold', 0.1)
+        n_bootstraps = sparcc_config.get('bootstraps', 100)
+        seed = sparcc_config.get('seed', 42)
+        n_jobs = self._get_n_jobs()
+
+        # 样本 × 物种
+        counts = df.T.to_numpy(dtype=np.float64)
+        seeds = np.random.SeedSequence(seed).generate_state(n_iter + n_bootstraps)
+
+        executor = None
+        if n_jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_sparcc_worker,
+                                           initargs=(counts,))
+        else:
+            _init_sparcc_worker(counts)
+
+        try:
+            map_fn = executor.map if executor else map
+
+            # 观测相关性: 每个组成抽样一个任务
+            draws = list(map_fn(_sparcc_task,
+                                [1] * n_iter,
+                                [exclusion_iterations] * n_iter,
+                                [exclusion_threshold] * n_iter,
+                                seeds[:n_iter].tolist()))
+            corr_matrix = np.median(np.stack(draws), axis=0)
+            del draws
+
+            # bootstrap p值: 逐个累计，避免同时保存 B 个矩阵
+            if n_bootstraps > 0:
+                abs_corr = np.abs(corr_matrix)
+                exceed = np.zeros_like(corr_matrix)
+                for boot_corr in map_fn(_sparcc_task,
+                                        [n_iter] * n_bootstraps,
+                                        [exclusion_iterations] * n_bootstraps,
+                                        [exclusion_threshold] * n_bootstraps,
+                                        seeds[n_iter:].tolist(),
+                                        [True] * n_bootstraps):
+                    exceed += np.abs(boot_corr) >= abs_corr
+                p_values = (exceed + 1.0) / (n_bootstraps + 1.0)
+                np.fill_diagonal(p_values, 0.0)
+            else:
+                logger.warning("SparCC bootstrap 次数为0，无法计算p值")
+                p_values = np.full_like(corr_matrix, np.nan)
+        finally:
+            if executor:
+                executor.shutdown()
 
         corr_df = pd.DataFrame(corr_matrix, index=df.index, columns=df.index)
         pval_df = pd.DataFrame(p_values, index=df.index, columns=df.index)
@@ -342,14 +743,8 @@ class NetworkAnalyzer:
         """检测网络模块"""
         logger.info("检测网络模块...")
 
-        try:
-            import community as community_louvain
-            # 使用Louvain算法检测社区
-            partition = community_louvain.best_partition(G)
-            return partition
-        except ImportError:
-            logger.warning("未安装python-louvain包，跳过模块检测")
-            return {}
+        # 使用Louvain算法检测社区
+        return _detect_modules(G)
 
     def _identify_key_nodes(self, G: nx.Graph, centrality_metrics: Dict) -> List[Dict]:
         """识别关键节点"""
@@ -379,13 +774,18 @@ class NetworkAnalyzer:
 
         return key_nodes
 
-    def visualize_network(self, network_file: str, layout: str = 'spring') -> str:
+    def visualize_network(self, network_file: str, layout: str = 'spring',
+                          time_budget: Optional[float] = None) -> str:
         """
         可视化网络
 
+        节点数超过 large_graph_threshold 时自动切换到大图模式: 稀疏应力布局、
+        边以 LineCollection 栅格化绘制、仅标注度最高的节点。
+
         Args:
             network_file: 网络文件路径
             layout: 布局算法
+            time_budget: 大图布局时间预算（秒），默认读取配置
 
         Returns:
             可视化文件路径
@@ -396,55 +796,22 @@ class NetworkAnalyzer:
             # 加载网络
             G = nx.read_gml(network_file)
 
-            # 设置图形大小
-            plt.figure(figsize=(15, 12))
+            viz_config = self.config.get('network_analysis', {}).get('visualization', {})
+            large_threshold = viz_config.get('large_graph_threshold', 1000)
+            large_graph = layout == 'sparse_stress' or G.number_of_nodes() > large_threshold
+            if large_graph and layout in ('spring', 'kamada_kawai'):
+                logger.info(f"网络包含 {G.number_of_nodes()} 个节点，使用稀疏应力布局")
+                layout = 'sparse_stress'
+            if time_budget is None:
+                time_budget = viz_config.get('layout_time_budget', 30.0)
+
+            pos = self._get_network_layout(G, network_file, layout, time_budget)
 
-            # 选择布局算法
-            if layout == 'spring':
-                pos = nx.spring_layout(G, k=1, iterations=50)
-            elif layout == 'circular':
-                pos = nx.circular_layout(G)
-            elif layout == 'kamada_kawai':
-                pos = nx.kamada_kawai_layout(G)
-            else:
-                pos = nx.spring_layout(G)
-
-            # 绘制节点
-            node_sizes = [G.degree(node) * 50 for node in G.nodes()]
-            nx.draw_networkx_nodes(G, pos, node_size=node_sizes,
-                                 node_color='lightblue', alpha=0.7)
-
-            # 绘制边
-            positive_edges = [(u, v) for u, v, d in G.edges(data=True)
-                            if d.get('edge_type') == 'positive']
-            negative_edges = [(u, v) for u, v, d in G.edges(data=True)
-                            if d.get('edge_type') == 'negative']
-
-            nx.draw_networkx_edges(G, pos, edgelist=positive_edges,
-                                 edge_color='green', alpha=0.6, width=1)
-            nx.draw_networkx_edges(G, pos, edgelist=negative_edges,
-                                 edge_color='red', alpha=0.6, width=1, style='dashed')
-
-            # 添加标签（仅对度较高的节点）
-            high_degree_nodes = [node for node in G.nodes() if G.degree(node) > 5]
-            labels = {node: node for node in high_degree_nodes}
-            nx.draw_networkx_labels(G, pos, labels, font_size=8)
-
-            plt.title("Microbial Co-occurrence Network", fontsize=16, fontweight='bold')
-            plt.axis('off')
-
-            # 添加图例
-            from matplotlib.lines import Line2D
-            legend_elements = [
-                Line2D([0], [0], color='green', lw=2, label='Positive correlation'),
-                Line2D([0], [0], color='red', lw=2, linestyle='--', label='Negative correlation')
-            ]
-            plt.legend(handles=legend_elements, loc='upper right')
-
-            # 保存图形
             viz_file = self.visualization_dir / "network_visualization.png"
-            plt.savefig(viz_file, dpi=300, bbox_inches='tight')
-            plt.close()
+            if large_graph:
+                self._draw_large_network(G, pos, viz_file, viz_config)
+            else:
+                self._draw_network(G, pos, viz_file)
 
             logger.info(f"网络可视化完成: {viz_file}")
             return str(viz_file)
@@ -453,6 +820,489 @@ class NetworkAnalyzer:
             logger.error(f"网络可视化失败: {e}")
             return ""
 
+    def _get_network_layout(self, G: nx.Graph, network_file: str, layout: str,
+                            time_budget: float) -> Dict:
+        """读取或计算布局坐标，坐标缓存于网络文件旁，重新绘图时无需重新计算"""
+        cache_file = Path(network_file).with_suffix(f".{layout}_layout.tsv")
+        graph_hash = hashlib.sha1(
+            repr((sorted(map(str, G.nodes())),
+                  sorted(tuple(sorted(map(str, e))) for e in G.edges()))).encode()
+        ).hexdigest()
+
+        if cache_file.exists():
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached_hash = f.readline().strip().split('=', 1)[-1]
+            if cached_hash == graph_hash:
+                coords = pd.read_csv(cache_file, sep='\t', skiprows=1, index_col=0,
+                                     dtype={'node': str})
+                logger.info(f"使用缓存的布局坐标: {cache_file}")
+                return {node: coords.loc[str(node), ['x', 'y']].to_numpy(dtype=float)
+                        for node in G.nodes()}
+
+        # 选择布局算法
+        if layout == 'sparse_stress':
+            pos = sparse_stress_layout(G, time_budget=time_budget)
+        elif layout == 'spring':
+            pos = nx.spring_layout(G, k=1, iterations=50)
+        elif layout == 'circular':
+            pos = nx.circular_layout(G)
+        elif layout == 'kamada_kawai':
+            pos = nx.kamada_kawai_layout(G)
+        else:
+            pos = nx.spring_layout(G)
+
+        coords = pd.DataFrame([pos[node] for node in G.nodes()], index=list(G.nodes()),
+                              columns=['x', 'y'])
+        coords.index.name = 'node'
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            f.write(f"# graph_hash={graph_hash}\n")
+            coords.to_csv(f, sep='\t')
+        logger.info(f"布局坐标已缓存: {cache_file}")
+
+        return pos
+
+    def _draw_network(self, G: nx.Graph, pos: Dict, viz_file: Path):
+        """绘制常规规模网络"""
+        # 设置图形大小
+        plt.figure(figsize=(15, 12))
+
+        # 绘制节点
+        node_sizes = [G.degree(node) * 50 for node in G.nodes()]
+        nx.draw_networkx_nodes(G, pos, node_size=node_sizes,
+                             node_color='lightblue', alpha=0.7)
+
+        # 绘制边
+        positive_edges = [(u, v) for u, v, d in G.edges(data=True)
+                        if d.get('edge_type') == 'positive']
+        negative_edges = [(u, v) for u, v, d in G.edges(data=True)
+                        if d.get('edge_type') == 'negative']
+
+        nx.draw_networkx_edges(G, pos, edgelist=positive_edges,
+                             edge_color='green', alpha=0.6, width=1)
+        nx.draw_networkx_edges(G, pos, edgelist=negative_edges,
+                             edge_color='red', alpha=0.6, width=1, style='dashed')
+
+        # 添加标签（仅对度较高的节点）
+        high_degree_nodes = [node for node in G.nodes() if G.degree(node) > 5]
+        labels = {node: node for node in high_degree_nodes}
+        nx.draw_networkx_labels(G, pos, labels, font_size=8)
+
+        plt.title("Microbial Co-occurrence Network", fontsize=16, fontweight='bold')
+        plt.axis('off')
+
+        # 添加图例
+        from matplotlib.lines import Line2D
+        legend_elements = [
+            Line2D([0], [0], color='green', lw=2, label='Positive correlation'),
+            Line2D([0], [0], color='red', lw=2, linestyle='--', label='Negative correlation')
+        ]
+        plt.legend(handles=legend_elements, loc='upper right')
+
+        # 保存图形
+        plt.savefig(viz_file, dpi=300, bbox_inches='tight')
+        plt.close()
+
+    def _draw_large_network(self, G: nx.Graph, pos: Dict, viz_file: Path, viz_config: Dict):
+        """绘制大规模网络: 边合并为 LineCollection 并栅格化，透明度随边密度降低"""
+        nodes = list(G.nodes())
+        node_index = {node: i for i, node in enumerate(nodes)}
+        coords = np.array([pos[node] for node in nodes], dtype=float)
+        degrees = np.array([G.degree(node) for node in nodes], dtype=float)
+
+        fig, ax = plt.subplots(figsize=(15, 12))
+
+        n_edges = max(G.number_of_edges(), 1)
+        edge_alpha = float(np.clip(2000.0 / n_edges, 0.05, 0.6))
+        for edge_type, color, style in [('positive', 'green', 'solid'),
+                                        ('negative', 'red', 'dashed')]:
+            edge_idx = np.array([(node_index[u], node_index[v]) for u, v, d in G.edges(data=True)
+                                 if d.get('edge_type') == edge_type], dtype=np.int64).reshape(-1, 2)
+            if len(edge_idx) == 0:
+                continue
+            segments = np.stack([coords[edge_idx[:, 0]], coords[edge_idx[:, 1]]], axis=1)
+            ax.add_collection(LineCollection(segments, colors=color, linewidths=0.3,
+                                             linestyles=style, alpha=edge_alpha,
+                                             rasterized=True, zorder=1))
+
+        node_sizes = 2 + 40 * degrees / max(degrees.max(), 1.0)
+        ax.scatter(coords[:, 0], coords[:, 1], s=node_sizes, c='steelblue',
+                   alpha=0.8, linewidths=0, rasterized=True, zorder=2)
+
+        # 仅标注度最高的节点
+        max_labels = viz_config.get('max_labels', 30)
+        for i in np.argsort(-degrees)[:max_labels]:
+            ax.annotate(str(nodes[i]), coords[i], fontsize=6, zorder=3)
+
+        ax.set_title(f"Microbial Co-occurrence Network ({len(nodes)} nodes, "
+                     f"{G.number_of_edges()} edges)", fontsize=16, fontweight='bold')
+        ax.autoscale()
+        ax.set_aspect('equal')
+        ax.axis('off')
+
+        from matplotlib.lines import Line2D
+        legend_elements = [
+            Line2D([0], [0], color='green', lw=2, label='Positive correlation'),
+            Line2D([0], [0], color='red', lw=2, linestyle='--', label='Negative correlation')
+        ]
+        ax.legend(handles=legend_elements, loc='upper right')
+
+        fig.savefig(viz_file, dpi=viz_config.get('dpi', 300), bbox_inches='tight')
+        plt.close(fig)
+
+    def run_stability_analysis(self, abundance_file: str, method: str = 'spearman',
+                               n_rounds: Optional[int] = None,
+                               subsample_fraction: Optional[float] = None) -> str:
+        """
+        网络稳定性分析
+
+        在随机样本子集上重复构建共现网络（每轮一次向量化相关性计算），各轮在进程池中
+        并行执行，统计边与节点的出现频率，并以调整兰德指数和成员 Jaccard 相似度
+        评估模块划分与全数据参考网络的一致性。
+
+        Args:
+            abundance_file: 物种丰度文件路径
+            method: 相关性计算方法 ('spearman', 'pearson')
+            n_rounds: 子抽样轮数，默认读取配置 (100)
+            subsample_fraction: 每轮抽取的样本比例，默认读取配置 (0.8)
+
+        Returns:
+            边稳定性结果文件路径
+        """
+        logger.info(f"开始网络稳定性分析，使用{method}方法...")
+
+        try:
+            if method not in ('spearman', 'pearson'):
+                raise ValueError(f"稳定性分析不支持的相关性方法: {method}")
+
+            network_config = self.config.get('network_analysis', {})
+            stability_config = network_config.get('stability', {})
+            n_rounds = n_rounds or stability_config.get('rounds', 100)
+            subsample_fraction = subsample_fraction or stability_config.get('subsample_fraction', 0.8)
+            seed = stability_config.get('seed', 42)
+            corr_threshold = network_config.get('correlation_threshold', 0.6)
+            pval_threshold = network_config.get('pvalue_threshold', 0.05)
+
+            # 读取并预处理一次，各轮共享
+            df = pd.read_csv(abundance_file, sep='\t', index_col=0)
+            df = self._preprocess_abundance_data(df)
+            values = df.to_numpy(dtype=float)
+            n_features, n_samples = values.shape
+            subsample_size = int(round(n_samples * subsample_fraction))
+            if subsample_size < 3:
+                raise ValueError(f"子样本数过少 ({subsample_size})，无法计算相关性")
+
+            # 全数据参考网络
+            corr, p_values = correlation_matrix(values, method)
+            ref_edges, ref_positive = _threshold_edges(corr, p_values, corr_threshold, pval_threshold)
+            ref_modules = _modules_from_edges(n_features, ref_edges, seed)
+
+            n_pairs = n_features * (n_features - 1) // 2
+            edge_counts = np.zeros(n_pairs, dtype=np.int64)
+            positive_counts = np.zeros(n_pairs, dtype=np.int64)
+            degree_sum = np.zeros(n_features)
+            degree_sq_sum = np.zeros(n_features)
+            presence_counts = np.zeros(n_features, dtype=np.int64)
+            consistency_sum = np.zeros(n_features)
+            ari_scores = []
+
+            upper_i, upper_j = np.triu_indices(n_features, k=1)
+            seeds = np.random.SeedSequence(seed).generate_state(n_rounds).tolist()
+            init_args = (values, method, corr_threshold, pval_threshold, subsample_size)
+            n_jobs = min(self._get_n_jobs(), n_rounds)
+
+            executor = None
+            if n_jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_stability_worker,
+                                               initargs=init_args)
+            else:
+                _init_stability_worker(*init_args)
+
+            try:
+                map_fn = executor.map if executor else map
+                for edge_index, positive, modules in map_fn(_stability_task, seeds):
+                    edge_counts[edge_index] += 1
+                    positive_counts[edge_index[positive]] += 1
+                    degree = (np.bincount(upper_i[edge_index], minlength=n_features)
+                              + np.bincount(upper_j[edge_index], minlength=n_features))
+                    degree_sum += degree
+                    degree_sq_sum += degree ** 2
+                    presence_counts += degree > 0
+                    consistency_sum += _module_consistency(ref_modules, modules)
+                    ari_scores.append(adjusted_rand_score(ref_modules, modules))
+            finally:
+                if executor:
+                    executor.shutdown()
+
+            # 边稳定性: 参考网络中的边及任一轮出现过的边
+            in_reference = np.zeros(n_pairs, dtype=bool)
+            in_reference[ref_edges] = True
+            reported = np.flatnonzero((edge_counts > 0) | in_reference)
+            features = df.index.to_numpy()
+            edge_df = pd.DataFrame({
+                'source': features[upper_i[reported]],
+                'target': features[upper_j[reported]],
+                'correlation': corr[upper_i[reported], upper_j[reported]],
+                'in_reference': in_reference[reported],
+                'persistence': edge_counts[reported] / n_rounds,
+                'sign_consistency': np.divide(
+                    np.maximum(positive_counts[reported], edge_counts[reported] - positive_counts[reported]),
+                    edge_counts[reported], out=np.zeros(len(reported)), where=edge_counts[reported] > 0),
+            }).sort_values('persistence', ascending=False)
+
+            degree_mean = degree_sum / n_rounds
+            node_df = pd.DataFrame({
+                'node': features,
+                'reference_degree': (np.bincount(upper_i[ref_edges], minlength=n_features)
+                                     + np.bincount(upper_j[ref_edges], minlength=n_features)),
+                'reference_module': ref_modules,
+                'persistence': presence_counts / n_rounds,
+                'mean_degree': degree_mean,
+                'degree_sd': np.sqrt(np.maximum(degree_sq_sum / n_rounds - degree_mean ** 2, 0.0)),
+                'module_consistency': consistency_sum / n_rounds,
+            }).sort_values('persistence', ascending=False)
+
+            rounds_df = pd.DataFrame({'round': np.arange(1, n_rounds + 1),
+                                      'adjusted_rand_index': ari_scores})
+
+            edge_file = self.stability_dir / "edge_stability.tsv"
+            node_file = self.stability_dir / "node_stability.tsv"
+            rounds_file = self.stability_dir / "module_consistency.tsv"
+            edge_df.to_csv(edge_file, sep='\t', index=False)
+            node_df.to_csv(node_file, sep='\t', index=False)
+            rounds_df.to_csv(rounds_file, sep='\t', index=False)
+
+            reference_persistence = edge_counts[ref_edges] / n_rounds
+            summary = {
+                'method': method,
+                'rounds': int(n_rounds),
+                'subsample_fraction': float(subsample_fraction),
+                'subsample_size': int(subsample_size),
+                'reference_edges': int(len(ref_edges)),
+                'mean_reference_edge_persistence': float(reference_persistence.mean()) if len(ref_edges) else 0.0,
+                'mean_adjusted_rand_index': float(np.mean(ari_scores)),
+                'sd_adjusted_rand_index': float(np.std(ari_scores)),
+            }
+            with open(self.stability_dir / "stability_summary.yaml", 'w') as f:
+                yaml.dump(summary, f, default_flow_style=False, allow_unicode=True)
+
+            logger.info(f"网络稳定性分析完成: {edge_file}")
+            return str(edge_file)
+
+        except Exception as e:
+            logger.error(f"网络稳定性分析失败: {e}")
+            return ""
+
+    def run_group_comparison(self, abundance_file: str, metadata_file: str,
+                             group_column: str = 'group', method: str = 'spearman') -> str:
+        """
+        分组差异网络分析
+
+        丰度表只读取和预处理一次；各分组的相关矩阵在进程池中并行计算，随后对所有
+        分组两两比较，以 Fisher z 变换检验全部物种对的相关系数差异（向量化），
+        并进行 BH 校正。
+
+        Args:
+            abundance_file: 物种丰度文件路径
+            metadata_file: 样本元数据文件路径（如 config/samples.tsv）
+            group_column: 分组列名
+            method: 相关性计算方法 ('spearman', 'pearson')
+
+        Returns:
+            分组比较报告文件路径
+        """
+        logger.info(f"开始分组差异网络分析，分组列: {group_column}")
+
+        try:
+            if method not in ('spearman', 'pearson'):
+                raise ValueError(f"分组比较不支持的相关性方法: {method}")
+
+            # Fisher z 方差为 1/(n-3)，每组至少需要 4 个样本
+            min_samples = self.config.get('network_analysis', {}).get('group_comparison', {}).get('min_samples', 5)
+            if not isinstance(min_samples, int) or min_samples < 4:
+                raise ValueError(f"group_comparison.min_samples 必须为不小于 4 的整数: {min_samples}")
+
+            network_config = self.config.get('network_analysis', {})
+            comparison_config = network_config.get('group_comparison', {})
+            corr_threshold = network_config.get('correlation_threshold', 0.6)
+            pval_threshold = network_config.get('pvalue_threshold', 0.05)
+            fdr_threshold = comparison_config.get('fdr_threshold', 0.05)
+
+            comparison_dir = self.output_dir / "group_comparison"
+            comparison_dir.mkdir(parents=True, exist_ok=True)
+
+            # 读取并预处理一次，各分组共享
+            df = pd.read_csv(abundance_file, sep='\t', index_col=0)
+            df = self._preprocess_abundance_data(df)
+            metadata = pd.read_csv(metadata_file, sep='\t', index_col=0, dtype=str)
+            if group_column not in metadata.columns:
+                raise ValueError(f"元数据中不存在分组列: {group_column}")
+
+            sample_groups = metadata[group_column].reindex(df.columns)
+            groups = {}
+            for group, samples in sample_groups.dropna().groupby(sample_groups.dropna()):
+                columns = np.flatnonzero(df.columns.isin(samples.index))
+                if len(columns) < min_samples:
+                    logger.warning(f"分组 {group} 仅有 {len(columns)} 个样本，跳过")
+                    continue
+                groups[group] = columns
+            if len(groups) < 2:
+                raise ValueError("至少需要两个样本数充足的分组")
+
+            values = df.to_numpy(dtype=float)
+            features = df.index.to_numpy()
+            group_names = list(groups)
+            n_jobs = min(self._get_n_jobs(), len(group_names))
+
+            executor = None
+            if n_jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_group_worker,
+                                               initargs=(values,))
+            else:
+                _init_group_worker(values)
+            try:
+                map_fn = executor.map if executor else map
+                results = dict(zip(group_names, map_fn(_group_correlation_task,
+                                                        [groups[g] for g in group_names],
+                                                        [method] * len(group_names))))
+            finally:
+                if executor:
+                    executor.shutdown()
+
+            # 各分组网络
+            summary_rows = []
+            group_edges = {}
+            for group in group_names:
+                corr, p_values = results[group]
+                G = _build_graph(features, corr, p_values, corr_threshold, pval_threshold)
+                safe_name = "".join(c if c.isalnum() or c in '-_' else '_' for c in str(group))
+                nx.write_gml(G, comparison_dir / f"{safe_name}_network.gml")
+                group_edges[group] = {tuple(sorted(e)) for e in G.edges()}
+                positive = sum(1 for _, _, d in G.edges(data=True) if d['edge_type'] == 'positive')
+                summary_rows.append({
+                    'group': group,
+                    'samples': len(groups[group]),
+                    'nodes': G.number_of_nodes(),
+                    'edges': G.number_of_edges(),
+                    'positive_edges': positive,
+                    'negative_edges': G.number_of_edges() - positive,
+                    'density': nx.density(G),
+                    'average_clustering': nx.average_clustering(G),
+                })
+            summary_df = pd.DataFrame(summary_rows)
+
+            # 两两比较: Fisher z 差异检验（Spearman 方差采用 1.06/(n-3) 校正）
+            upper_i, upper_j = np.triu_indices(len(features), k=1)
+            variance_factor = 1.06 if method == 'spearman' else 1.0
+            differential = []
+            pair_rows = []
+            for a_idx, group_a in enumerate(group_names):
+                for group_b in group_names[a_idx + 1:]:
+                    r_a = results[group_a][0][upper_i, upper_j]
+                    r_b = results[group_b][0][upper_i, upper_j]
+                    n_a, n_b = len(groups[group_a]), len(groups[group_b])
+                    z_a = np.arctanh(np.clip(r_a, -0.999999, 0.999999))
+                    z_b = np.arctanh(np.clip(r_b, -0.999999, 0.999999))
+                    z_diff = (z_a - z_b) / np.sqrt(variance_factor * (1.0 / (n_a - 3) + 1.0 / (n_b - 3)))
+                    p_diff = 2.0 * norm.sf(np.abs(np.nan_to_num(z_diff)))
+                    q_diff = bh_adjust(p_diff)
+
+                    hits = np.flatnonzero(q_diff <= fdr_threshold)
+                    differential.append(pd.DataFrame({
+                        'group_a': group_a,
+                        'group_b': group_b,
+                        'source': features[upper_i[hits]],
+                        'target': features[upper_j[hits]],
+                        'correlation_a': r_a[hits],
+                        'correlation_b': r_b[hits],
+                        'z_score': z_diff[hits],
+                        'pvalue': p_diff[hits],
+                        'qvalue': q_diff[hits],
+                    }))
+
+                    edges_a, edges_b = group_edges[group_a], group_edges[group_b]
+                    union = edges_a | edges_b
+                    pair_rows.append({
+                        'group_a': group_a,
+                        'group_b': group_b,
+                        'shared_edges': len(edges_a & edges_b),
+                        'edges_only_a': len(edges_a - edges_b),
+                        'edges_only_b': len(edges_b - edges_a),
+                        'edge_jaccard': len(edges_a & edges_b) / len(union) if union else 0.0,
+                        'differential_edges': len(hits),
+                    })
+
+            differential_df = pd.concat(differential, ignore_index=True).sort_values('qvalue')
+            pairs_df = pd.DataFrame(pair_rows)
+
+            summary_df.to_csv(comparison_dir / "group_network_summary.tsv", sep='\t', index=False)
+            pairs_df.to_csv(comparison_dir / "group_pair_comparison.tsv", sep='\t', index=False)
+            differential_df.to_csv(comparison_dir / "differential_edges.tsv", sep='\t', index=False)
+
+            report_file = comparison_dir / "group_comparison_report.html"
+            with open(report_file, 'w', encoding='utf-8') as f:
+                f.write(self._create_group_comparison_html_report(summary_df, pairs_df, differential_df))
+
+            logger.info(f"分组差异网络分析完成: {report_file}")
+            return str(report_file)
+
+        except Exception as e:
+            logger.error(f"分组差异网络分析失败: {e}")
+            return ""
+
+    def _create_group_comparison_html_report(self, summary_df: pd.DataFrame, pairs_df: pd.DataFrame,
+                                             differential_df: pd.DataFrame) -> str:
+        """创建分组比较HTML报告"""
+        html_content = f"""
+        <!DOCTYPE html>
+        <html lang="zh-CN">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>MICOS-2024 分组差异网络报告</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                .header {{ text-align: center; background-color: #f0f0f0; padding: 20px; }}
+                .section {{ margin: 20px 0; }}
+                table {{ border-collapse: collapse; width: 100%; }}
+                th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+                th {{ background-color: #f2f2f2; }}
+            </style>
+        </head>
+        <body>
+            <div class="header">
+                <h1>MICOS-2024 分组差异网络报告</h1>
+                <p>生成时间: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            </div>
+
+            <div class="section">
+                <h2>各分组网络统计</h2>
+                {summary_df.to_html(index=False, float_format='%.4f')}
+            </div>
+
+            <div class="section">
+                <h2>分组两两比较</h2>
+                {pairs_df.to_html(index=False, float_format='%.4f')}
+            </div>
+
+            <div class="section">
+                <h2>差异最显著的边 (前50)</h2>
+                {differential_df.head(50).to_html(index=False, float_format='%.4g')}
+            </div>
+
+            <div class="section">
+                <h2>分析文件</h2>
+                <ul>
+                    <li><a href="group_network_summary.tsv">各分组网络统计</a></li>
+                    <li><a href="group_pair_comparison.tsv">分组两两比较</a></li>
+                    <li><a href="differential_edges.tsv">全部差异边</a></li>
+                </ul>
+            </div>
+        </body>
+        </html>
+        """
+
+        return html_content
+
     def generate_network_report(self, network_file: str) -> str:
         """
         生成网络分析报告
@@ -551,17 +1401,27 @@ def main():
     parser.add_argument('-c', '--config', required=True, help='配置文件路径')
     parser.add_argument('-i', '--input', required=True, help='物种丰度文件路径')
     parser.add_argument('-o', '--output', required=True, help='输出目录路径')
-    parser.add_argument('--method', choices=['spearman', 'pearson'],
+    parser.add_argument('--method', choices=['spearman', 'pearson', 'sparcc'],
                        default='spearman', help='相关性计算方法')
-    parser.add_argument('--mode', choices=['correlation', 'network', 'complete'],
+    parser.add_argument('--mode', choices=['correlation', 'network', 'complete', 'stability', 'grouped'],
                        default='complete', help='分析模式')
-    parser.add_argument('--layout', choices=['spring', 'circular', 'kamada_kawai'],
+    parser.add_argument('--layout', choices=['spring', 'circular', 'kamada_kawai', 'sparse_stress'],
                        default='spring', help='网络布局算法')
+    parser.add_argument('--layout-time-budget', type=float, default=None,
+                       help='大图布局时间预算（秒）')
+    parser.add_argument('--metadata', help='样本元数据文件路径 (grouped 模式必需)')
+    parser.add_argument('--group-column', default='group', help='元数据中的分组列名')
+    parser.add_argument('--stability-rounds', type=int, default=None,
+                       help='稳定性分析子抽样轮数 (默认: 100)')
+    parser.add_argument('--subsample-fraction', type=float, default=None,
+                       help='稳定性分析每轮抽取的样本比例 (默认: 0.8)')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='并行进程数 (默认: 配置中的 resources.max_threads 或全部CPU核心)')
 
     args = parser.parse_args()
 
     # 创建分析器
-    analyzer = NetworkAnalyzer(args.config, args.output)
+    analyzer = NetworkAnalyzer(args.config, args.output, threads=args.threads)
 
     # 根据模式运行分析
     if args.mode == 'correlation':
@@ -572,6 +1432,24 @@ def main():
         logger.error("网络模式需要先运行相关性分析")
         sys.exit(1)
 
+    elif args.mode == 'stability':
+        stability_file = analyzer.run_stability_analysis(args.input, args.method,
+                                                         args.stability_rounds,
+                                                         args.subsample_fraction)
+        if not stability_file:
+            logger.error("网络稳定性分析失败")
+            sys.exit(1)
+
+    elif args.mode == 'grouped':
+        if not args.metadata:
+            logger.error("grouped 模式需要通过 --metadata 提供样本元数据文件")
+            sys.exit(1)
+        report_file = analyzer.run_group_comparison(args.input, args.metadata,
+                                                    args.group_column, args.method)
+        if not report_file:
+            logger.error("分组差异网络分析失败")
+            sys.exit(1)
+
     elif args.mode == 'complete':
         # 运行完整分析流程
         logger.info("开始完整网络分析流程...")
@@ -595,7 +1473,8 @@ def main():
             logger.info(f"拓扑分析完成: {topology_file}")
 
         # 4. 网络可视化
-        viz_file = analyzer.visualize_network(network_file, args.layout)
+        viz_file = analyzer.visualize_network(network_file, args.layout,
+                                             args.layout_time_budget)
         if viz_file:
             logger.info(f"网络可视化完成: {viz_file}")
 
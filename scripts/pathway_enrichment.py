@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 通路丰度与富集分析
+Sparse Pathway Aggregation and Hypergeometric Enrichment
+
+以稀疏指示矩阵完成通路层面的汇总与富集检验：
+1. 由 (基因, 通路) 注释对构建 通路 × 基因 的 0/1 稀疏指示矩阵
+2. 指示矩阵与 基因 × 样本 丰度矩阵相乘，一次得到全部样本的通路丰度
+3. 前景基因集的通路计数同样为一次稀疏矩阵-向量乘法，
+   对全部通路向量化计算超几何（单侧 Fisher 精确）检验 P 值并做 BH 校正
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import hypergeom
+
+from stats_utils import bh_adjust
+
+logger = logging.getLogger(__name__)
+
+
+def indicator_matrix(gene_ids: pd.Series, term_ids: pd.Series,
+                     genes: pd.Index) -> Tuple[sparse.csr_matrix, pd.Index]:
+    """
+    构建 注释 × 基因 稀疏指示矩阵
+
+    Args:
+        gene_ids: 注释对中的基因ID
+        term_ids: 注释对中的注释ID（如通路）
+        genes: 矩阵列对应的基因顺序，不在其中的注释对被忽略
+
+    Returns:
+        (CSR 指示矩阵, 行对应的注释ID)
+    """
+    columns = genes.get_indexer(pd.Index(gene_ids.astype(str)))
+    keep = columns >= 0
+    rows, terms = pd.factorize(pd.Series(term_ids.astype(str).to_numpy()[keep]), sort=True)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, columns[keep])),
+                               shape=(len(terms), len(genes)))
+    # 同一 (基因, 注释) 对只计一次
+    matrix.data[:] = 1.0
+    return matrix, pd.Index(terms)
+
+
+def hypergeometric_enrichment(indicator: sparse.csr_matrix, foreground: np.ndarray) -> pd.DataFrame:
+    """
+    全部注释的超几何富集检验
+
+    Args:
+        indicator: 注释 × 基因 指示矩阵（列为背景基因集）
+        foreground: 长度为基因数的布尔向量，标记前景基因
+
+    Returns:
+        DataFrame: pathway_size, foreground_count, expected, fold_enrichment, p_value, q_value
+    """
+    foreground = np.asarray(foreground, dtype=bool)
+    n_background = indicator.shape[1]
+    n_foreground = int(foreground.sum())
+    pathway_size = np.asarray(indicator.sum(axis=1)).ravel()
+    hits = indicator @ foreground.astype(np.float64)
+
+    expected = pathway_size * n_foreground / n_background if n_background else np.zeros_like(hits)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fold = np.where(expected > 0, hits / expected, np.nan)
+    # P(X >= k)，X ~ Hypergeom(背景数, 通路大小, 前景数)
+    p_values = hypergeom.sf(hits - 1, n_background, pathway_size, n_foreground)
+    p_values = np.clip(np.nan_to_num(p_values, nan=1.0), 0.0, 1.0)
+    return pd.DataFrame({'pathway_size': pathway_size.astype(np.int64),
+                         'foreground_count': hits.astype(np.int64),
+                         'expected': expected, 'fold_enrichment': fold,
+                         'p_value': p_values, 'q_value': bh_adjust(p_values)})
+
+
+def pathway_enrichment(annotations: pd.DataFrame, abundance: pd.DataFrame,
+                       foreground_genes: Optional[pd.Index] = None,
+                       foreground_quantile: float = 0.9) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    通路丰度汇总与富集分析
+
+    Args:
+        annotations: 含 gene_id、pathway_id（可选 pathway_name）列的注释表
+        abundance: 基因 × 样本 丰度表
+        foreground_genes: 前景基因；为空时取平均丰度位于 foreground_quantile 分位以上的基因
+        foreground_quantile: 默认前景基因的平均丰度分位阈值
+
+    Returns:
+        (通路汇总与富集结果, 通路 × 样本 丰度表)
+    """
+    # 背景: 丰度表中有注释的基因
+    annotated = pd.Index(annotations['gene_id'].astype(str).unique())
+    genes = pd.Index(abundance.index.astype(str))
+    genes = genes[genes.isin(annotated)].unique()
+    values = abundance.loc[abundance.index.astype(str).isin(genes)]
+    values = values.groupby(values.index.astype(str)).sum().reindex(genes)
+    matrix = values.to_numpy(dtype=np.float64)
+
+    indicator, pathways = indicator_matrix(annotations['gene_id'], annotations['pathway_id'], genes)
+    logger.info(f"通路汇总: {len(pathways)} 个通路 × {len(genes)} 个基因 × {matrix.shape[1]} 个样本")
+
+    per_sample = pd.DataFrame(indicator @ matrix, index=pathways, columns=values.columns)
+    per_sample.index.name = 'pathway_id'
+
+    mean_abundance = matrix.mean(axis=1) if matrix.shape[1] else np.zeros(len(genes))
+    if foreground_genes is not None:
+        foreground = genes.isin(pd.Index(foreground_genes).astype(str))
+    else:
+        threshold = np.quantile(mean_abundance, foreground_quantile) if len(genes) else 0.0
+        foreground = (mean_abundance >= threshold) & (mean_abundance > 0)
+
+    test = hypergeometric_enrichment(indicator, foreground)
+    if 'pathway_name' in annotations.columns:
+        names = annotations.drop_duplicates('pathway_id').set_index('pathway_id')['pathway_name']
+        pathway_ids = pd.Series(pathways)
+        pathway_names = pathway_ids.map(names).fillna(pathway_ids).to_numpy()
+    else:
+        pathway_names = pathways.to_numpy()
+    total_abundance = indicator @ mean_abundance
+    gene_count = test.pop('pathway_size').to_numpy()
+    results = pd.concat([pd.DataFrame({
+        'pathway_id': pathways,
+        'pathway_name': pathway_names,
+        'gene_count': gene_count,
+        'total_abundance': total_abundance,
+        'avg_abundance_per_gene': total_abundance / np.maximum(gene_count, 1)
+    }), test], axis=1)
+    return results.sort_values('total_abundance', ascending=False).reset_index(drop=True), per_sample
@@ -19,18 +19,24 @@ import logging
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from Bio import SeqIO, Phylo
-from Bio.Phylo.TreeConstruction import DistanceCalculator, DistanceTreeConstructor
-from Bio.Align import MultipleSeqAlignment
+from Bio import SeqIO
 from Bio.SeqRecord import SeqRecord
 from Bio.Seq import Seq
 import matplotlib.pyplot as plt
-import seaborn as sns
 from scipy.cluster.hierarchy import dendrogram, linkage
 from scipy.spatial.distance import squareform
-import subprocess
 import tempfile
 
+from tree_arrays import ArrayTree, read_newick, faith_pd
+from unifrac import unifrac
+from alignment_distance import read_alignment, pairwise_distances
+from neighbor_joining import neighbor_joining
+from reference_store import ReferenceStore
+from alignment_manager import AlignmentManager
+from ordination import pcoa
+from distance_heatmap import plot_distance_heatmap
+from tree_plot import plot_tree
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -41,29 +47,65 @@ logger = logging.getLogger(__name__)
 class PhylogeneticAnalyzer:
     """系统发育分析类"""
     
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, threads=None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.threads = threads or os.cpu_count() or 1
+
+    def load_tree(self, tree_file, tips=None) -> ArrayTree:
+        """读取系统发育树为数组化结构，可选地剪枝到指定taxa"""
+        tree = read_newick(tree_file)
+        if tips is not None:
+            tips = [str(tip) for tip in tips]
+            missing = sum(1 for tip in tips if tip not in tree.tip_index)
+            if missing:
+                logger.warning(f"{missing} 个taxa不在系统发育树中，将被忽略")
+            tree = tree.prune(tips)
+        return tree
         
-    def extract_representative_sequences(self, biom_file, taxonomy_file, output_fasta):
-        """从分类结果中提取代表性序列"""
+    def extract_representative_sequences(self, biom_file, taxonomy_file, output_fasta,
+                                         reference_fasta=None, reference_taxonomy=None, top_n=50):
+        """
+        从参考序列库中提取丰度最高的taxa的代表性序列
+
+        参考序列库首次使用时建立 faidx 索引，之后按偏移直接读取；
+        taxa 按 taxid 列（如有）或分类字符串匹配到参考序列。
+        """
         logger.info("提取代表性序列...")
         
+        if not reference_fasta:
+            logger.error("未提供参考序列库 (--reference-fasta)，无法提取代表性序列")
+            return None
+        
         try:
             # 读取分类信息
             taxonomy_df = pd.read_csv(taxonomy_file, sep='\t')
             
-            # 获取前50个最丰富的taxa
-            top_taxa = taxonomy_df.nlargest(50, 'abundance')
+            # 获取丰度最高的taxa
+            top_taxa = taxonomy_df.nlargest(top_n, 'abundance')
+            taxon_column = 'taxid' if 'taxid' in top_taxa.columns else 'taxonomy'
             
-            # 创建模拟序列（实际应用中应从数据库获取真实序列）
             sequences = []
-            for idx, row in top_taxa.iterrows():
-                # 生成模拟序列
-                seq_id = f"taxa_{idx}"
-                # 这里应该从参考数据库获取真实序列
-                mock_seq = "ATCG" * 250  # 1000bp模拟序列
-                sequences.append(SeqRecord(Seq(mock_seq), id=seq_id, description=row['taxonomy']))
+            with ReferenceStore(reference_fasta, reference_taxonomy) as store:
+                # 每个taxon取第一条匹配的参考序列
+                matched = {}
+                for idx, row in top_taxa.iterrows():
+                    seq_ids = store.sequences_for_taxon(row[taxon_column])
+                    if seq_ids:
+                        matched[idx] = seq_ids[0]
+                    else:
+                        logger.warning(f"参考序列库中未找到: {row[taxon_column]}")
+                
+                reference_seqs = store.fetch_many(matched.values())
+                for idx, ref_id in matched.items():
+                    row = top_taxa.loc[idx]
+                    seq_id = str(row['Feature ID']) if 'Feature ID' in row else f"taxa_{idx}"
+                    sequences.append(SeqRecord(Seq(reference_seqs[ref_id]), id=seq_id,
+                                               description=f"{ref_id} {row['taxonomy']}"))
+            
+            if not sequences:
+                logger.error("没有taxa匹配到参考序列")
+                return None
             
             # 保存序列
             SeqIO.write(sequences, output_fasta, "fasta")
@@ -75,36 +117,35 @@ class PhylogeneticAnalyzer:
             logger.error(f"提取代表性序列失败: {e}")
             return None
     
-    def align_sequences(self, input_fasta, output_alignment):
-        """使用MAFFT进行多序列比对"""
+    def align_sequences(self, input_fasta, output_alignment, cache_dir=None):
+        """
+        使用MAFFT进行多序列比对
+
+        比对结果按输入序列内容缓存；新增少量序列时以缓存比对为参考增量加入。
+        """
         logger.info("进行多序列比对...")
         
-        try:
-            # 检查MAFFT是否可用
-            result = subprocess.run(['mafft', '--version'], 
-                                  capture_output=True, text=True)
-            if result.returncode != 0:
-                logger.warning("MAFFT未安装，使用简单比对方法")
+        manager = AlignmentManager(cache_dir or self.output_dir / "alignment_cache",
+                                   threads=self.threads)
+        if not manager.is_available():
+            # 仅当输入序列已等长（已比对）时才可跳过MAFFT
+            lengths = {len(record.seq) for record in SeqIO.parse(input_fasta, "fasta")}
+            if len(lengths) == 1:
+                logger.warning("MAFFT未安装，输入序列已等长，直接作为比对结果使用")
                 return self._simple_alignment(input_fasta, output_alignment)
-            
-            # 运行MAFFT
-            cmd = ['mafft', '--auto', '--quiet', str(input_fasta)]
-            with open(output_alignment, 'w') as f:
-                result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True)
-            
-            if result.returncode == 0:
-                logger.info(f"多序列比对完成: {output_alignment}")
-                return output_alignment
-            else:
-                logger.error(f"MAFFT运行失败: {result.stderr}")
-                return None
-                
-        except FileNotFoundError:
-            logger.warning("MAFFT未找到，使用简单比对方法")
-            return self._simple_alignment(input_fasta, output_alignment)
+            logger.error("MAFFT未安装，无法比对不等长序列")
+            return None
+        
+        try:
+            manager.align(str(input_fasta), str(output_alignment))
+            logger.info(f"多序列比对完成: {output_alignment}")
+            return output_alignment
+        except Exception as e:
+            logger.error(f"多序列比对失败: {e}")
+            return None
     
     def _simple_alignment(self, input_fasta, output_alignment):
-        """简单的序列比对（当MAFFT不可用时）"""
+        """将序列填充到相同长度后写出（当MAFFT不可用时）"""
         sequences = list(SeqIO.parse(input_fasta, "fasta"))
         
         # 找到最长序列的长度
@@ -121,24 +162,23 @@ class PhylogeneticAnalyzer:
         logger.info(f"简单比对完成: {output_alignment}")
         return output_alignment
     
-    def build_phylogenetic_tree(self, alignment_file, output_tree):
+    def build_phylogenetic_tree(self, alignment_file, output_tree, distance_model='identity'):
         """构建系统发育树"""
         logger.info("构建系统发育树...")
         
         try:
-            # 读取比对结果
-            alignment = MultipleSeqAlignment(SeqIO.parse(alignment_file, "fasta"))
+            # 读取比对结果并编码为矩阵
+            names, encoded = read_alignment(alignment_file)
             
-            # 计算距离矩阵
-            calculator = DistanceCalculator('identity')
-            distance_matrix = calculator.get_distance(alignment)
+            # 计算距离矩阵（向量化行块并行计算）
+            distances = pairwise_distances(encoded, distance_model, n_jobs=self.threads)
+            distance_matrix = pd.DataFrame(distances, index=names, columns=names)
             
-            # 构建邻接法系统发育树
-            constructor = DistanceTreeConstructor(calculator, 'nj')
-            tree = constructor.build_tree(alignment)
+            # 构建邻接法系统发育树（直接在距离矩阵上原位计算）
+            tree = neighbor_joining(distances, names)
             
             # 保存树文件
-            Phylo.write(tree, output_tree, "newick")
+            tree.write_newick(output_tree)
             logger.info(f"系统发育树构建完成: {output_tree}")
             
             return tree, distance_matrix
@@ -147,25 +187,22 @@ class PhylogeneticAnalyzer:
             logger.error(f"构建系统发育树失败: {e}")
             return None, None
     
-    def visualize_phylogenetic_tree(self, tree_file, output_plot):
-        """可视化系统发育树"""
+    def visualize_phylogenetic_tree(self, tree_file, output_plot, layout='rectangular',
+                                    collapse_size=None):
+        """
+        可视化系统发育树
+
+        布局由数组化树计算，全部分支以单个 LineCollection 绘制；
+        collapse_size 指定时将叶节点数不超过该值的分支折叠为楔形。
+        """
         logger.info("生成系统发育树可视化...")
         
         try:
             # 读取树文件
-            tree = Phylo.read(tree_file, "newick")
-            
-            # 创建图形
-            fig, ax = plt.subplots(1, 1, figsize=(12, 10))
+            tree = read_newick(tree_file)
             
             # 绘制系统发育树
-            Phylo.draw(tree, axes=ax, do_show=False)
-            ax.set_title("Phylogenetic Tree", fontsize=16, fontweight='bold')
-            
-            # 保存图形
-            plt.tight_layout()
-            plt.savefig(output_plot, dpi=300, bbox_inches='tight')
-            plt.close()
+            plot_tree(tree, output_plot, layout=layout, collapse_size=collapse_size)
             
             logger.info(f"系统发育树可视化完成: {output_plot}")
             
@@ -178,18 +215,18 @@ class PhylogeneticAnalyzer:
         
         try:
             # 读取树和丰度表
-            tree = Phylo.read(tree_file, "newick")
+            tree = read_newick(tree_file)
             abundance_df = pd.read_csv(abundance_table, index_col=0)
-            
-            # 计算Faith's PD (简化版本)
-            pd_values = {}
-            for sample in abundance_df.columns:
-                # 获取该样本中存在的taxa
-                present_taxa = abundance_df[abundance_df[sample] > 0].index.tolist()
-                
-                # 计算这些taxa的总分支长度（简化计算）
-                total_branch_length = len(present_taxa) * 0.1  # 模拟分支长度
-                pd_values[sample] = total_branch_length
+
+            # 将taxa映射到叶节点
+            tip_nodes = tree.tip_mask(abundance_df.index.astype(str))
+            missing = int((tip_nodes < 0).sum())
+            if missing:
+                logger.warning(f"{missing} 个taxa不在系统发育树中，计算PD时将被忽略")
+
+            # 一次后序传播计算全部样本的 Faith's PD
+            pd_array = faith_pd(tree, abundance_df.to_numpy() > 0, tip_nodes)
+            pd_values = dict(zip(abundance_df.columns, pd_array))
             
             # 保存结果
             pd_df = pd.DataFrame.from_dict(pd_values, orient='index', columns=['Faiths_PD'])
@@ -202,62 +239,118 @@ class PhylogeneticAnalyzer:
             logger.error(f"计算系统发育多样性失败: {e}")
             return None
     
-    def calculate_unifrac_distances(self, tree_file, abundance_table, output_file):
-        """计算UniFrac距离"""
-        logger.info("计算UniFrac距离...")
+    def calculate_unifrac_distances(self, tree_file, abundance_table, output_file,
+                                    metric='unweighted', max_csv_samples=2000):
+        """
+        计算UniFrac距离
+
+        距离矩阵以 .npy 内存映射文件写在 output_file 旁（样本ID写入 .ids.txt），
+        样本数不超过 max_csv_samples 时同时写出CSV。
+        """
+        logger.info(f"计算UniFrac距离 ({metric})...")
         
         try:
             # 读取数据
             abundance_df = pd.read_csv(abundance_table, index_col=0)
-            
-            # 简化的UniFrac距离计算（实际应使用专门的库如scikit-bio）
             samples = abundance_df.columns.tolist()
-            n_samples = len(samples)
-            
-            # 初始化距离矩阵
-            unifrac_matrix = np.zeros((n_samples, n_samples))
-            
-            # 计算样本间距离
-            for i in range(n_samples):
-                for j in range(i+1, n_samples):
-                    sample1 = abundance_df[samples[i]]
-                    sample2 = abundance_df[samples[j]]
-                    
-                    # 简化的Bray-Curtis距离作为UniFrac的近似
-                    numerator = np.sum(np.abs(sample1 - sample2))
-                    denominator = np.sum(sample1 + sample2)
-                    distance = numerator / denominator if denominator > 0 else 0
-                    
-                    unifrac_matrix[i, j] = distance
-                    unifrac_matrix[j, i] = distance
-            
-            # 保存距离矩阵
-            unifrac_df = pd.DataFrame(unifrac_matrix, index=samples, columns=samples)
-            unifrac_df.to_csv(output_file)
+
+            # 剪枝到丰度表中的taxa，减少需要处理的节点
+            tree = self.load_tree(tree_file, tips=abundance_df.index)
+            tip_nodes = tree.tip_mask(abundance_df.index.astype(str))
+
+            # 条带化并行计算，结果写入内存映射文件
+            matrix_file = Path(output_file).with_suffix('.npy')
+            distances = unifrac(tree, abundance_df.to_numpy(dtype=float), tip_nodes,
+                                metric=metric, n_jobs=self.threads, output_path=str(matrix_file))
+            Path(output_file).with_suffix('.ids.txt').write_text('\n'.join(map(str, samples)) + '\n')
+
+            unifrac_df = pd.DataFrame(distances, index=samples, columns=samples)
+            if len(samples) <= max_csv_samples:
+                unifrac_df.to_csv(output_file)
+            else:
+                logger.info(f"样本数 {len(samples)} 超过 {max_csv_samples}，仅输出 {matrix_file}")
             
-            logger.info(f"UniFrac距离计算完成: {output_file}")
+            logger.info(f"UniFrac距离计算完成: {matrix_file}")
             return unifrac_df
             
         except Exception as e:
             logger.error(f"计算UniFrac距离失败: {e}")
             return None
     
-    def generate_distance_heatmap(self, distance_matrix_file, output_plot):
-        """生成距离矩阵热图"""
+    def load_distance_matrix(self, distance_file):
+        """
+        读取距离矩阵: .npy 以内存映射方式打开（样本ID来自同名 .ids.txt），其他按CSV读取
+
+        Returns:
+            (样本ID列表, 距离矩阵)
+        """
+        distance_file = Path(distance_file)
+        if distance_file.suffix == '.npy':
+            matrix = np.load(distance_file, mmap_mode='r')
+            ids_file = distance_file.with_suffix('.ids.txt')
+            if ids_file.exists():
+                ids = ids_file.read_text().split('\n')[:matrix.shape[0]]
+            else:
+                ids = [f"Sample{i + 1}" for i in range(matrix.shape[0])]
+            return ids, matrix
+        distance_df = pd.read_csv(distance_file, index_col=0)
+        return distance_df.index.astype(str).tolist(), distance_df.to_numpy(dtype=float)
+    
+    def calculate_pcoa(self, distance_file, output_prefix, n_components=3):
+        """
+        主坐标分析 (PCoA)
+
+        大矩阵使用隐式双中心化 + 随机化特征分解；输出坐标、解释比例和散点图。
+        """
+        logger.info("进行PCoA排序分析...")
+        
+        try:
+            ids, distances = self.load_distance_matrix(distance_file)
+            coordinates, eigvals, proportion = pcoa(distances, n_components)
+            axes = [f"PC{i + 1}" for i in range(coordinates.shape[1])]
+            
+            # 保存坐标与解释比例
+            coords_df = pd.DataFrame(coordinates, index=ids, columns=axes)
+            coords_df.index.name = 'sample_id'
+            coords_df.to_csv(f"{output_prefix}_coordinates.tsv", sep='\t')
+            pd.DataFrame({'axis': axes, 'eigenvalue': eigvals, 'proportion_explained': proportion}
+                         ).to_csv(f"{output_prefix}_proportion_explained.tsv", sep='\t', index=False)
+            
+            # 绘制前两个主轴
+            fig, ax = plt.subplots(figsize=(8, 7))
+            y = coordinates[:, 1] if coordinates.shape[1] > 1 else np.zeros(len(ids))
+            ax.scatter(coordinates[:, 0], y, s=max(2, 40 - len(ids) // 100), alpha=0.7,
+                       color='steelblue', edgecolors='none', rasterized=len(ids) > 2000)
+            ax.set_xlabel(f"PC1 ({proportion[0]:.1%})")
+            if len(proportion) > 1:
+                ax.set_ylabel(f"PC2 ({proportion[1]:.1%})")
+            ax.set_title("PCoA", fontsize=16, fontweight='bold')
+            plt.tight_layout()
+            plt.savefig(f"{output_prefix}.png", dpi=300, bbox_inches='tight')
+            plt.close()
+            
+            logger.info(f"PCoA完成: {output_prefix}_coordinates.tsv")
+            return coords_df
+            
+        except Exception as e:
+            logger.error(f"PCoA排序分析失败: {e}")
+            return None
+    
+    def generate_distance_heatmap(self, distance_matrix_file, output_plot, max_blocks=200):
+        """
+        生成距离矩阵热图
+
+        样本按层次聚类排序；样本数超过 max_blocks 时按块平均降采样后渲染。
+        """
         logger.info("生成距离矩阵热图...")
         
         try:
             # 读取距离矩阵
-            distance_df = pd.read_csv(distance_matrix_file, index_col=0)
+            sample_ids, distances = self.load_distance_matrix(distance_matrix_file)
             
-            # 创建热图
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(distance_df, annot=True, cmap='viridis', 
-                       square=True, linewidths=0.5)
-            plt.title("UniFrac Distance Matrix", fontsize=16, fontweight='bold')
-            plt.tight_layout()
-            plt.savefig(output_plot, dpi=300, bbox_inches='tight')
-            plt.close()
+            # 聚类排序、降采样并渲染
+            plot_distance_heatmap(distances, sample_ids, output_plot,
+                                  title="UniFrac Distance Matrix", max_blocks=max_blocks)
             
             logger.info(f"距离矩阵热图完成: {output_plot}")
             
@@ -270,11 +363,27 @@ def main():
     parser.add_argument("--taxonomy", required=True, help="分类信息文件")
     parser.add_argument("--abundance", required=True, help="丰度表文件")
     parser.add_argument("--output", required=True, help="输出目录")
+    parser.add_argument("--reference-fasta", help="参考序列库FASTA (首次使用时建立 .fai 索引)")
+    parser.add_argument("--reference-taxonomy", help="参考序列分类文件 (序列ID<TAB>分类)")
+    parser.add_argument("--unifrac-metric", default="unweighted",
+                        choices=["unweighted", "weighted_normalized", "weighted_unnormalized"],
+                        help="UniFrac距离指标")
+    parser.add_argument("--alignment-cache", help="比对缓存目录 (默认: <输出目录>/alignment_cache)")
+    parser.add_argument("--distance-model", default="identity",
+                        choices=["identity", "p", "jc69", "k2p"],
+                        help="建树使用的序列距离模型")
+    parser.add_argument("--tree-layout", default="rectangular", choices=["rectangular", "circular"],
+                        help="系统发育树布局")
+    parser.add_argument("--collapse-clade-size", type=int, default=None,
+                        help="将叶节点数不超过该值的分支折叠为楔形")
+    parser.add_argument("--heatmap-max-blocks", type=int, default=200,
+                        help="距离热图的最大显示块数 (超过时按块平均降采样)")
+    parser.add_argument("--threads", type=int, default=None, help="并行进程数 (默认: 全部CPU核心)")
     
     args = parser.parse_args()
     
     # 创建分析器
-    analyzer = PhylogeneticAnalyzer(args.output)
+    analyzer = PhylogeneticAnalyzer(args.output, threads=args.threads)
     
     # 定义输出文件路径
     rep_seqs = analyzer.output_dir / "representative_sequences.fasta"
@@ -289,27 +398,36 @@ def main():
     logger.info("开始系统发育分析...")
     
     # 1. 提取代表性序列
-    if analyzer.extract_representative_sequences(args.biom, args.taxonomy, rep_seqs):
+    if analyzer.extract_representative_sequences(args.biom, args.taxonomy, rep_seqs,
+                                                 args.reference_fasta, args.reference_taxonomy):
         
         # 2. 多序列比对
-        if analyzer.align_sequences(rep_seqs, alignment):
+        if analyzer.align_sequences(rep_seqs, alignment, args.alignment_cache):
             
             # 3. 构建系统发育树
-            tree, distance_matrix = analyzer.build_phylogenetic_tree(alignment, tree_file)
+            tree, distance_matrix = analyzer.build_phylogenetic_tree(alignment, tree_file,
+                                                                     args.distance_model)
             
             if tree:
                 # 4. 可视化系统发育树
-                analyzer.visualize_phylogenetic_tree(tree_file, tree_plot)
+                analyzer.visualize_phylogenetic_tree(tree_file, tree_plot, args.tree_layout,
+                                                     args.collapse_clade_size)
                 
                 # 5. 计算系统发育多样性
                 analyzer.calculate_phylogenetic_diversity(tree_file, args.abundance, pd_file)
                 
                 # 6. 计算UniFrac距离
-                unifrac_df = analyzer.calculate_unifrac_distances(tree_file, args.abundance, unifrac_file)
+                unifrac_df = analyzer.calculate_unifrac_distances(tree_file, args.abundance, unifrac_file,
+                                                                  metric=args.unifrac_metric)
                 
                 if unifrac_df is not None:
-                    # 7. 生成距离矩阵热图
-                    analyzer.generate_distance_heatmap(unifrac_file, unifrac_plot)
+                    # 7. PCoA排序
+                    analyzer.calculate_pcoa(unifrac_file.with_suffix('.npy'),
+                                            analyzer.output_dir / "unifrac_pcoa")
+                    
+                    # 8. 生成距离矩阵热图
+                    analyzer.generate_distance_heatmap(unifrac_file.with_suffix('.npy'), unifrac_plot,
+                                                       args.heatmap_max_blocks)
     
     logger.info("系统发育分析完成！")
 
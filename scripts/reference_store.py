@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 参考序列库
+Indexed Reference Sequence Store
+
+为大型参考序列FASTA（如 SILVA、Greengenes、Kraken2 library）提供随机访问：
+1. 一次性扫描建立 faidx 兼容的 .fai 索引（名称、长度、偏移、每行碱基数、每行字节数），
+   已存在的 .fai（如 samtools faidx 生成）直接复用
+2. 建立分类单元 -> 序列ID 映射：来自 QIIME 格式的分类文件（序列ID<TAB>分类字符串），
+   或序列标题中的 taxid（如 kraken:taxid|562|NC_000913.3）
+3. 通过内存映射按偏移直接切片读取序列，每条记录 O(1)，无需重复扫描文件
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import re
+import mmap
+import bisect
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 序列标题中的 taxid，例如 kraken:taxid|562|NC_000913.3 或 taxid=562
+_HEADER_TAXID = re.compile(rb"taxid[|=](\d+)")
+
+
+def _normalize_taxonomy(taxonomy: str) -> str:
+    """统一分类字符串格式: 去除各级之间的空白和末尾的空级别"""
+    levels = [level.strip() for level in str(taxonomy).split(';')]
+    while levels and (not levels[-1] or levels[-1].endswith('__')):
+        levels.pop()
+    return ';'.join(levels)
+
+
+def build_fasta_index(fasta_path: str, index_path: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+    """
+    扫描FASTA文件建立 faidx 兼容索引
+
+    Args:
+        fasta_path: 未压缩的FASTA文件路径
+        index_path: 索引输出路径（默认为 <fasta>.fai）
+
+    Returns:
+        (索引文件路径, 从序列标题中解析出的 序列ID -> taxid 映射)
+    """
+    fasta_path = Path(fasta_path)
+    if fasta_path.suffix in ('.gz', '.bz2', '.xz'):
+        raise ValueError(f"参考序列库须为未压缩的FASTA文件: {fasta_path}")
+    index_path = Path(index_path or f"{fasta_path}.fai")
+    logger.info(f"建立参考序列索引: {fasta_path}")
+
+    rows: List[Tuple[str, int, int, int, int]] = []
+    header_taxids: Dict[str, str] = {}
+    name, length, offset, line_bases, line_bytes = None, 0, 0, 0, 0
+    position = 0
+    with open(fasta_path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if name is not None:
+                    rows.append((name, length, offset, line_bases, line_bytes))
+                header = line[1:].rstrip()
+                name = header.split(None, 1)[0].decode() if header else ''
+                match = _HEADER_TAXID.search(header)
+                if match:
+                    header_taxids[name] = match.group(1).decode()
+                length, offset, line_bases, line_bytes = 0, position + len(line), 0, 0
+            elif name is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if line_bases == 0:
+                    line_bases, line_bytes = bases, len(line)
+                length += bases
+            position += len(line)
+    if name is not None:
+        rows.append((name, length, offset, line_bases, line_bytes))
+
+    with open(index_path, 'w') as out:
+        for row in rows:
+            out.write('\t'.join(map(str, row)) + '\n')
+    if header_taxids:
+        pd.Series(header_taxids, name='taxid').rename_axis('seq_id').to_csv(
+            f"{index_path}.taxid", sep='\t', header=True)
+    logger.info(f"索引完成: {len(rows)} 条序列 -> {index_path}")
+    return str(index_path), header_taxids
+
+
+class ReferenceStore:
+    """基于 faidx 索引与内存映射的参考序列库"""
+
+    def __init__(self, fasta_path: str, taxonomy_file: Optional[str] = None,
+                 index_path: Optional[str] = None):
+        """
+        打开参考序列库（首次使用时建立索引）
+
+        Args:
+            fasta_path: 参考序列FASTA文件
+            taxonomy_file: 可选的分类文件（序列ID<TAB>分类字符串或taxid）
+            index_path: 可选的 .fai 索引路径
+        """
+        self.fasta_path = Path(fasta_path)
+        index_path = Path(index_path or f"{self.fasta_path}.fai")
+        header_taxids: Dict[str, str] = {}
+        if not index_path.exists() or index_path.stat().st_mtime < self.fasta_path.stat().st_mtime:
+            _, header_taxids = build_fasta_index(str(self.fasta_path), str(index_path))
+        elif Path(f"{index_path}.taxid").exists():
+            taxid_df = pd.read_csv(f"{index_path}.taxid", sep='\t', dtype=str)
+            header_taxids = dict(zip(taxid_df['seq_id'], taxid_df['taxid']))
+
+        index = pd.read_csv(index_path, sep='\t', header=None, usecols=range(5),
+                            names=['name', 'length', 'offset', 'line_bases', 'line_bytes'],
+                            dtype={'name': str}, keep_default_na=False)
+        self.names = index['name'].tolist()
+        self._row = {name: i for i, name in enumerate(self.names)}
+        self._length = index['length'].to_numpy(np.int64)
+        self._offset = index['offset'].to_numpy(np.int64)
+        self._line_bases = index['line_bases'].to_numpy(np.int64)
+        self._line_bytes = index['line_bytes'].to_numpy(np.int64)
+
+        self._file = open(self.fasta_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # 分类单元 -> 序列ID
+        self._taxon_map: Dict[str, List[str]] = {}
+        for seq_id, taxid in header_taxids.items():
+            self._taxon_map.setdefault(taxid, []).append(seq_id)
+        if taxonomy_file:
+            self._load_taxonomy(taxonomy_file)
+        self._sorted_taxa = sorted(self._taxon_map)
+
+    def _load_taxonomy(self, taxonomy_file: str):
+        """读取分类文件（QIIME 格式，可有表头）"""
+        taxonomy_df = pd.read_csv(taxonomy_file, sep='\t', header=None, usecols=[0, 1],
+                                  names=['seq_id', 'taxon'], dtype=str)
+        if taxonomy_df.iloc[0]['seq_id'] not in self._row:
+            taxonomy_df = taxonomy_df.iloc[1:]
+        for seq_id, taxon in zip(taxonomy_df['seq_id'], taxonomy_df['taxon']):
+            self._taxon_map.setdefault(_normalize_taxonomy(taxon), []).append(seq_id)
+        logger.info(f"读取分类映射: {len(taxonomy_df)} 条序列")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, seq_id: str) -> bool:
+        return seq_id in self._row
+
+    def close(self):
+        """关闭内存映射"""
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, seq_id: str) -> str:
+        """按序列ID读取完整序列"""
+        row = self._row[seq_id]
+        length, line_bases = int(self._length[row]), int(self._line_bases[row])
+        if length == 0:
+            return ''
+        start = int(self._offset[row])
+        full_lines, remainder = divmod(length, line_bases)
+        end = start + full_lines * int(self._line_bytes[row]) + remainder
+        return self._mmap[start:end].translate(None, b'\r\n').decode()
+
+    def fetch_many(self, seq_ids: Iterable[str]) -> Dict[str, str]:
+        """批量读取序列（按文件偏移排序以顺序访问磁盘）"""
+        seq_ids = [seq_id for seq_id in seq_ids if seq_id in self._row]
+        ordered = sorted(seq_ids, key=lambda seq_id: self._offset[self._row[seq_id]])
+        return {seq_id: self.fetch(seq_id) for seq_id in ordered}
+
+    def sequences_for_taxon(self, taxon: str) -> List[str]:
+        """
+        查找分类单元对应的序列ID
+
+        先按 taxid 或完整分类字符串精确匹配；分类字符串未精确匹配时，
+        返回以其为前缀的第一个分类（如只鉴定到属水平的分类单元）的序列。
+        """
+        key = str(taxon).strip()
+        if key in self._taxon_map:
+            return self._taxon_map[key]
+        key = _normalize_taxonomy(key)
+        if key in self._taxon_map:
+            return self._taxon_map[key]
+        if not key:
+            return []
+        position = bisect.bisect_left(self._sorted_taxa, key + ';')
+        if position < len(self._sorted_taxa) and self._sorted_taxa[position].startswith(key + ';'):
+            return self._taxon_map[self._sorted_taxa[position]]
+        return []
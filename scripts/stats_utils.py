@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 统计工具函数
+Shared Statistical Helpers
+
+各分析脚本共用的统计工具，实现位于 micos.stats（与 micos 包共用同一份代码）：
+1. Benjamini-Hochberg FDR 校正（向量化，忽略 NaN）
+
+脚本可在未安装 micos 包时直接运行，此时将仓库根目录加入模块搜索路径。
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import sys
+from pathlib import Path
+
+try:
+    from micos.stats import bh_adjust
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from micos.stats import bh_adjust
+
+__all__ = ['bh_adjust']
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 数组化系统发育树
+Array-backed Phylogenetic Tree
+
+以一组扁平数组表示系统发育树，作为 Faith's PD、UniFrac、树剪枝等
+基于树的计算的共享底层结构：
+- parent: 父节点索引（根为 -1）
+- branch_length: 分支长度
+- postorder: 子节点先于父节点的遍历顺序
+- tip_index: 叶节点名称 -> 节点索引
+
+节点按先序编号，始终满足 parent[i] < i（根节点索引为 0），
+因此逆序遍历索引即可保证子节点先于父节点处理。
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import re
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Newick 词法单元: ( ) , ; '带引号标签' 无引号标签 :分支长度 [注释]
+_NEWICK_TOKEN = re.compile(
+    r"\s*(?:"
+    r"(?P<open>\()|(?P<close>\))|(?P<comma>,)|(?P<end>;)"
+    r"|'(?P<quoted>(?:[^']|'')*)'"
+    r"|:\s*(?P<length>[^\s(),:;\[\]]+)"
+    r"|(?P<label>[^\s(),:;\[\]']+)"
+    r"|\[[^\]]*\]"
+    r")"
+)
+
+
+class ArrayTree:
+    """数组化系统发育树"""
+
+    def __init__(self, parent: np.ndarray, branch_length: np.ndarray, names: List[str]):
+        """
+        初始化数组化系统发育树
+
+        Args:
+            parent: 父节点索引数组，根节点为 -1，且须满足 parent[i] < i
+            branch_length: 分支长度数组
+            names: 节点名称列表（内部节点可为空字符串）
+        """
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.branch_length = np.asarray(branch_length, dtype=np.float64)
+        self.names = list(names)
+
+        n_nodes = len(self.parent)
+        if n_nodes == 0 or self.parent[0] != -1:
+            raise ValueError("根节点必须位于索引0")
+        if n_nodes > 1 and np.any(self.parent[1:] >= np.arange(1, n_nodes)):
+            raise ValueError("节点须按先序编号 (parent[i] < i)")
+
+        self.postorder = np.arange(n_nodes - 1, -1, -1, dtype=np.int64)
+        self.is_tip = np.bincount(self.parent[1:], minlength=n_nodes) == 0
+        self.tips = np.flatnonzero(self.is_tip)
+        self.tip_index: Dict[str, int] = {self.names[i]: int(i) for i in self.tips}
+        self._children: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._batches: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+
+    @property
+    def n_nodes(self) -> int:
+        """节点总数"""
+        return len(self.parent)
+
+    @property
+    def n_tips(self) -> int:
+        """叶节点数"""
+        return len(self.tips)
+
+    @property
+    def tip_names(self) -> List[str]:
+        """叶节点名称（按节点索引顺序）"""
+        return [self.names[i] for i in self.tips]
+
+    def children(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        CSR 形式的子节点表
+
+        Returns:
+            (child_ptr, child_idx): 节点 i 的子节点为 child_idx[child_ptr[i]:child_ptr[i+1]]，
+            且保持原始的从左到右顺序
+        """
+        if self._children is None:
+            child_idx = np.arange(1, self.n_nodes, dtype=np.int64)
+            child_idx = child_idx[np.argsort(self.parent[1:], kind='stable')]
+            counts = np.bincount(self.parent[1:], minlength=self.n_nodes)
+            child_ptr = np.concatenate([[0], np.cumsum(counts)])
+            self._children = (child_ptr, child_idx)
+        return self._children
+
+    def depth(self) -> np.ndarray:
+        """每个节点的深度（根为0）"""
+        parent = self.parent.tolist()
+        depth = [0] * self.n_nodes
+        for i in range(1, self.n_nodes):
+            depth[i] = depth[parent[i]] + 1
+        return np.array(depth, dtype=np.int64)
+
+    def postorder_batches(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        按层分组的后序批次，用于向量化的自底向上传播
+
+        每个批次为 (子节点数组, 父节点数组)：按批次顺序处理可保证子节点先于父节点，
+        且同一批次内父节点互不重复，因此可直接用花式索引原位累加/按位或。
+
+        Returns:
+            批次列表
+        """
+        if self._batches is None:
+            child_ptr, child_idx = self.children()
+            counts = np.diff(child_ptr)
+            # 节点在兄弟节点中的序号
+            sibling_rank = np.zeros(self.n_nodes, dtype=np.int64)
+            sibling_rank[child_idx] = np.arange(len(child_idx)) - np.repeat(child_ptr[:-1], counts)
+            depth = self.depth()
+
+            nodes = np.arange(1, self.n_nodes)
+            order = np.lexsort((sibling_rank[nodes], -depth[nodes]))
+            nodes = nodes[order]
+            keys = depth[nodes] * (counts.max() + 1) + sibling_rank[nodes]
+            splits = np.flatnonzero(np.diff(keys)) + 1
+            self._batches = [(batch, self.parent[batch]) for batch in np.split(nodes, splits)]
+        return self._batches
+
+    def root_distance(self) -> np.ndarray:
+        """每个节点到根的距离（一次先序遍历）"""
+        distance = self.branch_length.copy()
+        distance[0] = 0.0
+        parent = self.parent
+        for i in range(1, self.n_nodes):
+            distance[i] += distance[parent[i]]
+        return distance
+
+    def tip_mask(self, tip_names: Iterable[str]) -> np.ndarray:
+        """
+        将叶节点名称映射为节点索引
+
+        Args:
+            tip_names: 叶节点名称序列
+
+        Returns:
+            节点索引数组；树中不存在的名称对应 -1
+        """
+        return np.array([self.tip_index.get(name, -1) for name in tip_names], dtype=np.int64)
+
+    def prune(self, keep_tips: Iterable[str]) -> "ArrayTree":
+        """
+        剪枝: 仅保留指定叶节点，并合并单子节点的内部节点（分支长度相加）
+
+        Args:
+            keep_tips: 需要保留的叶节点名称
+
+        Returns:
+            剪枝后的新树
+        """
+        keep_idx = [self.tip_index[name] for name in keep_tips if name in self.tip_index]
+        if not keep_idx:
+            raise ValueError("剪枝后没有剩余的叶节点")
+
+        # 标记保留叶节点的所有祖先（子节点先于父节点）
+        parent = self.parent.tolist()
+        keep_list = [False] * self.n_nodes
+        for i in keep_idx:
+            keep_list[i] = True
+        for i in range(self.n_nodes - 1, 0, -1):
+            if keep_list[i]:
+                keep_list[parent[i]] = True
+        keep_node = np.array(keep_list)
+
+        # 只剩一个保留子节点的内部节点需要合并
+        kept_children = np.bincount(self.parent[1:][keep_node[1:]], minlength=self.n_nodes)
+        collapse_list = (keep_node & ~self.is_tip & (kept_children == 1)).tolist()
+
+        # 根节点只剩一个子节点时，下移根节点
+        root = 0
+        child_ptr, child_idx = self.children()
+        while collapse_list[root]:
+            children = child_idx[child_ptr[root]:child_ptr[root + 1]]
+            root = int(children[keep_node[children]][0])
+
+        # 先序遍历: 父节点被合并时继承其父节点并累加分支长度
+        length_list = self.branch_length.tolist()
+        new_parent_list = [-1] * self.n_nodes
+        for i in range(root + 1, self.n_nodes):
+            if not keep_list[i]:
+                continue
+            p = parent[i]
+            if collapse_list[p] and p != root:
+                length_list[i] += length_list[p]
+                new_parent_list[i] = new_parent_list[p]
+            else:
+                new_parent_list[i] = p
+
+        survivors = [i for i in range(root, self.n_nodes)
+                     if keep_list[i] and (i == root or not collapse_list[i])]
+        index_map = {old: new for new, old in enumerate(survivors)}
+        parent_out = np.array([index_map[new_parent_list[i]] if i != root else -1 for i in survivors],
+                              dtype=np.int64)
+        length_out = np.array([length_list[i] for i in survivors])
+        length_out[0] = 0.0
+        names_out = [self.names[i] for i in survivors]
+        return ArrayTree(parent_out, length_out, names_out)
+
+    def to_newick(self) -> str:
+        """序列化为 Newick 字符串"""
+        child_ptr, child_idx = self.children()
+        lengths = self.branch_length.tolist()
+        parts: List[str] = []
+        # 栈元素: ('visit', 节点) 展开节点; ('close', 节点) 输出右括号与标签; ('sep', -1) 输出逗号
+        stack: List[Tuple[str, int]] = [('visit', 0)]
+        while stack:
+            action, node = stack.pop()
+            if action == 'sep':
+                parts.append(',')
+                continue
+            if action == 'visit' and child_ptr[node + 1] > child_ptr[node]:
+                parts.append('(')
+                stack.append(('close', node))
+                children = child_idx[child_ptr[node]:child_ptr[node + 1]].tolist()
+                for k in range(len(children) - 1, -1, -1):
+                    stack.append(('visit', children[k]))
+                    if k > 0:
+                        stack.append(('sep', -1))
+                continue
+            if action == 'close':
+                parts.append(')')
+            parts.append(_format_label(self.names[node]))
+            if node != 0:
+                parts.append(f":{lengths[node]!r}")
+        return ''.join(parts) + ';'
+
+    def write_newick(self, path: str):
+        """写入 Newick 文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_newick() + '\n')
+
+    def save(self, path: str):
+        """保存为 .npz，便于大树的快速重复加载"""
+        np.savez(path, parent=self.parent, branch_length=self.branch_length,
+                 names=np.array(self.names, dtype=object))
+
+    @classmethod
+    def load(cls, path: str) -> "ArrayTree":
+        """从 .npz 加载"""
+        data = np.load(path, allow_pickle=True)
+        return cls(data['parent'], data['branch_length'], data['names'].tolist())
+
+    @classmethod
+    def from_parent_array(cls, parent: np.ndarray, branch_length: np.ndarray,
+                          names: List[str]) -> "ArrayTree":
+        """
+        由任意编号的父节点数组构建（如自底向上建树的结果），重新按先序编号
+
+        Args:
+            parent: 父节点索引数组，恰有一个根节点为 -1
+            branch_length: 分支长度数组
+            names: 节点名称列表
+
+        Returns:
+            数组化系统发育树
+        """
+        parent = np.asarray(parent, dtype=np.int64)
+        roots = np.flatnonzero(parent < 0)
+        if len(roots) != 1:
+            raise ValueError(f"父节点数组须恰有一个根节点，实际为 {len(roots)} 个")
+
+        non_root = np.flatnonzero(parent >= 0)
+        child_idx = non_root[np.argsort(parent[non_root], kind='stable')].tolist()
+        child_ptr = np.concatenate([[0], np.cumsum(np.bincount(parent[non_root],
+                                                               minlength=len(parent)))]).tolist()
+        order: List[int] = []
+        stack = [int(roots[0])]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(reversed(child_idx[child_ptr[node]:child_ptr[node + 1]]))
+        if len(order) != len(parent):
+            raise ValueError("父节点数组中存在环或不连通的节点")
+
+        order = np.array(order, dtype=np.int64)
+        new_index = np.empty(len(parent), dtype=np.int64)
+        new_index[order] = np.arange(len(order))
+        new_parent = np.where(parent[order] >= 0, new_index[np.maximum(parent[order], 0)], -1)
+        lengths = np.asarray(branch_length, dtype=np.float64)[order]
+        lengths[0] = 0.0
+        return cls(new_parent, lengths, [names[i] for i in order])
+
+    @classmethod
+    def from_newick(cls, text: str) -> "ArrayTree":
+        """
+        解析 Newick 字符串
+
+        使用正则表达式逐词法单元扫描，节点在遇到时按先序编号，
+        不构建任何中间对象，解析 10万 叶节点的树只需数秒以内。
+
+        Args:
+            text: Newick 字符串
+
+        Returns:
+            数组化系统发育树
+        """
+        parent: List[int] = []
+        length: List[float] = []
+        names: List[str] = []
+        stack: List[int] = []
+        last = -1
+        expect_node = True
+
+        def new_node(name: str = '') -> int:
+            parent.append(stack[-1] if stack else -1)
+            length.append(0.0)
+            names.append(name)
+            return len(parent) - 1
+
+        for match in _NEWICK_TOKEN.finditer(text):
+            kind = match.lastgroup
+            if kind is None:
+                continue
+            if kind == 'open':
+                stack.append(new_node())
+                expect_node = True
+            elif kind in ('label', 'quoted'):
+                label = match.group(kind)
+                if kind == 'quoted':
+                    label = label.replace("''", "'")
+                if expect_node:
+                    last = new_node(label)
+                    expect_node = False
+                else:
+                    names[last] = label
+            elif kind == 'length':
+                if expect_node:
+                    last = new_node()
+                    expect_node = False
+                length[last] = float(match.group('length'))
+            elif kind == 'comma':
+                if expect_node:
+                    new_node()
+                expect_node = True
+            elif kind == 'close':
+                if expect_node:
+                    new_node()
+                if not stack:
+                    raise ValueError("Newick 括号不匹配")
+                last = stack.pop()
+                expect_node = False
+            elif kind == 'end':
+                break
+
+        if stack:
+            raise ValueError("Newick 括号不匹配")
+        if not parent:
+            raise ValueError("空的 Newick 字符串")
+        return cls(np.array(parent), np.array(length), names)
+
+
+def propagate_presence(tree: ArrayTree, presence: np.ndarray, tip_nodes: np.ndarray) -> np.ndarray:
+    """
+    将叶节点出现情况向上传播到所有节点
+
+    每个节点保存一个按位打包的样本位向量（"该节点子树是否被样本覆盖"），
+    按后序批次对全部样本同时做按位或，内存为 n_nodes × ceil(n_samples / 8) 字节。
+
+    Args:
+        tree: 数组化系统发育树
+        presence: taxa × 样本 的布尔矩阵
+        tip_nodes: 每个taxon对应的叶节点索引（-1 表示不在树中，将被忽略）
+
+    Returns:
+        n_nodes × ceil(n_samples / 8) 的 uint8 位矩阵
+    """
+    presence = np.asarray(presence, dtype=bool)
+    in_tree = tip_nodes >= 0
+    packed = np.packbits(presence[in_tree], axis=1)
+    covered = np.zeros((tree.n_nodes, packed.shape[1]), dtype=np.uint8)
+    # 多个taxa映射到同一叶节点时取并集
+    np.bitwise_or.at(covered, tip_nodes[in_tree], packed)
+
+    for children, parents in tree.postorder_batches():
+        covered[parents] |= covered[children]
+    return covered
+
+
+def faith_pd(tree: ArrayTree, presence: np.ndarray, tip_nodes: np.ndarray,
+             chunk_size: int = 65536) -> np.ndarray:
+    """
+    计算全部样本的 Faith's PD
+
+    PD 为连接样本中出现的taxa与根的最小子树的分支长度之和，即节点覆盖位矩阵与
+    分支长度向量的矩阵-向量乘积（按节点分块解包以控制内存）。
+
+    Args:
+        tree: 数组化系统发育树
+        presence: taxa × 样本 的布尔矩阵
+        tip_nodes: 每个taxon对应的叶节点索引（-1 表示不在树中）
+        chunk_size: 每次解包的节点数
+
+    Returns:
+        每个样本的 Faith's PD
+    """
+    n_samples = presence.shape[1]
+    covered = propagate_presence(tree, presence, tip_nodes)
+    lengths = tree.branch_length.copy()
+    lengths[0] = 0.0
+
+    pd_values = np.zeros(n_samples)
+    for start in range(0, tree.n_nodes, chunk_size):
+        block = np.unpackbits(covered[start:start + chunk_size], axis=1, count=n_samples)
+        pd_values += lengths[start:start + chunk_size] @ block
+    return pd_values
+
+
+def _format_label(name: str) -> str:
+    """必要时为 Newick 标签加引号"""
+    if not name:
+        return ''
+    if re.search(r"[\s(),:;\[\]']", name):
+        return "'" + name.replace("'", "''") + "'"
+    return name
+
+
+def read_newick(path: str) -> ArrayTree:
+    """
+    读取 Newick 文件为数组化系统发育树
+
+    Args:
+        path: Newick 文件路径（.npz 文件按缓存格式加载）
+
+    Returns:
+        数组化系统发育树
+    """
+    if Path(path).suffix == '.npz':
+        return ArrayTree.load(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ArrayTree.from_newick(f.read())
+    logger.info(f"读取系统发育树: {tree.n_tips} 个叶节点, {tree.n_nodes} 个节点")
+    return tree
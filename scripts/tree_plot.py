@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 系统发育树绘图
+Scalable Tree Rendering
+
+面向大型系统发育树的绘图：
+1. 布局坐标由数组化树的逐层批量运算得到（x 为根距离，叶节点 y 为先序序号，
+   内部节点 y 为子节点范围中点），不为每个分支创建对象
+2. 全部分支合并为一个 LineCollection 绘制
+3. 可将叶节点数不超过阈值的最大分支、或指定深度处的分支折叠为楔形
+4. 支持矩形与环形布局
+
+作者: MICOS-2024 团队
+版本: 1.0.0
+许可证: MIT
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+
+from tree_arrays import ArrayTree
+
+logger = logging.getLogger(__name__)
+
+TREE_LAYOUTS = ('rectangular', 'circular')
+
+
+def tree_layout(tree: ArrayTree) -> Dict[str, np.ndarray]:
+    """
+    计算矩形布局坐标
+
+    Returns:
+        字典: x (根距离), y (纵坐标), child_lo / child_hi (子节点纵坐标范围),
+        tip_lo / tip_hi (子树叶节点序号范围), x_max (子树最大根距离), n_tips (子树叶节点数)
+    """
+    n = tree.n_nodes
+    parent = tree.parent
+    x = tree.root_distance()
+    depth = tree.depth()
+
+    # 先序编号下叶节点按索引排序即为自上而下的顺序
+    tip_rank = np.full(n, -1.0)
+    tip_rank[tree.tips] = np.arange(tree.n_tips)
+
+    y = tip_rank.copy()
+    child_lo = np.full(n, np.inf)
+    child_hi = np.full(n, -np.inf)
+    tip_lo = np.where(tree.is_tip, tip_rank, np.inf)
+    tip_hi = np.where(tree.is_tip, tip_rank, -np.inf)
+    x_max = x.copy()
+    n_tips = tree.is_tip.astype(np.int64)
+
+    # 逐层自底向上: 同一深度的节点处理完后其父节点的范围即为最终值
+    order = np.argsort(-depth, kind='stable')
+    boundaries = np.flatnonzero(np.diff(depth[order])) + 1
+    for level in np.split(order, boundaries):
+        if depth[level[0]] == 0:
+            break
+        internal = level[~tree.is_tip[level]]
+        y[internal] = (child_lo[internal] + child_hi[internal]) / 2
+        parents = parent[level]
+        np.minimum.at(child_lo, parents, y[level])
+        np.maximum.at(child_hi, parents, y[level])
+        np.minimum.at(tip_lo, parents, tip_lo[level])
+        np.maximum.at(tip_hi, parents, tip_hi[level])
+        np.maximum.at(x_max, parents, x_max[level])
+        np.add.at(n_tips, parents, n_tips[level])
+    if n > 1:
+        y[0] = (child_lo[0] + child_hi[0]) / 2
+
+    return {'x': x, 'y': y, 'child_lo': child_lo, 'child_hi': child_hi,
+            'tip_lo': tip_lo, 'tip_hi': tip_hi, 'x_max': x_max, 'n_tips': n_tips}
+
+
+def collapsed_clades(tree: ArrayTree, layout: Dict[str, np.ndarray],
+                     collapse_size: Optional[int] = None,
+                     collapse_depth: Optional[int] = None) -> np.ndarray:
+    """
+    选择需要折叠为楔形的内部节点
+
+    Args:
+        collapse_size: 折叠叶节点数不超过该值的最大分支
+        collapse_depth: 折叠该深度处的全部内部节点
+
+    Returns:
+        折叠节点索引
+    """
+    candidates = ~tree.is_tip
+    candidates[0] = False
+    if collapse_size:
+        small = layout['n_tips'] <= collapse_size
+        candidates &= small & ~small[np.maximum(tree.parent, 0)]
+    if collapse_depth:
+        candidates &= tree.depth() == collapse_depth
+    if not collapse_size and not collapse_depth:
+        return np.array([], dtype=np.int64)
+    return np.flatnonzero(candidates)
+
+
+def _hidden_nodes(tree: ArrayTree, collapsed: np.ndarray) -> np.ndarray:
+    """折叠节点的全部后代（先序编号下为连续区间）"""
+    subtree_size = np.ones(tree.n_nodes, dtype=np.int64)
+    for children, parents in tree.postorder_batches():
+        subtree_size[parents] += subtree_size[children]
+    marks = np.zeros(tree.n_nodes + 1, dtype=np.int64)
+    np.add.at(marks, collapsed + 1, 1)
+    np.add.at(marks, collapsed + subtree_size[collapsed], -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def _polar(radius: np.ndarray, angle: np.ndarray) -> np.ndarray:
+    return np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=-1)
+
+
+def _arc(radius: float, start: float, end: float, points_per_radian: float = 20) -> np.ndarray:
+    n_points = int(min(100, max(2, abs(end - start) * points_per_radian)))
+    return _polar(np.full(n_points, radius), np.linspace(start, end, n_points))
+
+
+def plot_tree(tree: ArrayTree, output_plot: str, layout: str = 'rectangular',
+              collapse_size: Optional[int] = None, collapse_depth: Optional[int] = None,
+              label_max: int = 200, title: str = "Phylogenetic Tree", dpi: int = 300):
+    """
+    绘制系统发育树
+
+    Args:
+        tree: 数组化系统发育树
+        output_plot: 输出图片路径
+        layout: 'rectangular' 或 'circular'
+        collapse_size: 折叠叶节点数不超过该值的最大分支
+        collapse_depth: 折叠该深度处的全部内部节点
+        label_max: 可见叶节点数不超过该值时显示标签
+        title: 图标题
+        dpi: 输出分辨率
+    """
+    if layout not in TREE_LAYOUTS:
+        raise ValueError(f"不支持的树布局: {layout}")
+
+    coords = tree_layout(tree)
+    x, y = coords['x'], coords['y']
+    collapsed = collapsed_clades(tree, coords, collapse_size, collapse_depth)
+    hidden = _hidden_nodes(tree, collapsed)
+    is_collapsed = np.zeros(tree.n_nodes, dtype=bool)
+    is_collapsed[collapsed] = True
+
+    nodes = np.flatnonzero(~hidden)[1:]
+    internal = np.flatnonzero(~tree.is_tip & ~hidden & ~is_collapsed)
+    visible_tips = np.flatnonzero(tree.is_tip & ~hidden)
+    n_rows = max(tree.n_tips, 1)
+    logger.info(f"绘制系统发育树: {tree.n_tips} 个叶节点, {len(collapsed)} 个折叠分支")
+
+    if layout == 'rectangular':
+        # 水平分支 + 内部节点的竖直连线
+        horizontal = np.stack([np.stack([x[tree.parent[nodes]], y[nodes]], axis=-1),
+                               np.stack([x[nodes], y[nodes]], axis=-1)], axis=1)
+        vertical = np.stack([np.stack([x[internal], coords['child_lo'][internal]], axis=-1),
+                             np.stack([x[internal], coords['child_hi'][internal]], axis=-1)], axis=1)
+        segments: List[np.ndarray] = list(np.concatenate([horizontal, vertical]))
+        wedges = [np.array([[x[v], y[v]], [coords['x_max'][v], coords['tip_lo'][v] - 0.4],
+                            [coords['x_max'][v], coords['tip_hi'][v] + 0.4]]) for v in collapsed]
+        label_positions = np.stack([x, y], axis=-1)
+    else:
+        angle = 2 * np.pi * (y + 0.5) / n_rows
+        radial = np.stack([_polar(x[tree.parent[nodes]], angle[nodes]), _polar(x[nodes], angle[nodes])],
+                          axis=1)
+        segments = list(radial)
+        child_lo = 2 * np.pi * (coords['child_lo'] + 0.5) / n_rows
+        child_hi = 2 * np.pi * (coords['child_hi'] + 0.5) / n_rows
+        segments.extend(_arc(x[v], child_lo[v], child_hi[v]) for v in internal)
+        wedges = []
+        for v in collapsed:
+            lo = 2 * np.pi * (coords['tip_lo'][v] + 0.1) / n_rows
+            hi = 2 * np.pi * (coords['tip_hi'][v] + 0.9) / n_rows
+            wedges.append(np.vstack([_polar(np.array([x[v]]), np.array([angle[v]])),
+                                     _arc(coords['x_max'][v], lo, hi)]))
+        label_positions = _polar(x, angle)
+
+    size = 10 if layout == 'circular' else min(40, max(6, 0.15 * (len(visible_tips) + len(collapsed))))
+    fig, ax = plt.subplots(figsize=(10, size))
+    linewidth = 1.0 if tree.n_tips <= 500 else 0.3
+    ax.add_collection(LineCollection(segments, colors='black', linewidths=linewidth))
+    if wedges:
+        ax.add_collection(PolyCollection(wedges, facecolors='lightsteelblue', edgecolors='steelblue',
+                                         linewidths=0.5))
+
+    if len(visible_tips) + len(collapsed) <= label_max:
+        fontsize = 8 if len(visible_tips) + len(collapsed) <= 60 else 5
+        offset = 0.01 * max(float(coords['x_max'][0]), 1e-9)
+        for v in visible_tips:
+            ax.text(label_positions[v, 0] + offset, label_positions[v, 1], tree.names[v],
+                    fontsize=fontsize, va='center')
+        for v in collapsed:
+            label = tree.names[v] or f"{coords['n_tips'][v]} tips"
+            if layout == 'rectangular':
+                position = (coords['x_max'][v] + offset, y[v])
+            else:
+                position = tuple(_polar(np.array([coords['x_max'][v]]), np.array([angle[v]]))[0])
+            ax.text(position[0], position[1], label, fontsize=fontsize, va='center')
+
+    ax.autoscale_view()
+    if layout == 'rectangular':
+        ax.invert_yaxis()
+        ax.set_yticks([])
+        ax.set_xlabel("Branch length")
+        for side in ('left', 'right', 'top'):
+            ax.spines[side].set_visible(False)
+    else:
+        ax.set_aspect('equal')
+        ax.axis('off')
+    ax.set_title(title, fontsize=16, fontweight='bold')
+    plt.tight_layout()
+    plt.savefig(output_plot, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
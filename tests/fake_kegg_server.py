@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 本地 KEGG REST 模拟服务
+
+用于离线测试 KEGG 客户端的本地 HTTP 服务，实现 /get、/link、/list 三类接口：
+- 与 KEGG 相同，每次 get/link 请求超过 10 个ID时返回 400，无结果时返回 404
+- 记录请求次数与最大并发数，可设置每次响应的延迟
+
+也可单独运行: python fake_kegg_server.py --port 8765
+"""
+
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+MAX_IDS = 10
+
+
+def _bare_id(kegg_id: str) -> str:
+    return kegg_id.split(':', 1)[-1]
+
+
+def ko_entry(ko_id: str, name: str, pathways: Dict[str, str]) -> str:
+    """生成 KEGG 平面格式的 KO 条目"""
+    lines = [f"ENTRY       {ko_id}                      KO", f"NAME        {name}"]
+    for i, (pathway_id, pathway_name) in enumerate(pathways.items()):
+        prefix = "PATHWAY     " if i == 0 else "            "
+        lines.append(f"{prefix}{pathway_id}  {pathway_name}")
+    return '\n'.join(lines) + '\n///\n'
+
+
+class FakeKEGGServer:
+    """本地 KEGG REST 模拟服务"""
+
+    def __init__(self, entries: Optional[Dict[str, str]] = None,
+                 links: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 lists: Optional[Dict[str, Dict[str, str]]] = None,
+                 latency: float = 0.0, port: int = 0):
+        """
+        Args:
+            entries: 无前缀ID -> 条目文本
+            links: 目标数据库 -> {带前缀源ID: [带前缀目标ID]}
+            lists: 数据库 -> {ID: 名称}
+            latency: 每次响应前的延迟（秒）
+            port: 监听端口，0 表示自动分配
+        """
+        self.entries = entries or {}
+        self.links = links or {}
+        self.lists = lists or {}
+        self.latency = latency
+        self.requests: List[str] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def respond(self, path: str):
+        """返回 (状态码, 响应文本)"""
+        parts = path.strip('/').split('/')
+        if parts[0] == 'list' and len(parts) == 2:
+            names = self.lists.get(parts[1])
+            if not names:
+                return 404, ''
+            return 200, ''.join(f"{kegg_id}\t{name}\n" for kegg_id, name in names.items())
+        if parts[0] == 'get' and len(parts) == 2:
+            ids = parts[1].split('+')
+            if len(ids) > MAX_IDS:
+                return 400, ''
+            found = [self.entries[_bare_id(kegg_id)] for kegg_id in ids if _bare_id(kegg_id) in self.entries]
+            return (200, ''.join(found)) if found else (404, '')
+        if parts[0] == 'link' and len(parts) == 3:
+            ids = parts[2].split('+')
+            if len(ids) > MAX_IDS:
+                return 400, ''
+            table = self.links.get(parts[1], {})
+            rows = [f"{kegg_id}\t{target}\n" for kegg_id in ids for target in table.get(kegg_id, [])]
+            return (200, ''.join(rows)) if rows else (404, '')
+        return 400, ''
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append(self.path)
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    status, text = server.respond(self.path)
+                    body = text.encode()
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/plain')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeKEGGServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 KEGG REST 模拟服务")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    args = parser.parse_args()
+
+    pathways = {'map00010': 'Glycolysis / Gluconeogenesis', 'map00020': 'Citrate cycle (TCA cycle)'}
+    entries = {f"K{i:05d}": ko_entry(f"K{i:05d}", f"gene{i}", {'map00010': pathways['map00010']})
+               for i in range(1, 101)}
+    links = {'pathway': {f"ko:K{i:05d}": ['path:map00010', 'path:ko00010'] for i in range(1, 101)}}
+    server = FakeKEGGServer(entries, links, {'pathway': pathways}, port=args.port)
+    print(f"KEGG 模拟服务: {server.url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
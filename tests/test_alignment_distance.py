@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 比对序列距离计算测试
+
+以 Biopython 与逐位点定义为参照，验证向量化距离核的正确性
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from Bio.Phylo.TreeConstruction import DistanceCalculator
+from Bio.Align import MultipleSeqAlignment
+from Bio.SeqRecord import SeqRecord
+from Bio.Seq import Seq
+
+from alignment_distance import encode_sequences, pairwise_distances, MAX_DISTANCE
+from tree_arrays import ArrayTree
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+
+def _k2p(a: str, b: str) -> float:
+    """逐位点计算 Kimura 双参数距离"""
+    transitions = transversions = valid = 0
+    for x, y in zip(a, b):
+        if x in 'ACGT' and y in 'ACGT':
+            valid += 1
+            if x != y:
+                if {x, y} in ({'A', 'G'}, {'C', 'T'}):
+                    transitions += 1
+                else:
+                    transversions += 1
+    p, q = transitions / valid, transversions / valid
+    return -0.5 * np.log(1 - 2 * p - q) - 0.25 * np.log(1 - 2 * q)
+
+
+class TestAlignmentDistance(unittest.TestCase):
+    """比对距离核测试类"""
+
+    def setUp(self):
+        """测试前准备: 由同一祖先序列突变得到的比对"""
+        rng = np.random.default_rng(0)
+        ancestor = rng.choice(list('ACGT'), size=200)
+        self.sequences = []
+        for _ in range(9):
+            seq = ancestor.copy()
+            sites = rng.choice(200, size=30, replace=False)
+            seq[sites] = rng.choice(list('ACGT-N'), size=30)
+            self.sequences.append(''.join(seq))
+
+    def test_identity_matches_biopython(self):
+        """测试 identity 距离与 Biopython 一致"""
+        alignment = MultipleSeqAlignment([SeqRecord(Seq(seq), id=f"s{i}")
+                                          for i, seq in enumerate(self.sequences)])
+        expected = DistanceCalculator('identity').get_distance(alignment)
+        result = pairwise_distances(encode_sequences(self.sequences), 'identity', block_size=2)
+        for i in range(len(self.sequences)):
+            for j in range(len(self.sequences)):
+                self.assertAlmostEqual(result[i, j], expected[i, j], places=6)
+
+    def test_k2p_matches_definition_in_parallel(self):
+        """测试多进程 K2P 距离与逐位点定义一致"""
+        result = pairwise_distances(encode_sequences(self.sequences), 'k2p', n_jobs=3, block_size=2)
+        n = len(self.sequences)
+        for i in range(n):
+            for j in range(i + 1, n):
+                self.assertAlmostEqual(result[i, j], _k2p(self.sequences[i], self.sequences[j]),
+                                       places=5)
+        np.testing.assert_array_equal(result, result.T)
+
+    def test_gaps_and_saturation(self):
+        """测试成对删除 gap 以及饱和距离"""
+        encoded = encode_sequences(['ACGTACGT', 'ACGA--GT', 'TGCATGCA', '--------'])
+        p_distance = pairwise_distances(encoded, 'p')
+        self.assertAlmostEqual(p_distance[0, 1], 1 / 6, places=6)
+        self.assertEqual(p_distance[0, 3], MAX_DISTANCE)
+        self.assertEqual(pairwise_distances(encoded, 'jc69')[0, 2], MAX_DISTANCE)
+        with self.assertRaises(ValueError):
+            encode_sequences(['ACGT', 'ACG'])
+
+    def test_build_tree_from_alignment(self):
+        """测试由比对文件构建系统发育树"""
+        temp_dir = Path(tempfile.mkdtemp())
+        try:
+            alignment_file = temp_dir / "aligned.fasta"
+            alignment_file.write_text(''.join(f">s{i}\n{seq}\n" for i, seq in enumerate(self.sequences)))
+            analyzer = PhylogeneticAnalyzer(str(temp_dir), threads=1)
+            tree, distance_matrix = analyzer.build_phylogenetic_tree(alignment_file,
+                                                                     temp_dir / "tree.newick", 'k2p')
+            self.assertIsNotNone(tree)
+            self.assertEqual(list(distance_matrix.index), [f"s{i}" for i in range(9)])
+            self.assertEqual(tree.n_tips, 9)
+            self.assertEqual(ArrayTree.from_newick((temp_dir / "tree.newick").read_text()).n_tips, 9)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
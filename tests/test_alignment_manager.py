@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 多序列比对管理测试
+
+使用记录调用参数的替身 MAFFT 可执行文件，验证线程传递、缓存复用与增量比对
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+import shutil
+from pathlib import Path
+from Bio import SeqIO
+
+# 导入被测试的模块
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from alignment_manager import AlignmentManager
+
+# 替身 MAFFT: 记录参数；--add 时按参考比对长度截断/填充新序列，否则填充到最长序列
+FAKE_MAFFT = '''#!{python}
+import sys
+args = sys.argv[1:]
+with open({log!r}, 'a') as log:
+    log.write(' '.join(args) + '\\n')
+
+def read(path):
+    records, name = [], None
+    for line in open(path):
+        line = line.strip()
+        if line.startswith('>'):
+            name = line[1:]
+            records.append([name, ''])
+        elif line:
+            records[-1][1] += line
+    return records
+
+if '--add' in args:
+    reference = read(args[-1])
+    width = len(reference[0][1])
+    records = reference + [[n, s[:width].ljust(width, '-')] for n, s in read(args[args.index('--add') + 1])]
+else:
+    records = read(args[-1])
+    width = max(len(s) for _, s in records)
+    records = [[n, s.ljust(width, '-')] for n, s in records]
+for name, seq in records:
+    print('>' + name)
+    print(seq)
+'''
+
+
+class TestAlignmentManager(unittest.TestCase):
+    """比对管理器测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.log = self.temp_dir / "mafft.log"
+        mafft = self.temp_dir / "mafft"
+        mafft.write_text(FAKE_MAFFT.format(python=sys.executable, log=str(self.log)))
+        mafft.chmod(0o755)
+        self.manager = AlignmentManager(str(self.temp_dir / "cache"), threads=4, mafft=str(mafft))
+        self.sequences = {f"s{i}": "ACGT" * (5 + i) for i in range(8)}
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _write_input(self, ids, name="input.fasta"):
+        path = self.temp_dir / name
+        path.write_text(''.join(f">{seq_id}\n{self.sequences[seq_id]}\n" for seq_id in ids))
+        return str(path)
+
+    def _calls(self):
+        return self.log.read_text().splitlines() if self.log.exists() else []
+
+    def test_full_alignment_uses_threads_and_cache(self):
+        """测试完整比对传递线程数，相同输入复用缓存"""
+        ids = list(self.sequences)[:6]
+        output = str(self.temp_dir / "aligned.fasta")
+        self.manager.align(self._write_input(ids), output)
+        calls = self._calls()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(calls[0].startswith('--thread 4 --quiet --auto'))
+
+        # 顺序不同但内容相同的输入直接复用缓存
+        self.manager.align(self._write_input(reversed(ids), "again.fasta"), output)
+        self.assertEqual(len(self._calls()), 1)
+        self.assertEqual([r.id for r in SeqIO.parse(output, "fasta")], ids)
+
+    def test_new_sequences_added_incrementally(self):
+        """测试新增少量序列时以缓存比对为参考增量加入"""
+        ids = list(self.sequences)
+        self.manager.align(self._write_input(ids[:6]), str(self.temp_dir / "first.fasta"))
+        output = str(self.temp_dir / "second.fasta")
+        self.manager.align(self._write_input(ids), output)
+
+        calls = self._calls()
+        self.assertEqual(len(calls), 2)
+        self.assertIn('--add', calls[1])
+        self.assertIn('--keeplength', calls[1])
+        records = list(SeqIO.parse(output, "fasta"))
+        self.assertEqual(sorted(r.id for r in records), sorted(ids))
+        self.assertEqual(len({len(r.seq) for r in records}), 1)
+
+        # 序列内容改变时不能以旧比对为参考
+        self.sequences['s0'] = "TTTT" * 5
+        self.manager.align(self._write_input(ids, "changed.fasta"), output)
+        self.assertIn('--auto', self._calls()[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
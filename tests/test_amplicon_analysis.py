@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 扩增子分析资源规划测试
+
+验证按CPU与内存规划 DADA2 线程数、classify-sklearn 并行任务数与批大小
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import amplicon_analysis
+from amplicon_analysis import AmpliconAnalyzer, plan_classifier
+
+GB = 2 ** 30
+
+
+class TestAmpliconResources(unittest.TestCase):
+    """扩增子分析资源规划测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.commands = []
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def _run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, '', '')
+
+    def test_plan_limited_by_memory(self):
+        """测试内存不足以为每个线程加载分类器时减少并行任务数"""
+        # 分类器 0.5 GB -> 内存中约 4 GB；32 GB × 0.8 可容纳 5 个任务
+        plan = plan_classifier(threads=32, memory_bytes=32 * GB, classifier_bytes=GB // 2)
+        self.assertEqual(plan['n_jobs'], 5)
+        total = plan['n_jobs'] * (4 * GB + plan['reads_per_batch'] * amplicon_analysis.BYTES_PER_READ)
+        self.assertLessEqual(total, 0.8 * 32 * GB)
+
+    def test_plan_limited_by_threads_and_batch_bounds(self):
+        """测试内存充足时任务数等于线程数，批大小不超过上限；内存不足时退回最小值"""
+        plan = plan_classifier(threads=4, memory_bytes=512 * GB, classifier_bytes=GB // 4)
+        self.assertEqual(plan, {'n_jobs': 4, 'reads_per_batch': amplicon_analysis.MAX_READS_PER_BATCH})
+        plan = plan_classifier(threads=16, memory_bytes=GB, classifier_bytes=GB)
+        self.assertEqual(plan, {'n_jobs': 1, 'reads_per_batch': amplicon_analysis.MIN_READS_PER_BATCH})
+
+    def test_commands_receive_threads_and_batches(self):
+        """测试 DADA2 与 classify-sklearn 命令包含规划的资源参数"""
+        classifier = self.temp_dir / "classifier.qza"
+        classifier.write_bytes(b"\0" * 1024)
+        analyzer = AmpliconAnalyzer(self.temp_dir / "out", threads=8, memory_gb=512)
+
+        with patch.object(amplicon_analysis.subprocess, 'run', side_effect=self._run):
+            self.assertTrue(analyzer.denoise_sequences(self.temp_dir / "demux.qza", analyzer.otu_dir))
+            self.assertTrue(analyzer.assign_taxonomy(analyzer.otu_dir / "rep-seqs.qza", classifier,
+                                                     analyzer.taxonomy_dir))
+
+        dada2 = next(cmd for cmd in self.commands if 'denoise-paired' in cmd)
+        self.assertEqual(dada2[dada2.index('--p-n-threads') + 1], '8')
+        classify = next(cmd for cmd in self.commands if 'classify-sklearn' in cmd)
+        self.assertEqual(classify[classify.index('--p-n-jobs') + 1], '8')
+        self.assertEqual(classify[classify.index('--p-reads-per-batch') + 1],
+                         str(amplicon_analysis.MAX_READS_PER_BATCH))
+
+    def test_detected_resources(self):
+        """测试未指定时自动检测CPU与内存"""
+        analyzer = AmpliconAnalyzer(self.temp_dir / "out")
+        self.assertGreaterEqual(analyzer.threads, 1)
+        self.assertGreater(analyzer.memory_bytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 功能注释索引测试
+
+验证注释索引的构建、批量查询与功能注释集成
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from annotation_index import AnnotationIndex, build_from_files
+from functional_annotation import FunctionalAnnotator
+from metatranscriptome_analysis import MetatranscriptomeAnalyzer
+
+EMAPPER = ("## emapper-2.1.12\n"
+           "#query\tseed_ortholog\tevalue\tscore\teggNOG_OGs\tmax_annot_lvl\tCOG_category\t"
+           "Description\tPreferred_name\tGOs\tEC\tKEGG_ko\tKEGG_Pathway\n"
+           "gene1\tx\t1e-50\t200\tCOG0057@1|root,COG0057@2|Bacteria\t2|Bacteria\tG\tGAPDH\tgapA\t"
+           "GO:0006096,GO:0004365\t1.2.1.12\tko:K00134\tko00010,map00010\n"
+           "gene2\tx\t1e-40\t150\tCOG0126@1|root\t2|Bacteria\tCG\tPGK\tpgk\t-\t2.7.2.3\t"
+           "ko:K00927,ko:K00134\tko00010\n"
+           "gene3\tx\t1e-10\t50\t-\t-\t-\t-\t-\t-\t-\t-\t-\n"
+           "## 3 queries scanned\n")
+
+KO_PATHWAY = ("ko:K00134\tpath:map00010\n"
+              "ko:K00134\tpath:ko00010\n"
+              "ko:K00927\tpath:ko00010\n"
+              "ko:K00927\tpath:ko01200\n")
+
+PATHWAY_NAMES = ("path:map00010\tGlycolysis / Gluconeogenesis\n"
+                 "path:map01200\tCarbon metabolism\n")
+
+KO_NAMES = ("ko:K00134\tGAPDH, gapA; glyceraldehyde 3-phosphate dehydrogenase\n"
+            "ko:K00927\tPGK, pgk; phosphoglycerate kinase\n")
+
+COG_DEFINITIONS = ("COG0057\tG\tGlyceraldehyde-3-phosphate dehydrogenase\tGapA\t\t\t\n"
+                   "COG0126\tG\tPhosphoglycerate kinase\tPgk\t\t\t\n")
+
+GO_OBO = ("format-version: 1.2\n\n"
+          "[Term]\nid: GO:0006096\nname: glycolytic process\nnamespace: biological_process\n"
+          "alt_id: GO:0006094\n\n"
+          "[Term]\nid: GO:0004365\nname: glyceraldehyde-3-phosphate dehydrogenase activity\n"
+          "namespace: molecular_function\n\n"
+          "[Typedef]\nid: part_of\nname: part of\n")
+
+
+class TestAnnotationIndex(unittest.TestCase):
+    """功能注释索引测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.files = {}
+        for name, content in (('emapper', EMAPPER), ('ko_pathway', KO_PATHWAY),
+                              ('pathway_names', PATHWAY_NAMES), ('ko_names', KO_NAMES),
+                              ('cog_definitions', COG_DEFINITIONS), ('go_obo', GO_OBO)):
+            path = self.temp_dir / f"{name}.tsv"
+            path.write_text(content)
+            self.files[name] = str(path)
+        self.index_dir = self.temp_dir / "index"
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _build(self, **files):
+        return build_from_files(str(self.index_dir), **files)
+
+    def test_lookup_from_emapper(self):
+        """测试 eggNOG-mapper 结果的批量查询"""
+        index = self._build(emapper=self.files['emapper'])
+        self.assertEqual(index.metadata['n_genes'], 2)
+        self.assertIsInstance(index.genes, np.memmap)
+
+        kos = index.lookup(['gene2', 'unknown', 'gene1', 'gene22'], 'ko')
+        self.assertEqual(sorted(zip(kos['gene_id'], kos['ko'])),
+                         [('gene1', 'K00134'), ('gene2', 'K00134'), ('gene2', 'K00927')])
+        categories = index.lookup(['gene2'], 'cog_category')
+        self.assertEqual(sorted(categories['cog_category']), ['C', 'G'])
+        self.assertEqual(sorted(index.lookup(['gene1'], 'cog')['cog']), ['COG0057'])
+        self.assertEqual(sorted(index.lookup(['gene1'], 'go')['go']), ['GO:0004365', 'GO:0006096'])
+        # map 与 ko 前缀的同一通路合并
+        self.assertEqual(list(index.lookup(['gene1'], 'pathway')['pathway']), ['ko00010'])
+        self.assertTrue(index.lookup(['unknown'], 'ko').empty)
+
+    def test_ko_pathway_relation(self):
+        """测试经 KO -> 通路关系推导基因通路"""
+        index = self._build(emapper=self.files['emapper'], ko_pathway=self.files['ko_pathway'],
+                            pathway_names=self.files['pathway_names'])
+        links = index.expand(['K00927', 'K99999'], 'ko_pathway')
+        self.assertEqual(sorted(links['pathway']), ['ko00010', 'ko01200'])
+
+        pathways = index.annotate(['gene2'], 'pathway')
+        self.assertEqual(sorted(zip(pathways['ko'], pathways['pathway'])),
+                         [('K00134', 'ko00010'), ('K00927', 'ko00010'), ('K00927', 'ko01200')])
+        self.assertEqual(index.names('pathway')['ko01200'], 'Carbon metabolism')
+
+    def test_non_ascii_gene_ids(self):
+        """测试非 ASCII 基因ID的构建与查询"""
+        mapping = self.temp_dir / "gene_ko.tsv"
+        mapping.write_text("gène_1\tK00134\ncontig_β_2\tK00927\ngene3\tK00134\n", encoding='utf-8')
+        self._build(gene_ko=str(mapping))
+        index = AnnotationIndex(str(self.index_dir))
+        kos = index.lookup(['contig_β_2', 'gène_1', 'gène'], 'ko')
+        self.assertEqual(sorted(zip(kos['gene_id'], kos['ko'])),
+                         [('contig_β_2', 'K00927'), ('gène_1', 'K00134')])
+
+    def test_reopen_matches_build(self):
+        """测试重新打开的索引与构建结果一致"""
+        built = self._build(emapper=self.files['emapper'])
+        reopened = AnnotationIndex(str(self.index_dir))
+        genes = ['gene1', 'gene2', 'gene3']
+        pd.testing.assert_frame_equal(built.lookup(genes, 'go'), reopened.lookup(genes, 'go'))
+
+    def test_functional_annotator_uses_index(self):
+        """测试功能注释使用本地索引"""
+        self._build(emapper=self.files['emapper'], ko_pathway=self.files['ko_pathway'],
+                    pathway_names=self.files['pathway_names'], ko_names=self.files['ko_names'],
+                    cog_definitions=self.files['cog_definitions'])
+        gene_list = self.temp_dir / "genes.txt"
+        gene_list.write_text("gene1\ngene2\n\ngene3\ngene1\n")
+        annotator = FunctionalAnnotator(self.temp_dir / "output", annotation_index=self.index_dir)
+
+        kegg = annotator.annotate_kegg_pathways(gene_list, self.temp_dir / "kegg.csv")
+        self.assertEqual(list(kegg.columns),
+                         ['gene_id', 'pathway_id', 'pathway_name', 'ko_id', 'definition'])
+        self.assertEqual(len(kegg), 4)
+        row = kegg[(kegg['gene_id'] == 'gene1')].iloc[0]
+        self.assertEqual(row['pathway_name'], 'Glycolysis / Gluconeogenesis')
+        self.assertTrue(row['definition'].startswith('GAPDH'))
+
+        cog = annotator.annotate_cog_functions(gene_list, self.temp_dir / "cog.csv")
+        self.assertEqual(list(cog.columns), ['gene_id', 'cog_category', 'cog_description', 'cog_id'])
+        self.assertEqual(sorted(cog.loc[cog['gene_id'] == 'gene2', 'cog_category']), ['C', 'G'])
+        self.assertEqual(set(cog.loc[cog['gene_id'] == 'gene1', 'cog_id']), {'COG0057'})
+
+    def test_cog_categories_from_definitions(self):
+        """测试无基因级分类时经 COG 定义推导分类"""
+        mapping = self.temp_dir / "gene_cog.tsv"
+        mapping.write_text("geneA\tCOG0126\ngeneB\tCOG0057,COG0126\n")
+        index = self._build(gene_cog=str(mapping), cog_definitions=self.files['cog_definitions'])
+        categories = index.annotate(['geneB'], 'cog_category')
+        self.assertEqual(sorted(categories['cog']), ['COG0057', 'COG0126'])
+        self.assertEqual(set(categories['cog_category']), {'G'})
+
+    def test_metatranscriptome_single_pass_annotation(self):
+        """测试宏转录组注释单次流式读取表达文件并写出全部注释类型"""
+        self._build(emapper=self.files['emapper'], ko_pathway=self.files['ko_pathway'],
+                    pathway_names=self.files['pathway_names'], ko_names=self.files['ko_names'],
+                    go_obo=self.files['go_obo'])
+        self.assertEqual(AnnotationIndex(str(self.index_dir)).names('go_namespace')['GO:0006094'],
+                         'biological_process')
+        expression = self.temp_dir / "expression.tsv"
+        expression.write_text("gene_id\tS1\tS2\ngene1\t5\t3\ngene2\t1\t0\ngene3\t2\t2\n")
+        config = self.temp_dir / "config.yaml"
+        config.write_text(f"functional_annotation:\n  annotation_index: {self.index_dir}\n")
+
+        analyzer = MetatranscriptomeAnalyzer(str(config), str(self.temp_dir / "meta"))
+        # chunk_size=2 使基因分两块读取
+        outputs = analyzer.run_functional_annotation(str(expression), chunk_size=2)
+        self.assertEqual(set(outputs), {'kegg', 'go', 'cog'})
+
+        kegg = pd.read_csv(outputs['kegg'], sep='\t', keep_default_na=False)
+        self.assertEqual(list(kegg.columns), ['gene_id', 'kegg_id', 'pathway', 'pathway_name', 'description'])
+        self.assertEqual(sorted(zip(kegg['gene_id'], kegg['kegg_id'], kegg['pathway'])),
+                         [('gene1', 'K00134', 'ko00010'), ('gene2', 'K00134', 'ko00010'),
+                          ('gene2', 'K00927', 'ko00010'), ('gene2', 'K00927', 'ko01200')])
+        self.assertTrue(kegg['description'].iloc[0].startswith('GAPDH'))
+
+        go = pd.read_csv(outputs['go'], sep='\t', keep_default_na=False).set_index('go_id')
+        self.assertEqual(go.loc['GO:0006096', 'namespace'], 'biological_process')
+        self.assertEqual(go.loc['GO:0004365', 'description'],
+                         'glyceraldehyde-3-phosphate dehydrogenase activity')
+        cog = pd.read_csv(outputs['cog'], sep='\t', keep_default_na=False)
+        self.assertEqual(sorted(cog.loc[cog['gene_id'] == 'gene2', 'cog_category']), ['C', 'G'])
+
+    def test_metatranscriptome_annotation_disabled(self):
+        """测试 KEGG/GO 均禁用且无 COG 注释时跳过注释而非失败"""
+        gene_ko = self.temp_dir / "gene_ko.tsv"
+        gene_ko.write_text("gene1\tK00134\n")
+        self._build(gene_ko=str(gene_ko))
+        expression = self.temp_dir / "expression.tsv"
+        expression.write_text("gene_id\tS1\ngene1\t5\n")
+        config = self.temp_dir / "config.yaml"
+        config.write_text("metatranscriptome_analysis:\n  functional_analysis:\n"
+                          "    kegg_pathway: false\n    go_enrichment: false\n"
+                          f"    annotation_index: {self.index_dir}\n")
+
+        analyzer = MetatranscriptomeAnalyzer(str(config), str(self.temp_dir / "meta"))
+        with self.assertLogs('metatranscriptome_analysis', level='WARNING'):
+            self.assertEqual(analyzer.run_functional_annotation(str(expression)), {})
+        # 索引缺失属于失败
+        missing = MetatranscriptomeAnalyzer(str(self.temp_dir / "missing.yaml"), str(self.temp_dir / "meta"))
+        self.assertIsNone(missing.run_functional_annotation(str(expression)))
+
+    def test_missing_index_fails(self):
+        """测试未提供索引时注释失败"""
+        gene_list = self.temp_dir / "genes.txt"
+        gene_list.write_text("gene1\n")
+        annotator = FunctionalAnnotator(self.temp_dir / "output")
+        self.assertIsNone(annotator.annotate_kegg_pathways(gene_list, self.temp_dir / "kegg.csv"))
+
+
+if __name__ == '__main__':
+    unittest.main()
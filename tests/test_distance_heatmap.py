@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 距离矩阵热图测试
+
+验证聚类排序、块平均降采样与热图输出
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from distance_heatmap import cluster_order, block_average, plot_distance_heatmap
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+
+def _clustered_distances(n_per_cluster: int, n_clusters: int = 3, seed: int = 0):
+    """三个分离良好的簇，样本顺序随机打乱"""
+    rng = np.random.default_rng(seed)
+    labels = rng.permutation(np.repeat(np.arange(n_clusters), n_per_cluster))
+    points = labels[:, None] * 10.0 + rng.normal(size=(len(labels), 2))
+    distances = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+    return distances, labels
+
+
+class TestDistanceHeatmap(unittest.TestCase):
+    """距离矩阵热图测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _assert_contiguous(self, labels):
+        """每个簇在排序后连续出现"""
+        self.assertEqual(int((np.diff(labels) != 0).sum()), 2)
+
+    def test_cluster_order_groups_clusters(self):
+        """测试完整连锁与代表样本两种排序均使同簇样本相邻"""
+        distances, labels = _clustered_distances(40)
+        self._assert_contiguous(labels[cluster_order(distances)])
+        order = cluster_order(distances, max_linkage_samples=20, block_size=17)
+        self.assertEqual(sorted(order), list(range(len(labels))))
+        self._assert_contiguous(labels[order])
+
+    def test_block_average_matches_direct_mean(self):
+        """测试块平均与直接计算一致"""
+        distances, _ = _clustered_distances(10)
+        order = np.random.default_rng(1).permutation(len(distances))
+        result = block_average(distances, order, 4, block_size=7)
+        groups = np.array_split(order, 4)
+        expected = np.array([[distances[np.ix_(a, b)].mean() for b in groups] for a in groups])
+        np.testing.assert_allclose(result, expected)
+
+    def test_large_matrix_is_downsampled(self):
+        """测试大矩阵从内存映射文件读取并降采样渲染"""
+        distances, _ = _clustered_distances(300)
+        np.save(self.temp_dir / "unifrac.npy", distances)
+        analyzer = PhylogeneticAnalyzer(str(self.temp_dir / "out"))
+        output = analyzer.output_dir / "heatmap.png"
+        analyzer.generate_distance_heatmap(self.temp_dir / "unifrac.npy", output, max_blocks=50)
+        self.assertTrue(output.exists())
+
+        small = self.temp_dir / "small.png"
+        order = plot_distance_heatmap(distances[:12, :12], [f"S{i}" for i in range(12)], str(small))
+        self.assertEqual(sorted(order), list(range(12)))
+        self.assertTrue(small.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""测试 full_run 模块的 HUMAnN 后处理开关."""
+
+import logging
+
+import pytest
+
+from micos import full_run
+
+
+@pytest.fixture
+def calls(tmp_path, monkeypatch):
+    """替换各步骤为记录调用的空函数，并准备多样性分析所需的 BIOM 文件."""
+    called = []
+
+    def record(name):
+        return lambda **kwargs: called.append((name, kwargs))
+
+    for name in ['run_qc', 'run_taxonomic_profiling', 'run_diversity_analysis', 'run_functional_annotation',
+                 'run_join_tables', 'run_renorm_regroup', 'run_contribution_analysis', 'run_summarize']:
+        monkeypatch.setattr(full_run, name, record(name))
+    tax_dir = tmp_path / "results" / "2_taxonomic_profiling"
+    tax_dir.mkdir(parents=True)
+    (tax_dir / "feature-table.biom").write_text("")
+    return called
+
+
+def _steps(calls):
+    return [name for name, _ in calls]
+
+
+def test_postprocessing_disabled_by_default(tmp_path, calls):
+    full_run.run_full_pipeline("in", str(tmp_path / "results"), 4, "kd", "k2")
+    assert _steps(calls) == ['run_qc', 'run_taxonomic_profiling', 'run_diversity_analysis',
+                             'run_functional_annotation', 'run_summarize']
+
+
+def test_contribution_skipped_without_reports(tmp_path, calls, caplog):
+    with caplog.at_level(logging.WARNING):
+        full_run.run_full_pipeline("in", str(tmp_path / "results"), 4, "kd", "k2", contribution_analysis=True)
+    # 贡献分析依赖合并结果：合并照常执行，缺少 Kraken2 报告时跳过贡献分析
+    assert 'run_join_tables' in _steps(calls)
+    assert 'run_contribution_analysis' not in _steps(calls)
+    assert "未找到 Kraken2 报告" in caplog.text
+
+
+def test_contribution_runs_with_reports(tmp_path, calls):
+    tax_dir = tmp_path / "results" / "2_taxonomic_profiling"
+    (tax_dir / "S1.report").write_text("")
+    full_run.run_full_pipeline("in", str(tmp_path / "results"), 4, "kd", "k2",
+                               renorm_regroup=True, contribution_analysis=True)
+    steps = _steps(calls)
+    assert steps.index('run_join_tables') < steps.index('run_renorm_regroup') < steps.index('run_contribution_analysis')
+    assert dict(calls)['run_contribution_analysis']['kraken_input'] == str(tax_dir)
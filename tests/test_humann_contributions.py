@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""测试 humann_contributions 模块."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse, stats
+
+from micos.humann_contributions import (ContributionTensor, contribution_summary, read_kraken_reports,
+                                        run_contribution_analysis)
+from micos.humann_tables import CohortTable
+
+BF = 'g__Bacteroides.s__Bacteroides_fragilis'
+EC = 'g__Escherichia.s__Escherichia_coli'
+FEATURES = ['UNINTEGRATED', 'UNINTEGRATED|' + BF, 'PWY-1', 'PWY-1|' + BF, 'PWY-1|' + EC,
+            'PWY-1|unclassified', 'PWY-2', 'PWY-2|' + EC]
+SAMPLES = ['S1', 'S2', 'S3', 'S4']
+VALUES = np.array([[9., 9., 9., 9.],
+                   [5., 5., 5., 5.],
+                   [10., 8., 6., 4.],
+                   [6., 2., 3., 0.],
+                   [3., 6., 3., 4.],
+                   [1., 0., 0., 0.],
+                   [2., 0., 1., 3.],
+                   [2., 0., 1., 3.]])
+
+KRAKEN = pd.DataFrame({'S1': [0.6, 0.4], 'S2': [0.2, 0.8], 'S3': [0.5, 0.5], 'S4': [0.1, 0.9]},
+                      index=[BF, EC])
+
+
+@pytest.fixture
+def table():
+    return CohortTable(sparse.csr_matrix(VALUES), FEATURES, SAMPLES, 'pathabundance')
+
+
+def _reference_shares():
+    frame = pd.DataFrame(VALUES, index=FEATURES, columns=SAMPLES)
+    frame = frame[[('|' in f) and not f.startswith('UNINTEGRATED') for f in FEATURES]]
+    pathways = frame.index.str.split('|').str[0]
+    return frame / frame.groupby(pathways).transform('sum').replace(0, np.nan)
+
+
+def test_tensor_and_shares(table, tmp_path):
+    """测试贡献张量构建与份额计算."""
+    tensor = ContributionTensor.from_table(table)
+    assert tensor.shape == (2, 3, 4)
+    assert 'UNINTEGRATED' not in set(tensor.pathways)
+
+    dense = np.zeros(tensor.shape)
+    dense[tensor.pathway_index, tensor.taxon_index, tensor.sample_index] = tensor.shares()
+    expected = _reference_shares()
+    for feature, row in expected.iterrows():
+        pathway, taxon = feature.split('|')
+        p, t = list(tensor.pathways).index(pathway), list(tensor.taxa).index(taxon)
+        np.testing.assert_allclose(dense[p, t], row.fillna(0.0).to_numpy())
+
+    loaded = ContributionTensor.load(tensor.save(tmp_path / "tensor.npz"))
+    assert (loaded.to_sparse() != tensor.to_sparse()).nnz == 0
+
+
+def test_summary_correlation_matches_scipy(table):
+    """测试向量化相关性与逐对 scipy 计算一致."""
+    summary = contribution_summary(ContributionTensor.from_table(table), KRAKEN).set_index(['pathway', 'taxon'])
+    shares = _reference_shares().fillna(0.0)
+    for feature, row in shares.iterrows():
+        pathway, taxon = feature.split('|')
+        result = summary.loc[(pathway, taxon)]
+        assert result['mean_share'] == pytest.approx(row.mean())
+        if taxon == 'unclassified' or row.std() == 0:
+            assert np.isnan(result['kraken_correlation'])
+            continue
+        r, p = stats.pearsonr(row.to_numpy(), KRAKEN.loc[taxon, SAMPLES].to_numpy())
+        assert result['kraken_correlation'] == pytest.approx(r)
+        assert result['p_value'] == pytest.approx(p)
+    assert summary.loc[('PWY-2', EC), 'n_samples'] == 3
+
+
+def test_run_with_kraken_reports(table, tmp_path):
+    """测试从 Kraken2 报告目录读取丰度并写出结果."""
+    reports = tmp_path / "kraken"
+    reports.mkdir()
+    for sample in SAMPLES:
+        bf, ec = (int(1000 * KRAKEN.loc[taxon, sample]) for taxon in (BF, EC))
+        (reports / f"{sample}.report").write_text(
+            f" 100.00\t{bf + ec}\t0\tD\t2\tBacteria\n"
+            f" 50.00\t{bf}\t0\tG\t816\t  Bacteroides\n"
+            f" 50.00\t{bf}\t{bf}\tS\t817\t    Bacteroides fragilis\n"
+            f" 50.00\t{ec}\t0\tG\t561\t  Escherichia\n"
+            f" 50.00\t{ec}\t{ec}\tS\t562\t    Escherichia coli\n")
+    abundance = read_kraken_reports(reports)
+    pd.testing.assert_frame_equal(abundance.loc[KRAKEN.index, SAMPLES], KRAKEN, check_names=False)
+
+    joined = tmp_path / "joined"
+    table.stratified().save(joined / "pathabundance_stratified.npz")
+    written = run_contribution_analysis(joined, tmp_path / "out", kraken_input=reports)
+    summary = pd.read_csv(written['summary'])
+    assert len(summary) == 4
+    assert summary['kraken_correlation'].notna().sum() == 3
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""测试 humann_regroup 模块."""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from micos.humann_tables import CohortTable
+from micos.humann_regroup import load_group_mapping, regroup, renormalize, run_renorm_regroup
+
+FEATURES = ['UNMAPPED', 'UniRef90_A', 'UniRef90_A|s__x', 'UniRef90_A|s__y',
+            'UniRef90_B', 'UniRef90_B|s__x', 'UniRef90_C', 'UniRef90_C|s__y']
+VALUES = np.array([[10., 0.],
+                   [6., 4.],
+                   [4., 1.],
+                   [2., 3.],
+                   [3., 2.],
+                   [3., 2.],
+                   [1., 4.],
+                   [1., 4.]])
+
+MAPPING = "K00001\tUniRef90_A\tUniRef90_B\nK00002\tUniRef90_B\n"
+
+
+@pytest.fixture
+def table():
+    return CohortTable(sparse.csr_matrix(VALUES), FEATURES, ['S1', 'S2'], 'genefamilies')
+
+
+def test_renormalize_community(table):
+    """测试 community 模式以未分层行的列和为分母."""
+    result = renormalize(table, 'relab').to_dataframe()
+    unstratified_total = VALUES[[0, 1, 4, 6]].sum(axis=0)
+    np.testing.assert_allclose(result.to_numpy(), VALUES / unstratified_total)
+    cpm = renormalize(table, 'cpm').to_dataframe()
+    np.testing.assert_allclose(cpm.loc[['UNMAPPED', 'UniRef90_A', 'UniRef90_B', 'UniRef90_C']].sum(),
+                               [1e6, 1e6])
+
+
+def test_renormalize_levelwise_and_special(table):
+    """测试 levelwise 模式与去除特殊行."""
+    result = renormalize(table, 'relab', mode='levelwise').to_dataframe()
+    stratified = [feature for feature in FEATURES if '|' in feature]
+    np.testing.assert_allclose(result.loc[stratified].sum(), [1.0, 1.0])
+    without_special = renormalize(table, 'relab', special=False).to_dataframe()
+    assert 'UNMAPPED' not in without_special.index
+    np.testing.assert_allclose(without_special.loc[['UniRef90_A', 'UniRef90_B', 'UniRef90_C']].sum(),
+                               [1.0, 1.0])
+    with pytest.raises(ValueError):
+        renormalize(table, 'tpm')
+
+
+def test_regroup_matches_loop(table, tmp_path):
+    """测试重分组与逐行累加结果一致."""
+    mapping_file = tmp_path / "map_ko_uniref90.txt.gz"
+    with gzip.open(mapping_file, 'wt') as f:
+        f.write(MAPPING)
+    mapping = load_group_mapping(mapping_file, cache_dir=tmp_path / "cache")
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == 1
+
+    result = regroup(table, mapping).to_dataframe()
+    frame = pd.DataFrame(VALUES, index=FEATURES, columns=['S1', 'S2'])
+    expected = {
+        'UNMAPPED': frame.loc['UNMAPPED'],
+        'K00001': frame.loc['UniRef90_A'] + frame.loc['UniRef90_B'],
+        'K00001|s__x': frame.loc['UniRef90_A|s__x'] + frame.loc['UniRef90_B|s__x'],
+        'K00001|s__y': frame.loc['UniRef90_A|s__y'],
+        'K00002': frame.loc['UniRef90_B'],
+        'K00002|s__x': frame.loc['UniRef90_B|s__x'],
+        'UNGROUPED': frame.loc['UniRef90_C'],
+        'UNGROUPED|s__y': frame.loc['UniRef90_C|s__y'],
+    }
+    expected = pd.DataFrame(expected).T
+    pd.testing.assert_frame_equal(result.sort_index(), expected.sort_index(), check_names=False)
+    assert list(result.index).index('K00001|s__x') == list(result.index).index('K00001') + 1
+
+    # 第二次读取使用缓存
+    cached = load_group_mapping(mapping_file, cache_dir=tmp_path / "cache")
+    assert (cached.matrix != mapping.matrix).nnz == 0
+    assert list(cached.groups) == list(mapping.groups)
+
+
+def test_run_renorm_regroup(table, tmp_path):
+    """测试重标准化/重分组阶段写出结果矩阵."""
+    joined = tmp_path / "joined"
+    table.save(joined / "genefamilies.npz")
+    mapping_file = tmp_path / "map_ko.txt"
+    mapping_file.write_text(MAPPING)
+
+    written = run_renorm_regroup(joined, tmp_path / "out", units='relab', mappings={'ko': str(mapping_file)})
+    assert set(written) == {'genefamilies_relab', 'genefamilies_ko_relab'}
+    grouped = CohortTable.load(written['genefamilies_ko_relab']).to_dataframe()
+    assert np.allclose(grouped.loc[['UNMAPPED', 'K00001', 'K00002', 'UNGROUPED']].sum(), 1.0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""测试 humann_split 模块."""
+
+import gzip
+
+from micos.humann_split import run_split_tables, split_humann_table
+
+TABLE = """\
+# Gene Family\tS1_Abundance-RPKs\tS2_Abundance-RPKs\tS3_Abundance-RPKs
+UNMAPPED\t100.0\t80.0\t90.0
+UniRef90_A\t10.0\t5.0\t0.0
+UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis\t6.0\t5.0\t0.0
+UniRef90_A|unclassified\t4.0\t0.0\t0.0
+UniRef90_B\t0.5\t0.0\t0.0
+UniRef90_B|g__Escherichia.s__Escherichia_coli\t0.5\t0.0\t0.0
+UniRef90_C\t2.0\t3.0\t4.0
+"""
+
+
+def _lines(path):
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return f.read().splitlines()
+
+
+def test_split_without_filter(tmp_path):
+    """测试拆分为未分层、分层与物种贡献表."""
+    table = tmp_path / "cohort_genefamilies.tsv"
+    table.write_text(TABLE)
+    paths = split_humann_table(table, tmp_path / "split")
+
+    unstratified = _lines(paths['unstratified'])
+    assert unstratified[0].startswith('# Gene Family')
+    assert [line.split('\t')[0] for line in unstratified[1:]] == \
+        ['UNMAPPED', 'UniRef90_A', 'UniRef90_B', 'UniRef90_C']
+    stratified = _lines(paths['stratified'])
+    assert len(stratified) == 4
+    contributions = _lines(paths['contributions'])
+    assert contributions[0].split('\t')[:2] == ['# Gene Family', 'Taxon']
+    assert contributions[1].split('\t') == \
+        ['UniRef90_A', 'g__Bacteroides.s__Bacteroides_fragilis', '6.0', '5.0', '0.0']
+
+
+def test_filter_by_abundance_and_prevalence(tmp_path):
+    """测试按丰度与流行率过滤，分层行跟随其未分层父行."""
+    table = tmp_path / "cohort_genefamilies.tsv"
+    table.write_text(TABLE)
+    paths = split_humann_table(table, tmp_path / "split", min_abundance=1.0, min_prevalence=0.5)
+
+    assert [line.split('\t')[0] for line in _lines(paths['unstratified'])[1:]] == \
+        ['UNMAPPED', 'UniRef90_A', 'UniRef90_C']
+    # UniRef90_B 被过滤，其分层行同时被过滤；UniRef90_A 的分层行全部保留
+    assert [line.split('\t')[0] for line in _lines(paths['stratified'])[1:]] == \
+        ['UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis', 'UniRef90_A|unclassified']
+
+
+def test_gzip_input_and_sample_selection(tmp_path):
+    """测试 gzip 输入输出与按样本查找."""
+    with gzip.open(tmp_path / "S1_genefamilies.tsv.gz", 'wt') as f:
+        f.write(TABLE)
+    (tmp_path / "S2_pathabundance.tsv").write_text("# Pathway\tS2\nUNINTEGRATED\t1.0\n")
+
+    written = run_split_tables(tmp_path, tmp_path / "split", sample="S1")
+    assert len(written) == 1
+    paths = next(iter(written.values()))
+    assert paths['unstratified'].name == "S1_genefamilies_unstratified.tsv.gz"
+    assert len(_lines(paths['unstratified'])) == 5
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""测试 humann_tables 模块."""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from micos.humann_split import run_split_tables
+from micos.humann_tables import CohortTable, find_sample_tables, join_tables, run_join_tables
+
+GENEFAMILIES = {
+    'S1': ("# Gene Family\tS1_Abundance-RPKs\n"
+           "UNMAPPED\t100.0\n"
+           "UniRef90_A\t10.0\n"
+           "UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis\t6.0\n"
+           "UniRef90_A|unclassified\t4.0\n"
+           "UniRef90_B\t0.0\n"),
+    'S2': ("# Gene Family\tS2_Abundance-RPKs\n"
+           "UNMAPPED\t50.0\n"
+           "UniRef90_AB\t3.0\n"
+           "UniRef90_AB|g__Escherichia.s__Escherichia_coli\t3.0\n"
+           "UniRef90_A\t2.5\n"),
+}
+
+
+def _write_tables(directory):
+    (directory / "S1_genefamilies.tsv").write_text(GENEFAMILIES['S1'])
+    with gzip.open(directory / "S2_genefamilies.tsv.gz", 'wt') as f:
+        f.write(GENEFAMILIES['S2'])
+    (directory / "S1_pathabundance.tsv").write_text("# Pathway\tS1\nUNINTEGRATED\t5.0\n")
+
+
+def _reference(tables):
+    """pandas 外连接作为参考结果."""
+    frames = []
+    for sample, text in tables.items():
+        rows = [line.split('\t') for line in text.splitlines() if not line.startswith('#')]
+        frames.append(pd.Series({feature: float(value) for feature, value in rows}, name=sample))
+    return pd.concat(frames, axis=1).fillna(0.0)
+
+
+def test_join_matches_outer_merge(tmp_path):
+    """测试流式合并与 pandas 外连接结果一致，零值不存储."""
+    _write_tables(tmp_path)
+    tables = find_sample_tables(tmp_path, 'genefamilies')
+    assert list(tables) == ['S1', 'S2']
+
+    cohort = join_tables(tables, 'genefamilies')
+    expected = _reference(GENEFAMILIES)
+    expected = expected[(expected != 0).any(axis=1)]
+    joined = cohort.to_dataframe()
+    pd.testing.assert_frame_equal(joined.sort_index(), expected.sort_index(), check_names=False)
+    assert cohort.matrix.nnz == int((expected != 0).values.sum())
+
+    # 每个未分层特征后紧跟其分层行
+    features = list(cohort.features)
+    assert features.index('UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis') == \
+        features.index('UniRef90_A') + 1
+    assert features.index('UniRef90_AB|g__Escherichia.s__Escherichia_coli') == \
+        features.index('UniRef90_AB') + 1
+
+
+def test_stratified_views(tmp_path):
+    """测试分层与未分层视图."""
+    _write_tables(tmp_path)
+    cohort = join_tables(find_sample_tables(tmp_path, 'genefamilies'))
+    unstratified, stratified = cohort.unstratified(), cohort.stratified()
+    assert set(unstratified.features) == {'UNMAPPED', 'UniRef90_A', 'UniRef90_AB'}
+    assert all('|' in feature for feature in stratified.features)
+    assert unstratified.shape[0] + stratified.shape[0] == cohort.shape[0]
+
+
+def test_run_join_tables_writes_npz(tmp_path):
+    """测试合并阶段写出 npz 并可重新读取."""
+    _write_tables(tmp_path)
+    output = tmp_path / "joined"
+    written = run_join_tables(tmp_path, output)
+    assert set(written) == {'genefamilies', 'pathabundance'}
+    assert (output / "genefamilies_stratified.npz").exists()
+
+    cohort = join_tables(find_sample_tables(tmp_path, 'genefamilies'), 'genefamilies')
+    loaded = CohortTable.load(output / "genefamilies.npz")
+    assert loaded.table_type == 'genefamilies'
+    assert loaded.samples == ['S1', 'S2']
+    assert list(loaded.features) == list(cohort.features)
+    assert np.array_equal(loaded.matrix.toarray(), cohort.matrix.toarray())
+
+    with pytest.raises(ValueError):
+        run_join_tables(tmp_path, output, formats=('tsv',))
+
+
+def test_cohort_prevalence_filter(tmp_path):
+    """测试队列水平按丰度与流行率过滤，分层行跟随其未分层父行."""
+    _write_tables(tmp_path)
+    cohort = join_tables(find_sample_tables(tmp_path, 'genefamilies'))
+    filtered = cohort.filter(min_abundance=5.0, min_prevalence=0.5)
+    # UniRef90_A 仅在 S1 中 >= 5（流行率 0.5），UniRef90_AB 在任何样本中都低于 5
+    assert list(filtered.features) == ['UNMAPPED', 'UniRef90_A',
+                                       'UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis',
+                                       'UniRef90_A|unclassified']
+    assert list(cohort.filter(min_prevalence=1.0).features) == ['UNMAPPED', 'UniRef90_A',
+                                                                 'UniRef90_A|g__Bacteroides.s__Bacteroides_fragilis',
+                                                                 'UniRef90_A|unclassified']
+
+
+def test_run_join_tables_reads_split_tables(tmp_path):
+    """测试合并优先读取功能注释阶段写出的单样本拆分表，并在合并后按流行率过滤."""
+    _write_tables(tmp_path)
+    run_split_tables(tmp_path, tmp_path / "split", min_abundance=3.0, sample='S2')
+    output = tmp_path / "joined"
+    run_join_tables(tmp_path, output, min_prevalence=1.0)
+
+    loaded = CohortTable.load(output / "genefamilies.npz")
+    assert loaded.samples == ['S1', 'S2']
+    # S2 的拆分表已去除 UniRef90_A (2.5 < 3)，因此其流行率仅为 0.5
+    assert list(loaded.features) == ['UNMAPPED']
+    assert list(CohortTable.load(output / "pathabundance.npz").features) == ['UNINTEGRATED']
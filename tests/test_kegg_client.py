@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 KEGG 客户端测试
+
+使用本地 KEGG 模拟服务验证批量请求、并发、速率限制与磁盘缓存
+"""
+
+import unittest
+import tempfile
+import os
+import time
+import shutil
+from pathlib import Path
+import pandas as pd
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+sys.path.append(os.path.dirname(__file__))
+
+from kegg_client import KEGGClient, MAX_IDS_PER_REQUEST
+from fake_kegg_server import FakeKEGGServer, ko_entry
+from annotation_index import AnnotationIndex
+from functional_annotation import FunctionalAnnotator
+
+PATHWAYS = {'map00010': 'Glycolysis / Gluconeogenesis', 'map00020': 'Citrate cycle (TCA cycle)'}
+KO_IDS = [f"K{i:05d}" for i in range(1, 36)]
+
+
+class TestKEGGClient(unittest.TestCase):
+    """KEGG 客户端测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        entries = {ko: ko_entry(ko, f"name of {ko}", {'map00010': PATHWAYS['map00010']}) for ko in KO_IDS}
+        links = {'pathway': {f"ko:{ko}": ['path:map00010', 'path:ko00010'] + (['path:ko00020'] if i % 2 else [])
+                             for i, ko in enumerate(KO_IDS)}}
+        lists = {'pathway': PATHWAYS, 'ko': {ko: f"name of {ko}" for ko in KO_IDS}}
+        self.server = FakeKEGGServer(entries, links, lists, latency=0.05).start()
+
+    def tearDown(self):
+        """测试后清理"""
+        self.server.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _client(self, **kwargs):
+        kwargs.setdefault('cache_dir', str(self.temp_dir / "cache"))
+        kwargs.setdefault('requests_per_second', 0)
+        return KEGGClient(self.server.url, **kwargs)
+
+    def test_get_batches_ids(self):
+        """测试 get 请求按每批最多 10 个ID合并"""
+        with self._client() as client:
+            entries = client.get(['ko:' + ko for ko in KO_IDS] + ['K99999', 'ko:K00001'])
+        self.assertEqual(len(entries), len(KO_IDS))
+        self.assertIn('name of K00007', entries['ko:K00007'])
+        self.assertTrue(entries['ko:K00007'].rstrip().endswith('///'))
+        self.assertEqual(len(self.server.requests), 4)
+        for path in self.server.requests:
+            self.assertLessEqual(path.count('+') + 1, MAX_IDS_PER_REQUEST)
+
+    def test_link_and_list(self):
+        """测试 link 与 list 接口"""
+        with self._client() as client:
+            links = client.link('pathway', ['ko:K00001', 'ko:K00002', 'ko:K99999'])
+            names = client.list('pathway')
+        self.assertEqual(sorted(links.loc[links['source'] == 'ko:K00002', 'target']),
+                         ['path:ko00010', 'path:ko00020', 'path:map00010'])
+        self.assertEqual(names['map00020'], 'Citrate cycle (TCA cycle)')
+
+    def test_cache_avoids_network(self):
+        """测试重复请求读取磁盘缓存，过期后重新请求"""
+        with self._client() as client:
+            first = client.link('pathway', ['ko:' + ko for ko in KO_IDS])
+            self.assertEqual(client.n_requests, 4)
+        with self._client() as client:
+            second = client.link('pathway', ['ko:' + ko for ko in KO_IDS])
+            client.get(['K99999'])
+            client.get(['K99999'])
+            self.assertEqual(client.n_requests, 1)
+        self.assertTrue(first.equals(second))
+        with self._client(cache_ttl=0) as client:
+            client.list('pathway')
+            self.assertEqual(client.n_requests, 1)
+
+    def test_cache_is_per_id(self):
+        """测试缓存按ID命中：增加或重排ID时只请求未缓存的ID"""
+        ids = ['ko:' + ko for ko in KO_IDS[:20]]
+        with self._client() as client:
+            client.get(ids)
+            client.link('pathway', ids)
+        self.server.requests.clear()
+        with self._client() as client:
+            entries = client.get(['ko:K00021'] + ids[::-1])
+            links = client.link('pathway', ids[5:] + ['ko:K00021'] + ids[:5])
+            self.assertEqual(client.n_requests, 2)
+        self.assertEqual(self.server.requests, ['/get/ko:K00021', '/link/pathway/ko:K00021'])
+        self.assertEqual(len(entries), 21)
+        self.assertEqual(sorted(links.loc[links['source'] == 'ko:K00002', 'target']),
+                         ['path:ko00010', 'path:ko00020', 'path:map00010'])
+        self.assertEqual(links['source'].nunique(), 21)
+
+    def test_concurrency_and_rate_limit(self):
+        """测试并发请求与速率限制"""
+        ids = ['ko:' + ko for ko in KO_IDS]
+        with self._client(cache_dir=None, max_workers=4) as client:
+            self.assertEqual(len(client.get(ids)), len(KO_IDS))
+        self.assertGreater(self.server.max_active, 1)
+
+        self.server.max_active = 0
+        with self._client(cache_dir=None, max_workers=4, requests_per_second=20) as client:
+            start = time.monotonic()
+            client.get(ids)
+            limited_time = time.monotonic() - start
+        # 4 个请求之间至少间隔 3 × 1/20 秒
+        self.assertGreaterEqual(limited_time, 3 / 20 * 0.9)
+
+    def test_functional_annotator_uses_api(self):
+        """测试功能注释器在索引缺少通路关系时使用 KEGG API"""
+        index_dir = self.temp_dir / "index"
+        AnnotationIndex.build(str(index_dir), {'ko': pd.DataFrame({'id': ['gene1', 'gene2'],
+                                                                 'term': ['K00001', 'K00002']})})
+        gene_list = self.temp_dir / "genes.txt"
+        gene_list.write_text("gene1\ngene2\n")
+        annotator = FunctionalAnnotator(self.temp_dir / "output", annotation_index=str(index_dir),
+                                        use_kegg_api=True, kegg_cache_dir=self.temp_dir / "cache")
+        annotator.kegg_client = self._client()
+        kegg = annotator.annotate_kegg_pathways(gene_list, self.temp_dir / "kegg.csv")
+        self.assertEqual(sorted(zip(kegg['gene_id'], kegg['pathway_id'])),
+                         [('gene1', 'ko00010'), ('gene2', 'ko00010'), ('gene2', 'ko00020')])
+        self.assertEqual(set(kegg['pathway_name']), set(PATHWAYS.values()))
+        self.assertEqual(kegg.loc[kegg['gene_id'] == 'gene1', 'definition'].iloc[0], 'name of K00001')
+
+
+if __name__ == '__main__':
+    unittest.main()
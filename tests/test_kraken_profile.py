@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""测试 kraken_profile 模块."""
+
+import os
+import stat
+
+from micos.kraken_profile import kraken_report_to_metaphlan, parse_kraken_report
+from micos.functional_annotation import run_functional_annotation
+
+REPORT = """\
+ 10.00\t100\t100\tU\t0\tunclassified
+ 90.00\t900\t0\tR\t1\troot
+ 90.00\t900\t10\tR1\t131567\t  cellular organisms
+ 89.00\t890\t5\tD\t2\t    Bacteria
+ 60.00\t600\t0\tP\t976\t      Bacteroidota
+ 60.00\t600\t0\tC\t200643\t        Bacteroidia
+ 60.00\t600\t0\tO\t171549\t          Bacteroidales
+ 60.00\t600\t0\tF\t815\t            Bacteroidaceae
+ 60.00\t600\t20\tG\t816\t              Bacteroides
+ 40.00\t400\t300\tS\t817\t                Bacteroides fragilis
+ 10.00\t100\t100\tS1\t272559\t                  Bacteroides fragilis NCTC 9343
+ 18.00\t180\t180\tS\t818\t                Bacteroides thetaiotaomicron
+ 28.00\t285\t0\tP\t1224\t      Pseudomonadota
+ 28.00\t285\t0\tC\t1236\t        Gammaproteobacteria
+ 28.00\t285\t0\tO\t91347\t          Enterobacterales
+ 28.00\t285\t0\tF\t543\t            Enterobacteriaceae
+ 28.00\t285\t5\tG\t561\t              Escherichia
+ 28.00\t280\t280\tS\t562\t                Escherichia coli
+  0.00\t0\t0\tS\t564\t                Escherichia fergusonii
+"""
+
+
+def _read_profile(path):
+    rows = {}
+    for line in path.read_text().splitlines():
+        if not line.startswith('#'):
+            clade, taxids, abundance, _ = line.split('\t')
+            rows[clade] = (taxids, float(abundance))
+    return rows
+
+
+def test_parse_kraken_report(tmp_path):
+    """测试按缩进重建物种谱系，亚种 reads 计入物种分支."""
+    report = tmp_path / "S1.report"
+    report.write_text(REPORT)
+    species = {record['taxid']: record for record in parse_kraken_report(report)}
+    assert set(species) == {'817', '818', '562'}
+    assert species['817']['reads'] == 400
+    assert [prefix for prefix, _, _ in species['562']['lineage']] == ['k', 'p', 'c', 'o', 'f', 'g', 's']
+
+
+def test_convert_to_metaphlan(tmp_path):
+    """测试转换为 MetaPhlAn 格式物种谱."""
+    report = tmp_path / "S1.report"
+    report.write_text(REPORT)
+    profile = tmp_path / "S1_profile.tsv"
+    assert kraken_report_to_metaphlan(report, profile, db_version="mpa_test") == 3
+
+    assert profile.read_text().splitlines()[0] == "#mpa_test"
+    rows = _read_profile(profile)
+    clade = ("k__Bacteria|p__Bacteroidota|c__Bacteroidia|o__Bacteroidales|f__Bacteroidaceae|"
+             "g__Bacteroides|s__Bacteroides_fragilis")
+    assert rows[clade][0] == "2|976|200643|171549|815|816|817"
+    assert abs(rows[clade][1] - 100 * 400 / 860) < 1e-4
+    assert abs(sum(abundance for _, abundance in rows.values()) - 100) < 1e-3
+
+
+def test_chocophlan_filter_and_taxid_map(tmp_path):
+    """测试按 ChocoPhlAn 过滤与 taxid 映射覆盖."""
+    report = tmp_path / "S1.report"
+    report.write_text(REPORT)
+    profile = tmp_path / "S1_profile.tsv"
+    species = {'g__Bacteroides.s__Bacteroides_fragilis', 'g__Escherichia.s__Escherichia_coli_K12'}
+    kraken_report_to_metaphlan(report, profile, chocophlan_species=species,
+                               taxid_map={'562': 'g__Escherichia.s__Escherichia_coli_K12'})
+    clades = [clade.split('|')[-1] for clade in _read_profile(profile)]
+    assert sorted(clades) == ['s__Bacteroides_fragilis', 's__Escherichia_coli_K12']
+
+
+def test_humann_receives_taxonomic_profile(tmp_path, monkeypatch):
+    """测试功能注释将物种谱通过 --taxonomic-profile 传给 HUMAnN."""
+    reads = tmp_path / "reads"
+    reads.mkdir()
+    (reads / "S1_paired_1.fastq").write_text("@r\nACGT\n+\nIIII\n")
+    (reads / "S1_paired_2.fastq").write_text("@r\nACGT\n+\nIIII\n")
+    reports = tmp_path / "kraken"
+    reports.mkdir()
+    (reports / "S1.report").write_text(REPORT)
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    humann = bin_dir / "humann"
+    humann.write_text(f"#!/bin/sh\necho \"$@\" > {tmp_path / 'humann_args.txt'}\n")
+    humann.chmod(humann.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    output = tmp_path / "functional"
+    run_functional_annotation(str(reads), str(output), 2, kraken_reports_dir=str(reports))
+    args = (tmp_path / "humann_args.txt").read_text().split()
+    profile = output / "taxonomic_profiles" / "S1_metaphlan_profile.tsv"
+    assert args[args.index("--taxonomic-profile") + 1] == str(profile)
+    assert profile.exists()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 负二项差异表达引擎测试
+
+以模拟的负二项计数验证大小因子、离散度与 Wald 检验，并与逐基因数值优化结果对照
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import optimize, special
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from nb_differential import differential_expression, median_of_ratios
+from metatranscriptome_analysis import MetatranscriptomeAnalyzer
+
+
+def _nb_fit(counts: np.ndarray, size_factors: np.ndarray, design: np.ndarray, alpha: float) -> np.ndarray:
+    """固定离散度下逐基因数值优化负二项对数似然"""
+    r = 1.0 / alpha
+
+    def negative_loglik(beta):
+        mu = size_factors * np.exp(design @ beta)
+        return -(special.gammaln(counts + r) - special.gammaln(r)
+                 + r * np.log(r / (r + mu)) + counts * np.log(mu / (r + mu))).sum()
+
+    start = np.array([np.log(counts.mean() / size_factors.mean() + 0.1), 0.0])
+    return optimize.minimize(negative_loglik, start, method='BFGS', options={'gtol': 1e-10}).x
+
+
+class TestNBDifferential(unittest.TestCase):
+    """负二项差异表达测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        rng = np.random.default_rng(7)
+        n_genes, self.n_per_group = 400, 6
+        self.samples = [f"S{j}" for j in range(2 * self.n_per_group)]
+        self.conditions = pd.Series(['control'] * self.n_per_group + ['treated'] * self.n_per_group,
+                                    index=self.samples)
+        self.true_factors = rng.uniform(0.5, 2.0, size=len(self.samples))
+        base = rng.gamma(2.0, 100.0, size=n_genes) + 5
+        self.true_lfc = np.zeros(n_genes)
+        self.true_lfc[:40] = rng.choice([-2.0, 2.0], size=40)
+        dispersion = 0.05 + 2.0 / base
+        treated = (self.conditions == 'treated').to_numpy()
+        mu = base[:, None] * self.true_factors[None, :] * np.where(treated, 2.0 ** self.true_lfc[:, None], 1.0)
+        r = 1.0 / dispersion[:, None]
+        counts = rng.negative_binomial(r, r / (r + mu))
+        counts[-1] = 0  # 全零基因
+        self.counts = pd.DataFrame(counts, index=[f"gene{i}" for i in range(n_genes)], columns=self.samples)
+        self.count_file = self.temp_dir / "counts.tsv"
+        self.counts.to_csv(self.count_file, sep='\t')
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_median_of_ratios(self):
+        """测试中位数比值法与按定义计算一致"""
+        positive = self.counts[(self.counts > 0).all(axis=1)].to_numpy(dtype=float)
+        log_geo = np.log(positive).mean(axis=1, keepdims=True)
+        expected = np.exp(np.median(np.log(positive) - log_geo, axis=0))
+        factors = median_of_ratios(np.log(positive) - log_geo)
+        np.testing.assert_allclose(factors, expected / np.exp(np.log(expected).mean()))
+        # 按列存储的内存映射矩阵逐样本求中位数，结果相同
+        ratio_path = self.temp_dir / "log_ratios.dat"
+        ratios = np.memmap(ratio_path, dtype=np.float64, mode='w+', shape=positive.shape, order='F')
+        ratios[:] = np.log(positive) - log_geo
+        np.testing.assert_allclose(median_of_ratios(ratios), factors)
+        del ratios
+        # 与真实大小因子成比例
+        ratio = factors / self.true_factors
+        self.assertLess(ratio.std() / ratio.mean(), 0.05)
+
+    def test_wald_matches_numeric_fit(self):
+        """测试向量化 IRLS 与逐基因数值优化一致，并检出差异基因"""
+        results, size_factors = differential_expression(str(self.count_file), self.conditions,
+                                                        'control', 'treated', chunk_size=64)
+        self.assertEqual(list(results.index), list(self.counts.index))
+        self.assertTrue(results.loc['gene399'].drop('baseMean').isna().all())
+
+        design = np.column_stack([np.ones(len(self.samples)), (self.conditions == 'treated').to_numpy()])
+        for gene in ['gene0', 'gene1', 'gene100', 'gene250']:
+            beta = _nb_fit(self.counts.loc[gene].to_numpy(dtype=float), size_factors.to_numpy(), design,
+                           results.loc[gene, 'dispersion'])
+            self.assertAlmostEqual(results.loc[gene, 'log2FoldChange'], beta[1] / np.log(2), places=4)
+
+        # 收缩后的离散度位于基因估计与趋势之间（离群基因除外）
+        shrunk = results.dropna()
+        between = ((shrunk['dispersion'] - shrunk['dispGeneEst']) *
+                   (shrunk['dispersion'] - shrunk['dispFit']) <= 1e-12)
+        self.assertGreater(between.mean(), 0.9)
+
+        significant = results['padj'] < 0.05
+        self.assertGreater(significant.iloc[:40].mean(), 0.8)
+        self.assertLess(significant.iloc[40:].mean(), 0.05)
+        np.testing.assert_allclose(results['log2FoldChange'].iloc[:40][significant.iloc[:40]],
+                                   self.true_lfc[:40][significant.iloc[:40].to_numpy()], atol=0.6)
+
+    def test_parallel_matches_serial(self):
+        """测试进程池并行与串行结果一致"""
+        serial, _ = differential_expression(str(self.count_file), self.conditions, 'control', 'treated',
+                                            n_jobs=1, chunk_size=100)
+        parallel, _ = differential_expression(str(self.count_file), self.conditions, 'control', 'treated',
+                                              n_jobs=2, chunk_size=100)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+    def test_analyzer_writes_results(self):
+        """测试宏转录组分析器写出差异表达结果"""
+        config_file = self.temp_dir / "config.yaml"
+        config_file.write_text("metatranscriptome_analysis:\n  differential_expression:\n"
+                               "    alpha: 0.05\n    fold_change_threshold: 2.0\n    n_jobs: 1\n")
+        metadata_file = self.temp_dir / "metadata.tsv"
+        self.conditions.rename('group').to_frame().to_csv(metadata_file, sep='\t')
+
+        analyzer = MetatranscriptomeAnalyzer(str(config_file), str(self.temp_dir / "out"))
+        outputs = analyzer.run_differential_expression(str(self.count_file), str(metadata_file), 'group')
+        self.assertTrue(Path(outputs['results']).exists())
+        self.assertEqual(Path(outputs['results']).name, "treated_vs_control_results.tsv")
+        significant = pd.read_csv(outputs['significant'], sep='\t', index_col=0)
+        self.assertTrue((significant['log2FoldChange'].abs() >= 1).all())
+        self.assertGreater(len(significant), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 邻接法建树测试
+
+验证邻接法对可加距离的精确重建以及下界剪枝的一致性
+"""
+
+import unittest
+import os
+import numpy as np
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tree_arrays import ArrayTree
+from neighbor_joining import neighbor_joining
+
+
+def _random_tree(n_tips: int, rng: np.random.Generator) -> ArrayTree:
+    """随机合并叶节点生成二叉树（节点按合并顺序编号，根为最后一个节点）"""
+    parent = np.full(2 * n_tips - 1, -1)
+    lengths = rng.uniform(0.05, 1.0, 2 * n_tips - 1)
+    available = list(range(n_tips))
+    for node in range(n_tips, 2 * n_tips - 1):
+        a, b = sorted(rng.choice(len(available), 2, replace=False))
+        parent[available[a]] = parent[available[b]] = node
+        available[a] = node
+        available.pop(b)
+    names = [f"t{i}" for i in range(n_tips)] + [''] * (n_tips - 1)
+    return ArrayTree.from_parent_array(parent, lengths, names)
+
+
+def _tip_distances(tree: ArrayTree, names) -> np.ndarray:
+    """叶节点间的路径长度矩阵（按 names 排序）"""
+    ancestors = np.zeros((len(names), tree.n_nodes))
+    for row, name in enumerate(names):
+        node = tree.tip_index[name]
+        while node >= 0:
+            ancestors[row, node] = 1.0
+            node = tree.parent[node]
+    depth = ancestors @ tree.branch_length
+    shared = (ancestors * tree.branch_length) @ ancestors.T
+    return depth[:, None] + depth[None, :] - 2 * shared
+
+
+class TestNeighborJoining(unittest.TestCase):
+    """邻接法测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.rng = np.random.default_rng(0)
+        self.names = [f"t{i}" for i in range(40)]
+
+    def test_from_parent_array_reorders_to_preorder(self):
+        """测试任意编号的父节点数组转换为先序编号"""
+        tree = ArrayTree.from_parent_array(np.array([3, 3, 4, 4, -1]), np.array([1., 2., 3., 4., 0.]),
+                                           ['A', 'B', 'C', '', 'root'])
+        self.assertEqual(tree.names[0], 'root')
+        self.assertTrue(np.all(tree.parent[1:] < np.arange(1, tree.n_nodes)))
+        self.assertEqual(tree.to_newick(), "(C:3.0,(A:1.0,B:2.0):4.0)root;")
+
+    def test_recovers_additive_tree(self):
+        """测试可加距离矩阵下精确重建原树的路径长度"""
+        expected = _tip_distances(_random_tree(40, self.rng), self.names)
+        for use_bound in (True, False):
+            tree = neighbor_joining(expected, self.names, use_bound=use_bound)
+            self.assertEqual(tree.n_tips, 40)
+            np.testing.assert_allclose(_tip_distances(tree, self.names), expected, atol=1e-4)
+
+    def test_bound_matches_full_search(self):
+        """测试下界剪枝与完整搜索得到相同的树"""
+        distances = self.rng.random((60, 60))
+        distances = distances + distances.T
+        names = [f"s{i}" for i in range(60)]
+        bounded = neighbor_joining(distances, names, use_bound=True, batch_size=4)
+        full = neighbor_joining(distances, names, use_bound=False)
+        self.assertEqual(bounded.to_newick(), full.to_newick())
+
+    def test_small_inputs(self):
+        """测试少于三个叶节点的输入"""
+        tree = neighbor_joining(np.array([[0.0, 2.0], [2.0, 0.0]]), ['A', 'B'])
+        self.assertEqual(tree.to_newick(), "(A:1.0,B:1.0);")
+
+
+if __name__ == '__main__':
+    unittest.main()
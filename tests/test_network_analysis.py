@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 网络分析模块测试
+
+测试相关性计算与网络构建功能的正确性
+"""
+
+import unittest
+import unittest.mock
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import pandas as pd
+import numpy as np
+import yaml
+import networkx as nx
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from scipy.stats import spearmanr
+
+from network_analysis import (NetworkAnalyzer, correlation_matrix, sparcc_correlation,
+                              sparse_stress_layout)
+
+
+def _write_config(path: Path, network_config: dict) -> str:
+    """写入测试配置文件"""
+    config_file = path / "config.yaml"
+    with open(config_file, 'w') as f:
+        yaml.dump({'network_analysis': network_config}, f)
+    return str(config_file)
+
+
+def _simulate_counts(n_features: int = 12, n_samples: int = 80, seed: int = 0) -> pd.DataFrame:
+    """模拟计数数据: 物种0与物种1的绝对丰度强相关，其余物种独立"""
+    rng = np.random.default_rng(seed)
+    absolute = rng.lognormal(mean=3.0, sigma=1.0, size=(n_samples, n_features))
+    absolute[:, 1] = absolute[:, 0] * rng.lognormal(0.0, 0.1, n_samples)
+    fractions = absolute / absolute.sum(axis=1, keepdims=True)
+    counts = np.vstack([rng.multinomial(5000, p) for p in fractions])
+    return pd.DataFrame(counts.T,
+                        index=[f"Taxon{i}" for i in range(n_features)],
+                        columns=[f"Sample{j}" for j in range(n_samples)])
+
+
+class TestSparCC(unittest.TestCase):
+    """SparCC 相关性测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.counts = _simulate_counts()
+        self.abundance_file = self.temp_dir / "abundance.tsv"
+        self.counts.to_csv(self.abundance_file, sep='\t')
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_sparcc_core_matches_direct_solution(self):
+        """测试秩一更新结果与直接求解一致"""
+        rng = np.random.default_rng(1)
+        data = rng.lognormal(size=(50, 15))
+        data[:, 1] = data[:, 0] * rng.lognormal(0, 0.1, 50)
+        log_fractions = np.log(data / data.sum(axis=1, keepdims=True))
+
+        # 直接求解 (无排除) 的基础方差
+        n = data.shape[1]
+        variation = np.var(log_fractions[:, :, None] - log_fractions[:, None, :], axis=0, ddof=1)
+        basis_var = np.linalg.solve(np.ones((n, n)) + np.eye(n) * (n - 2), variation.sum(axis=1))
+        std = np.sqrt(basis_var)
+        expected = (basis_var[:, None] + basis_var[None, :] - variation) / (2 * np.outer(std, std))
+        np.fill_diagonal(expected, 1.0)
+
+        corr = sparcc_correlation(log_fractions, exclusion_iterations=0)
+        np.testing.assert_allclose(corr, np.clip(expected, -1, 1), atol=1e-10)
+
+    def test_sparcc_recovers_planted_correlation(self):
+        """测试 SparCC 识别真实相关并抑制组成效应"""
+        config_file = _write_config(self.temp_dir, {
+            'min_abundance': 0, 'min_prevalence': 0,
+            'sparcc': {'iterations': 5, 'bootstraps': 20, 'seed': 7},
+        })
+        analyzer = NetworkAnalyzer(config_file, str(self.temp_dir / "out"), threads=2)
+        corr_file = analyzer.run_correlation_analysis(str(self.abundance_file), 'sparcc')
+        self.assertTrue(corr_file)
+
+        corr = pd.read_csv(corr_file, sep='\t', index_col=0)
+        pvals = pd.read_csv(corr_file.replace('correlation_matrix', 'pvalues_matrix'),
+                            sep='\t', index_col=0)
+        self.assertGreater(corr.loc['Taxon0', 'Taxon1'], 0.8)
+        self.assertLess(pvals.loc['Taxon0', 'Taxon1'], 0.1)
+
+        off_diag = corr.to_numpy()[~np.eye(len(corr), dtype=bool)]
+        self.assertLess(np.median(np.abs(off_diag)), 0.2)
+
+    def test_sparcc_parallel_matches_serial(self):
+        """测试并行与串行结果一致"""
+        config_file = _write_config(self.temp_dir, {
+            'min_abundance': 0, 'min_prevalence': 0,
+            'sparcc': {'iterations': 3, 'bootstraps': 5, 'seed': 3},
+        })
+        serial = NetworkAnalyzer(config_file, str(self.temp_dir / "serial"), threads=1)
+        parallel = NetworkAnalyzer(config_file, str(self.temp_dir / "parallel"), threads=3)
+
+        corr_s, pval_s = serial._calculate_sparcc_correlation(self.counts)
+        corr_p, pval_p = parallel._calculate_sparcc_correlation(self.counts)
+        np.testing.assert_allclose(corr_s.to_numpy(), corr_p.to_numpy())
+        np.testing.assert_allclose(pval_s.to_numpy(), pval_p.to_numpy())
+
+
+class TestNetworkStability(unittest.TestCase):
+    """网络稳定性分析测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.abundance_file = self.temp_dir / "abundance.tsv"
+        _simulate_counts(n_features=10, n_samples=60).to_csv(self.abundance_file, sep='\t')
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_vectorized_correlation_matches_scipy(self):
+        """测试向量化相关性与 scipy 逐对结果一致"""
+        values = np.random.default_rng(2).normal(size=(6, 25))
+        values[1] = values[0] + np.random.default_rng(3).normal(scale=0.5, size=25)
+        corr, p_values = correlation_matrix(values, 'spearman')
+        expected_corr, expected_p = spearmanr(values[0], values[1])
+        self.assertAlmostEqual(corr[0, 1], expected_corr)
+        self.assertAlmostEqual(p_values[0, 1], expected_p)
+
+    def test_stability_reports_persistent_edge(self):
+        """测试强相关边在子抽样中稳定出现"""
+        config_file = _write_config(self.temp_dir, {
+            'min_abundance': 0, 'min_prevalence': 0,
+            'stability': {'rounds': 12, 'subsample_fraction': 0.8},
+        })
+        analyzer = NetworkAnalyzer(config_file, str(self.temp_dir / "out"), threads=2)
+        edge_file = analyzer.run_stability_analysis(str(self.abundance_file), 'spearman')
+        self.assertTrue(edge_file)
+
+        edges = pd.read_csv(edge_file, sep='\t')
+        planted = edges[(edges['source'] == 'Taxon0') & (edges['target'] == 'Taxon1')]
+        self.assertEqual(len(planted), 1)
+        self.assertTrue(planted['in_reference'].iloc[0])
+        self.assertEqual(planted['persistence'].iloc[0], 1.0)
+
+        nodes = pd.read_csv(analyzer.stability_dir / "node_stability.tsv", sep='\t')
+        self.assertTrue(((nodes['module_consistency'] >= 0) & (nodes['module_consistency'] <= 1)).all())
+        rounds = pd.read_csv(analyzer.stability_dir / "module_consistency.tsv", sep='\t')
+        self.assertEqual(len(rounds), 12)
+
+
+class TestGroupComparison(unittest.TestCase):
+    """分组差异网络测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        control = _simulate_counts(n_features=8, n_samples=40, seed=1)
+        treatment = _simulate_counts(n_features=8, n_samples=40, seed=2)
+        # 处理组中打乱物种1，消除其与物种0的相关
+        treatment.loc['Taxon1'] = np.random.default_rng(3).permutation(treatment.loc['Taxon1'].to_numpy())
+        treatment.columns = [f"Treated{j}" for j in range(40)]
+        abundance = pd.concat([control, treatment], axis=1)
+        self.abundance_file = self.temp_dir / "abundance.tsv"
+        abundance.to_csv(self.abundance_file, sep='\t')
+
+        metadata = pd.DataFrame({
+            'sample-id': abundance.columns,
+            'group': ['Control'] * 40 + ['Treatment'] * 40,
+        })
+        self.metadata_file = self.temp_dir / "samples.tsv"
+        metadata.to_csv(self.metadata_file, sep='\t', index=False)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_group_comparison_detects_lost_edge(self):
+        """测试检测仅在对照组存在的相关边"""
+        config_file = _write_config(self.temp_dir, {'min_abundance': 0, 'min_prevalence': 0})
+        analyzer = NetworkAnalyzer(config_file, str(self.temp_dir / "out"), threads=2)
+        report_file = analyzer.run_group_comparison(str(self.abundance_file), str(self.metadata_file))
+        self.assertTrue(report_file)
+
+        comparison_dir = Path(report_file).parent
+        self.assertTrue((comparison_dir / "Control_network.gml").exists())
+        self.assertTrue((comparison_dir / "Treatment_network.gml").exists())
+
+        differential = pd.read_csv(comparison_dir / "differential_edges.tsv", sep='\t')
+        top = differential.iloc[0]
+        self.assertEqual({top['source'], top['target']}, {'Taxon0', 'Taxon1'})
+        self.assertGreater(top['correlation_a'], top['correlation_b'])
+
+        pairs = pd.read_csv(comparison_dir / "group_pair_comparison.tsv", sep='\t')
+        self.assertGreaterEqual(pairs.loc[0, 'edges_only_a'], 1)
+
+    def test_group_comparison_rejects_small_min_samples(self):
+        """测试 min_samples 小于 4 时 Fisher z 方差无定义，记录错误并返回空路径"""
+        for min_samples in (3, 0):
+            config_file = _write_config(self.temp_dir, {'group_comparison': {'min_samples': min_samples}})
+            analyzer = NetworkAnalyzer(config_file, str(self.temp_dir / "out"), threads=1)
+            with self.assertLogs('network_analysis', level='ERROR') as logs:
+                report = analyzer.run_group_comparison(str(self.abundance_file), str(self.metadata_file))
+            self.assertEqual(report, "")
+            self.assertIn("min_samples", logs.output[0])
+
+
+class TestLargeNetworkVisualization(unittest.TestCase):
+    """大图可视化测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        G = nx.grid_2d_graph(20, 20)
+        G = nx.relabel_nodes(G, {node: f"Taxon{node[0]}_{node[1]}" for node in G.nodes()})
+        nx.set_edge_attributes(G, 'positive', 'edge_type')
+        self.network_file = self.temp_dir / "network.gml"
+        nx.write_gml(G, self.network_file)
+        self.graph = G
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_sparse_stress_preserves_graph_distances(self):
+        """测试稀疏应力布局保持网格结构: 相邻节点距离远小于对角节点距离"""
+        pos = sparse_stress_layout(self.graph, time_budget=5)
+        neighbor = np.linalg.norm(pos['Taxon0_0'] - pos['Taxon0_1'])
+        opposite = np.linalg.norm(pos['Taxon0_0'] - pos['Taxon19_19'])
+        self.assertLess(neighbor * 10, opposite)
+
+    def test_layout_is_cached_next_to_network(self):
+        """测试布局坐标缓存与复用"""
+        config_file = _write_config(self.temp_dir, {'visualization': {'large_graph_threshold': 100}})
+        analyzer = NetworkAnalyzer(config_file, str(self.temp_dir / "out"))
+
+        viz_file = analyzer.visualize_network(str(self.network_file), 'spring', time_budget=5)
+        self.assertTrue(Path(viz_file).exists())
+        cache_file = self.temp_dir / "network.sparse_stress_layout.tsv"
+        self.assertTrue(cache_file.exists())
+
+        first = analyzer._get_network_layout(self.graph, str(self.network_file), 'sparse_stress', 5)
+        with unittest.mock.patch('network_analysis.sparse_stress_layout') as layout_fn:
+            second = analyzer._get_network_layout(self.graph, str(self.network_file),
+                                                  'sparse_stress', 5)
+            layout_fn.assert_not_called()
+        np.testing.assert_allclose(first['Taxon3_4'], second['Taxon3_4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
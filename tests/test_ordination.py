@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 PCoA 排序分析测试
+
+以经典 PCoA 定义（显式双中心化 + 完整特征分解）为参照
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from ordination import pcoa
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+
+class TestPCoA(unittest.TestCase):
+    """PCoA 测试类"""
+
+    def setUp(self):
+        """测试前准备: 主要变异集中在前两维的欧氏距离"""
+        rng = np.random.default_rng(0)
+        points = rng.normal(size=(120, 4)) * [6, 3, 1, 0.5]
+        self.distances = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_exact_matches_classical_definition(self):
+        """测试完整分解与显式双中心化结果一致"""
+        n = len(self.distances)
+        centering = np.eye(n) - 1.0 / n
+        centered = -0.5 * centering @ (self.distances ** 2) @ centering
+        expected = np.linalg.eigvalsh(centered)[::-1]
+
+        coordinates, eigvals, proportion = pcoa(self.distances, 3, method='exact', block_size=50)
+        np.testing.assert_allclose(eigvals, expected[:3])
+        np.testing.assert_allclose(proportion, expected[:3] / expected.sum())
+        np.testing.assert_allclose((coordinates ** 2).sum(axis=0), expected[:3])
+
+    def test_randomized_on_memmap_matches_exact(self):
+        """测试内存映射输入上的随机化分解与完整分解一致"""
+        path = self.temp_dir / "distances.npy"
+        np.save(path, self.distances)
+        memmapped = np.load(path, mmap_mode='r')
+
+        exact = pcoa(self.distances, 2, method='exact')
+        randomized = pcoa(memmapped, 2, method='randomized', block_size=32)
+        for expected, result in zip(exact, randomized):
+            np.testing.assert_allclose(result, expected, atol=1e-8)
+
+    def test_analyzer_writes_outputs(self):
+        """测试分析器输出坐标、解释比例与图"""
+        ids = [f"S{i}" for i in range(len(self.distances))]
+        np.save(self.temp_dir / "unifrac.npy", self.distances)
+        (self.temp_dir / "unifrac.ids.txt").write_text('\n'.join(ids) + '\n')
+
+        analyzer = PhylogeneticAnalyzer(str(self.temp_dir / "out"))
+        prefix = analyzer.output_dir / "unifrac_pcoa"
+        coords = analyzer.calculate_pcoa(self.temp_dir / "unifrac.npy", prefix)
+        self.assertEqual(list(coords.index), ids)
+
+        proportion = pd.read_csv(f"{prefix}_proportion_explained.tsv", sep='\t')
+        self.assertEqual(list(proportion['axis']), ['PC1', 'PC2', 'PC3'])
+        self.assertGreater(proportion['proportion_explained'].iloc[0], 0.5)
+        self.assertTrue(Path(f"{prefix}.png").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
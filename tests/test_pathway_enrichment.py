@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 通路富集分析测试
+
+验证稀疏通路汇总与超几何富集检验
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy.stats import fisher_exact
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from pathway_enrichment import pathway_enrichment
+from stats_utils import bh_adjust
+from functional_annotation import FunctionalAnnotator
+
+
+class TestPathwayEnrichment(unittest.TestCase):
+    """通路富集分析测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        rng = np.random.default_rng(0)
+        self.genes = [f"gene{i}" for i in range(200)]
+        self.abundance = pd.DataFrame(rng.gamma(1.0, 10.0, size=(200, 6)), index=self.genes,
+                                      columns=[f"S{j}" for j in range(6)])
+        rows = []
+        for i, gene in enumerate(self.genes):
+            for pathway in rng.choice(12, size=rng.integers(1, 4), replace=False):
+                rows.append((gene, f"ko{pathway:05d}", f"Pathway {pathway}"))
+        # 重复注释对只计一次，丰度表之外的基因被忽略
+        rows += [rows[0], ('orphan', 'ko00001', 'Pathway 1')]
+        self.annotations = pd.DataFrame(rows, columns=['gene_id', 'pathway_id', 'pathway_name'])
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_per_sample_abundance_matches_loop(self):
+        """测试通路丰度与逐行累加结果一致"""
+        results, per_sample = pathway_enrichment(self.annotations, self.abundance)
+        pairs = self.annotations[self.annotations['gene_id'].isin(self.genes)].drop_duplicates()
+        for pathway, group in pairs.groupby('pathway_id'):
+            expected = self.abundance.loc[group['gene_id']].sum()
+            np.testing.assert_allclose(per_sample.loc[pathway].to_numpy(), expected.to_numpy())
+            row = results.set_index('pathway_id').loc[pathway]
+            self.assertEqual(row['gene_count'], len(group))
+            self.assertAlmostEqual(row['total_abundance'], expected.mean(), places=8)
+        self.assertTrue(results['total_abundance'].is_monotonic_decreasing)
+
+    def test_hypergeometric_matches_fisher(self):
+        """测试超几何 P 值与单侧 Fisher 精确检验一致"""
+        foreground = self.genes[:40]
+        results, _ = pathway_enrichment(self.annotations, self.abundance, foreground_genes=foreground)
+        pairs = self.annotations[self.annotations['gene_id'].isin(self.genes)].drop_duplicates()
+        for _, row in results.iterrows():
+            members = set(pairs.loc[pairs['pathway_id'] == row['pathway_id'], 'gene_id'])
+            a = len(members & set(foreground))
+            table = [[a, 40 - a], [len(members) - a, 160 - len(members) + a]]
+            self.assertEqual(row['foreground_count'], a)
+            self.assertAlmostEqual(row['p_value'], fisher_exact(table, alternative='greater')[1], places=10)
+        np.testing.assert_allclose(results['q_value'], bh_adjust(results['p_value'].to_numpy()))
+
+    def test_bh_adjust(self):
+        """测试 BH 校正"""
+        p_values = np.array([0.01, 0.04, 0.03, 0.2])
+        np.testing.assert_allclose(bh_adjust(p_values), [0.04, 0.16 / 3, 0.16 / 3, 0.2])
+        # NaN 视为未检验，不计入检验数
+        q_values = bh_adjust(np.array([0.01, np.nan, 0.04, 0.03, 0.2]))
+        self.assertTrue(np.isnan(q_values[1]))
+        np.testing.assert_allclose(np.delete(q_values, 1), [0.04, 0.16 / 3, 0.16 / 3, 0.2])
+
+    def test_functional_annotator_writes_outputs(self):
+        """测试功能注释器写出富集结果与各样本通路丰度"""
+        abundance_file = self.temp_dir / "abundance.csv"
+        self.abundance.to_csv(abundance_file)
+        annotator = FunctionalAnnotator(self.temp_dir / "output")
+        output = self.temp_dir / "kegg_enrichment.csv"
+        results = annotator.analyze_kegg_enrichment(self.annotations, abundance_file, output)
+        self.assertIsNotNone(results)
+        for column in ('pathway_id', 'pathway_name', 'gene_count', 'total_abundance',
+                       'avg_abundance_per_gene', 'p_value', 'q_value'):
+            self.assertIn(column, results.columns)
+        per_sample = pd.read_csv(self.temp_dir / "kegg_enrichment_per_sample.csv", index_col=0)
+        self.assertEqual(per_sample.shape, (12, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 参考序列库测试
+
+验证 faidx 索引、内存映射读取与分类单元映射
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import pandas as pd
+from Bio import SeqIO
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from reference_store import ReferenceStore, build_fasta_index
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+FASTA = (">seq1 kraken:taxid|562|NC_000913.3\nACGTACGTAC\nGTACGTACGT\nAC\n"
+         ">seq2 description\nTTTTGGGG\n"
+         ">seq3\r\nAAAACCCC\r\nGG\r\n"
+         ">empty\n")
+
+TAXONOMY = ("Feature ID\tTaxon\n"
+            "seq2\td__Bacteria; p__Firmicutes; g__Bacillus; s__subtilis\n"
+            "seq3\td__Bacteria; p__Proteobacteria; g__Escherichia; s__\n")
+
+
+class TestReferenceStore(unittest.TestCase):
+    """参考序列库测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.fasta = self.temp_dir / "reference.fasta"
+        self.fasta.write_bytes(FASTA.encode())
+        self.taxonomy = self.temp_dir / "taxonomy.tsv"
+        self.taxonomy.write_text(TAXONOMY)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_index_is_faidx_compatible(self):
+        """测试索引格式与 samtools faidx 一致"""
+        index_path, header_taxids = build_fasta_index(str(self.fasta))
+        rows = [line.split('\t') for line in Path(index_path).read_text().splitlines()]
+        self.assertEqual(rows[0], ['seq1', '22', '35', '10', '11'])
+        self.assertEqual(rows[2], ['seq3', '10', '94', '8', '10'])
+        self.assertEqual(header_taxids, {'seq1': '562'})
+
+    def test_fetch_matches_sequential_parse(self):
+        """测试内存映射读取与顺序解析结果一致"""
+        expected = {record.id: str(record.seq) for record in SeqIO.parse(self.fasta, "fasta")}
+        with ReferenceStore(str(self.fasta)) as store:
+            self.assertEqual(len(store), 4)
+            for seq_id, sequence in expected.items():
+                self.assertEqual(store.fetch(seq_id), sequence)
+            self.assertEqual(list(store.fetch_many(['seq3', 'missing', 'seq1'])), ['seq1', 'seq3'])
+        # 第二次打开复用索引（含标题中的 taxid）
+        with ReferenceStore(str(self.fasta)) as store:
+            self.assertEqual(store.sequences_for_taxon('562'), ['seq1'])
+
+    def test_taxon_lookup(self):
+        """测试按分类字符串精确匹配与前缀匹配"""
+        with ReferenceStore(str(self.fasta), str(self.taxonomy)) as store:
+            self.assertEqual(store.sequences_for_taxon(
+                'd__Bacteria;p__Proteobacteria;g__Escherichia'), ['seq3'])
+            self.assertEqual(store.sequences_for_taxon('d__Bacteria; p__Firmicutes'), ['seq2'])
+            self.assertEqual(store.sequences_for_taxon('d__Archaea'), [])
+
+    def test_extract_representative_sequences(self):
+        """测试从参考序列库提取代表性序列"""
+        taxa_file = self.temp_dir / "taxa.tsv"
+        pd.DataFrame({
+            'taxonomy': ['d__Bacteria; p__Firmicutes; g__Bacillus; s__subtilis', 'd__Archaea'],
+            'abundance': [10, 5],
+        }).to_csv(taxa_file, sep='\t', index=False)
+        analyzer = PhylogeneticAnalyzer(str(self.temp_dir / "out"))
+        output = analyzer.output_dir / "rep.fasta"
+        self.assertTrue(analyzer.extract_representative_sequences(
+            None, str(taxa_file), output, str(self.fasta), str(self.taxonomy)))
+        records = list(SeqIO.parse(output, "fasta"))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(str(records[0].seq), 'TTTTGGGG')
+        self.assertIsNone(analyzer.extract_representative_sequences(None, str(taxa_file), output))
+
+
+if __name__ == '__main__':
+    unittest.main()
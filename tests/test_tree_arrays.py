@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 数组化系统发育树测试
+
+测试 Newick 解析、序列化与剪枝的正确性
+"""
+
+import unittest
+import os
+import io
+import numpy as np
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tree_arrays import ArrayTree, faith_pd
+
+NEWICK = "((A:1,B:2)n1:0.5,(C:1,(D:1,E:2):1):1,'F g':3)root;"
+
+
+class TestArrayTree(unittest.TestCase):
+    """数组化系统发育树测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.tree = ArrayTree.from_newick(NEWICK)
+
+    def test_parse_structure(self):
+        """测试解析得到的父节点与分支长度数组"""
+        tree = self.tree
+        self.assertEqual(tree.n_tips, 6)
+        self.assertEqual(tree.n_nodes, 10)
+        self.assertEqual(tree.names[0], 'root')
+        self.assertTrue(np.all(tree.parent[1:] < np.arange(1, tree.n_nodes)))
+        a, b = tree.tip_index['A'], tree.tip_index['B']
+        self.assertEqual(tree.parent[a], tree.parent[b])
+        self.assertEqual(tree.names[tree.parent[a]], 'n1')
+        self.assertEqual(tree.branch_length[tree.tip_index['F g']], 3.0)
+        self.assertAlmostEqual(tree.root_distance()[tree.tip_index['E']], 4.0)
+
+    def test_newick_round_trip(self):
+        """测试序列化后重新解析结果一致"""
+        self.assertEqual(self.tree.to_newick(),
+                         "((A:1.0,B:2.0)n1:0.5,(C:1.0,(D:1.0,E:2.0):1.0):1.0,'F g':3.0)root;")
+        again = ArrayTree.from_newick(self.tree.to_newick())
+        np.testing.assert_array_equal(again.parent, self.tree.parent)
+        np.testing.assert_array_equal(again.branch_length, self.tree.branch_length)
+
+    def test_prune_merges_unary_nodes(self):
+        """测试剪枝后合并单子节点并累加分支长度"""
+        pruned = self.tree.prune(['A', 'D', 'E'])
+        self.assertEqual(pruned.to_newick(), "(A:1.5,(D:1.0,E:2.0):2.0)root;")
+        self.assertEqual(self.tree.prune(['D', 'E']).to_newick(), "(D:1.0,E:2.0);")
+
+    def test_matches_biopython_distances(self):
+        """测试根距离与 Biopython 一致"""
+        from Bio import Phylo
+        bio_tree = Phylo.read(io.StringIO(NEWICK), 'newick')
+        distance = self.tree.root_distance()
+        for clade in bio_tree.get_terminals():
+            self.assertAlmostEqual(distance[self.tree.tip_index[clade.name]],
+                                   bio_tree.distance(clade))
+
+
+class TestFaithPD(unittest.TestCase):
+    """Faith's PD 测试类"""
+
+    def test_faith_pd_matches_path_union(self):
+        """测试 PD 等于样本taxa到根路径并集的分支长度之和"""
+        tree = ArrayTree.from_newick(NEWICK)
+        taxa = ['A', 'B', 'C', 'D', 'E', 'F g', 'missing']
+        presence = np.array([
+            [1, 0, 0, 0],
+            [1, 0, 0, 0],
+            [0, 1, 0, 0],
+            [0, 1, 0, 1],
+            [0, 0, 0, 1],
+            [0, 0, 0, 0],
+            [1, 1, 1, 1],
+        ], dtype=bool)
+        pd_values = faith_pd(tree, presence, tree.tip_mask(taxa))
+        # A+B: 1+2+0.5; C+D: 1+1+1+1; 空样本: 0; D+E: 1+2+1+1
+        np.testing.assert_allclose(pd_values, [3.5, 4.0, 0.0, 5.0])
+
+    def test_faith_pd_many_samples(self):
+        """测试位打包在样本数非8的倍数时的正确性"""
+        tree = ArrayTree.from_newick(NEWICK)
+        presence = np.random.default_rng(0).random((6, 13)) < 0.5
+        tip_nodes = tree.tip_mask(['A', 'B', 'C', 'D', 'E', 'F g'])
+        pd_values = faith_pd(tree, presence, tip_nodes)
+        for s in range(13):
+            nodes = set()
+            for node in tip_nodes[presence[:, s]]:
+                while node > 0:
+                    nodes.add(int(node))
+                    node = tree.parent[node]
+            self.assertAlmostEqual(pd_values[s], tree.branch_length[list(nodes)].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
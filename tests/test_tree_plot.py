@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 系统发育树绘图测试
+
+验证数组化布局坐标、分支折叠与两种布局的输出
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tree_arrays import ArrayTree
+from tree_plot import tree_layout, collapsed_clades, plot_tree
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+NEWICK = "((A:1,B:2)n1:0.5,(C:1,(D:1,E:2):1):1,'F g':3)root;"
+
+
+class TestTreePlot(unittest.TestCase):
+    """系统发育树绘图测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.tree = ArrayTree.from_newick(NEWICK)
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_layout_coordinates(self):
+        """测试叶节点按先序排列，内部节点位于子节点中点"""
+        layout = tree_layout(self.tree)
+        index = self.tree.tip_index
+        n1 = self.tree.parent[index['A']]
+        self.assertEqual([layout['y'][index[name]] for name in 'ABCDE'], [0, 1, 2, 3, 4])
+        self.assertEqual(layout['y'][n1], 0.5)
+        self.assertEqual(layout['x'][index['E']], 4.0)
+        self.assertEqual(layout['n_tips'][0], 6)
+        self.assertEqual(layout['x_max'][0], 4.0)
+        self.assertEqual((layout['tip_lo'][0], layout['tip_hi'][0]), (0, 5))
+
+    def test_collapse_selects_maximal_small_clades(self):
+        """测试按叶节点数折叠时只选择最大的小分支"""
+        layout = tree_layout(self.tree)
+        collapsed = collapsed_clades(self.tree, layout, collapse_size=3)
+        clade = self.tree.parent[self.tree.tip_index['C']]
+        self.assertEqual(sorted(collapsed), sorted([self.tree.parent[self.tree.tip_index['A']], clade]))
+        self.assertEqual(len(collapsed_clades(self.tree, layout)), 0)
+
+    def test_render_layouts(self):
+        """测试矩形、环形与折叠布局的输出"""
+        tree_file = self.temp_dir / "tree.newick"
+        tree_file.write_text(NEWICK)
+        analyzer = PhylogeneticAnalyzer(str(self.temp_dir / "out"))
+        for name, layout, collapse in (('rect', 'rectangular', None), ('circ', 'circular', 2)):
+            output = analyzer.output_dir / f"{name}.png"
+            analyzer.visualize_phylogenetic_tree(tree_file, output, layout, collapse)
+            self.assertTrue(output.exists())
+
+        rng = np.random.default_rng(0)
+        parent = np.concatenate([[-1], rng.integers(0, np.arange(1, 3000))])
+        large = ArrayTree(parent, rng.uniform(0.1, 1, 3000), [f"n{i}" for i in range(3000)])
+        output = self.temp_dir / "large.png"
+        plot_tree(large, str(output), layout='circular', collapse_size=50, dpi=72)
+        self.assertTrue(output.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
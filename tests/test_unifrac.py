@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+MICOS-2024 UniFrac 距离计算测试
+
+以逐对逐分支的直接定义为参照，验证条带化/分块实现的正确性
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# 导入被测试的模块
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tree_arrays import ArrayTree
+from unifrac import unifrac
+from phylogenetic_analysis import PhylogeneticAnalyzer
+
+NEWICK = "((A:1,B:2)n1:0.5,(C:1,(D:1,E:2):1):1,'F g':3)root;"
+TAXA = ['A', 'B', 'C', 'D', 'E', 'F g']
+
+
+def _brute_force(tree: ArrayTree, table: np.ndarray, metric: str) -> np.ndarray:
+    """按定义逐分支计算 UniFrac 距离"""
+    tip_nodes = tree.tip_mask(TAXA)
+    proportions = table / table.sum(axis=0)
+    # 每个节点下的叶节点集合
+    below = np.zeros((tree.n_nodes, len(TAXA)))
+    below[tip_nodes, np.arange(len(TAXA))] = 1
+    for node in tree.postorder[:-1]:
+        below[tree.parent[node]] += below[node]
+    lengths = tree.branch_length.copy()
+    lengths[0] = 0.0
+    root_distance = tree.root_distance()[tip_nodes]
+
+    n = table.shape[1]
+    result = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if metric == 'unweighted':
+                a, b = below @ (table[:, i] > 0) > 0, below @ (table[:, j] > 0) > 0
+                result[i, j] = lengths @ (a ^ b) / (lengths @ (a | b))
+            else:
+                diff = lengths @ np.abs(below @ proportions[:, i] - below @ proportions[:, j])
+                norm = root_distance @ (proportions[:, i] + proportions[:, j])
+                result[i, j] = diff / norm if metric == 'weighted_normalized' else diff
+    return result
+
+
+class TestUniFrac(unittest.TestCase):
+    """UniFrac 引擎测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.tree = ArrayTree.from_newick(NEWICK)
+        rng = np.random.default_rng(0)
+        self.table = rng.poisson(3, size=(len(TAXA), 9)).astype(float)
+        self.table[:, 0] = [5, 0, 0, 0, 0, 0]
+        self.table[0, 1] = 0
+
+    def test_metrics_match_definition(self):
+        """测试三种指标与逐对定义一致"""
+        tip_nodes = self.tree.tip_mask(TAXA)
+        for metric in ('unweighted', 'weighted_normalized', 'weighted_unnormalized'):
+            expected = _brute_force(self.tree, self.table, metric)
+            result = unifrac(self.tree, self.table, tip_nodes, metric=metric)
+            np.testing.assert_allclose(result, expected, atol=1e-6, err_msg=metric)
+
+    def test_parallel_memmap_matches_serial(self):
+        """测试多进程写入内存映射文件的结果与串行一致"""
+        tip_nodes = self.tree.tip_mask(TAXA)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for metric in ('unweighted_unifrac', 'weighted_unifrac'):
+                serial = unifrac(self.tree, self.table, tip_nodes, metric=metric)
+                output = os.path.join(temp_dir, f"{metric}.npy")
+                parallel = unifrac(self.tree, self.table, tip_nodes, metric=metric,
+                                   n_jobs=3, output_path=output, block_size=3)
+                self.assertIsInstance(parallel, np.memmap)
+                np.testing.assert_allclose(np.load(output), serial, atol=1e-12)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_analyzer_writes_matrix(self):
+        """测试分析器输出距离矩阵与样本ID"""
+        temp_dir = Path(tempfile.mkdtemp())
+        try:
+            tree_file = temp_dir / "tree.nwk"
+            tree_file.write_text(NEWICK)
+            abundance_file = temp_dir / "abundance.csv"
+            samples = [f"S{j}" for j in range(self.table.shape[1])]
+            pd.DataFrame(self.table, index=TAXA, columns=samples).to_csv(abundance_file)
+
+            analyzer = PhylogeneticAnalyzer(str(temp_dir / "out"), threads=1)
+            output_file = analyzer.output_dir / "unifrac_distances.csv"
+            result = analyzer.calculate_unifrac_distances(str(tree_file), str(abundance_file),
+                                                          output_file)
+            self.assertEqual(list(result.index), samples)
+            self.assertTrue(output_file.exists())
+            self.assertEqual(output_file.with_suffix('.ids.txt').read_text().split(), samples)
+            np.testing.assert_allclose(np.load(output_file.with_suffix('.npy')),
+                                       _brute_force(self.tree, self.table, 'unweighted'), atol=1e-6)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()